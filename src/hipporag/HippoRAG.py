@@ -19,8 +19,13 @@ import time
 
 from .llm import _get_llm_class, BaseLLM
 from .embedding_model import _get_embedding_model_class, BaseEmbeddingModel
+from .embedding_model.cache import EmbeddingDiskCache, QueryEmbeddingCache
 from .embedding_store import EmbeddingStore
+from .document_index import DocumentIndexMixin
+from .preprocessing import _get_text_preprocessor_class
 from .information_extraction import OpenIE
+from .information_extraction.result_store import OpenIEResultStore
+from .information_extraction.metrics import OpenIEMetricsSink
 from .information_extraction.openie_vllm_offline import VLLMOfflineOpenIE
 from .information_extraction.openie_transformers_offline import TransformersOfflineOpenIE
 from .evaluation.retrieval_eval import RetrievalRecall
@@ -30,15 +35,18 @@ from .prompts.prompt_template_manager import PromptTemplateManager
 from .rerank import DSPyFilter
 from .context_aware_memory import ContextAwareMemoryManager
 from .conflict_resolution import ConflictResolver
+from .entity_canonicalization import EntityCanonicalizer
 from .utils.misc_utils import *
 from .utils.misc_utils import NerRawOutput, TripleRawOutput
 from .utils.embed_utils import retrieve_knn
+from .utils.quantization_utils import QuantizedEmbeddings, embedding_scores
+from .utils.dedup_utils import MinHashDeduplicator, find_near_duplicates
 from .utils.typing import Triple
 from .utils.config_utils import BaseConfig
 
 logger = logging.getLogger(__name__)
 
-class HippoRAG:
+class HippoRAG(DocumentIndexMixin):
 
     def __init__(self,
                  global_config=None,
@@ -126,35 +134,92 @@ class HippoRAG:
 
         self.llm_model: BaseLLM = _get_llm_class(self.global_config)
 
+        self.openie_results_path = os.path.join(self.global_config.save_dir,f'openie_results_ner_{self.global_config.llm_name.replace("/", "_")}.json')
+        # MinHash signatures of extracted chunks for near-duplicate detection, kept next to the OpenIE results
+        self.openie_dedup_path = os.path.splitext(self.openie_results_path)[0] + "_minhash.npz"
+        self.openie_deduplicator = None
+
+        if self.global_config.openie_stream_results:
+            self.openie_result_store = OpenIEResultStore(os.path.splitext(self.openie_results_path)[0] + "_stream.jsonl",
+                                                         keep_raw_responses=self.global_config.openie_keep_raw_responses)
+        else:
+            self.openie_result_store = None
+
+        if self.global_config.openie_metrics_path is not None:
+            self.openie_metrics_sink = OpenIEMetricsSink(self.global_config.openie_metrics_path,
+                                                         format=self.global_config.openie_metrics_format)
+        else:
+            self.openie_metrics_sink = None
+
         if self.global_config.openie_mode == 'online':
-            self.openie = OpenIE(llm_model=self.llm_model)
+            self.openie = OpenIE(llm_model=self.llm_model,
+                                 max_workers=self.global_config.openie_max_workers,
+                                 joint_extraction=self.global_config.openie_joint_extraction,
+                                 pack_token_budget=self.global_config.openie_pack_token_budget,
+                                 result_store=self.openie_result_store,
+                                 keep_raw_responses=self.global_config.openie_keep_raw_responses,
+                                 metrics_sink=self.openie_metrics_sink)
         elif self.global_config.openie_mode == 'offline':
-            self.openie = VLLMOfflineOpenIE(self.global_config)
+            self.openie = VLLMOfflineOpenIE(self.global_config, result_store=self.openie_result_store,
+                                            metrics_sink=self.openie_metrics_sink)
         elif self.global_config.openie_mode ==  'Transformers-offline':
-            self.openie = TransformersOfflineOpenIE(self.global_config)
+            self.openie = TransformersOfflineOpenIE(self.global_config, result_store=self.openie_result_store,
+                                                    metrics_sink=self.openie_metrics_sink)
 
         self.graph = self.initialize_graph()
 
-        if self.global_config.openie_mode == 'offline':
+        if self.global_config.openie_mode in ('offline', 'Transformers-offline'):
+            # The offline LLM holds the GPU first, the embedding model is loaded by `load_embedding_model` once it is released
             self.embedding_model = None
         else:
             self.embedding_model: BaseEmbeddingModel = _get_embedding_model_class(
                 embedding_model_name=self.global_config.embedding_model_name)(global_config=self.global_config,
                                                                               embedding_model_name=self.global_config.embedding_model_name)
+        self.text_preprocessor = _get_text_preprocessor_class(self.global_config, save_dir=self.working_dir)
+
         self.chunk_embedding_store = EmbeddingStore(self.embedding_model,
                                                     os.path.join(self.working_dir, "chunk_embeddings"),
-                                                    self.global_config.embedding_batch_size, 'chunk')
+                                                    self.global_config.embedding_batch_size, 'chunk',
+                                                    projection=self.global_config.embedding_projection,
+                                                    projection_dim=self.global_config.embedding_projection_dim,
+                                                    projection_max_fit_rows=self.global_config.embedding_projection_max_fit_rows,
+                                                    memory_map=self.global_config.embedding_quantization is not None)
         self.entity_embedding_store = EmbeddingStore(self.embedding_model,
                                                      os.path.join(self.working_dir, "entity_embeddings"),
-                                                     self.global_config.embedding_batch_size, 'entity')
+                                                     self.global_config.embedding_batch_size, 'entity',
+                                                     projection=self.global_config.embedding_projection,
+                                                     projection_dim=self.global_config.embedding_projection_dim,
+                                                     projection_max_fit_rows=self.global_config.embedding_projection_max_fit_rows,
+                                                     memory_map=self.global_config.embedding_quantization is not None)
         self.fact_embedding_store = EmbeddingStore(self.embedding_model,
                                                    os.path.join(self.working_dir, "fact_embeddings"),
-                                                   self.global_config.embedding_batch_size, 'fact')
+                                                   self.global_config.embedding_batch_size, 'fact',
+                                                   projection=self.global_config.embedding_projection,
+                                                   projection_dim=self.global_config.embedding_projection_dim,
+                                                   projection_max_fit_rows=self.global_config.embedding_projection_max_fit_rows,
+                                                   memory_map=self.global_config.embedding_quantization is not None)
+
+        # Query embeddings are kept in bounded caches, optionally persisted, that outlive prepare_retrieval_objects
+        query_embedding_disk_cache = EmbeddingDiskCache(
+            os.path.join(self.global_config.save_dir, "embedding_cache", "query_embedding_cache.sqlite")) \
+            if self.global_config.query_embedding_cache_persist else None
+        self.query_to_embedding: Dict = {
+            kind: QueryEmbeddingCache(max_entries=self.global_config.query_embedding_cache_max_entries,
+                                      ttl_seconds=self.global_config.query_embedding_cache_ttl_seconds,
+                                      disk_cache=query_embedding_disk_cache)
+            # 'memory' keeps unprojected query_to_fact embeddings, compared with the full stored vectors by context-aware memory
+            for kind in ('triple', 'passage', 'memory')}
+
+        if self.global_config.entity_canonicalization:
+            self.entity_canonicalizer = EntityCanonicalizer(self.entity_embedding_store,
+                                                            save_dir=self.working_dir,
+                                                            alias_path=self.global_config.entity_alias_path,
+                                                            sim_threshold=self.global_config.entity_canonicalization_sim_threshold)
+        else:
+            self.entity_canonicalizer = None
 
         self.prompt_template_manager = PromptTemplateManager(role_mapping={"system": "system", "user": "user", "assistant": "assistant"})
 
-        self.openie_results_path = os.path.join(self.global_config.save_dir,f'openie_results_ner_{self.global_config.llm_name.replace("/", "_")}.json')
-
         self.rerank_filter = DSPyFilter(self)
 
         self.ready_to_retrieve = False
@@ -227,13 +292,59 @@ class HippoRAG:
         new_openie_rows = {k : chunks[k] for k in chunk_keys_to_process}
 
         if len(chunk_keys_to_process) > 0:
-            new_ner_results_dict, new_triple_results_dict = self.openie.batch_openie(new_openie_rows)
+            # A previous `index` call left the embedding model loaded, the offline LLM needs the GPU back first
+            self.release_embedding_model()
+            new_ner_results_dict, new_triple_results_dict = self.run_openie(all_openie_info, new_openie_rows)
             self.merge_openie_results(all_openie_info, new_openie_rows, new_ner_results_dict, new_triple_results_dict)
 
         if self.global_config.save_openie:
             self.save_openie_results(all_openie_info)
 
-        assert False, logger.info('Done with OpenIE, run online indexing for future retrieval.')
+        logger.info('Done with offline OpenIE, releasing the offline LLM.')
+        self.openie.release()
+
+    def load_embedding_model(self):
+        """
+        Loads the embedding model if it is not loaded yet and hands it to the embedding stores. Offline modes
+        defer this until the offline LLM is released, so both never hold the GPU at the same time.
+        """
+        if self.embedding_model is not None:
+            return
+
+        # An offline LLM still loaded, e.g. by an extraction that did not go through `pre_openie`, frees the GPU first
+        self.openie.release()
+        logger.info(f"Loading embedding model {self.global_config.embedding_model_name}")
+        self.embedding_model: BaseEmbeddingModel = _get_embedding_model_class(
+            embedding_model_name=self.global_config.embedding_model_name)(global_config=self.global_config,
+                                                                          embedding_model_name=self.global_config.embedding_model_name)
+        for embedding_store in (self.chunk_embedding_store, self.entity_embedding_store, self.fact_embedding_store):
+            embedding_store.embedding_model = self.embedding_model
+
+    def release_embedding_model(self):
+        """
+        Frees the embedding model and the GPU memory it holds, so offline OpenIE of a later `index` call can load
+        its LLM again. The offline LLM and the embedding model are thus always swapped in the same order: the
+        LLM is released before the embedding model is loaded, and the embedding model before the LLM is reloaded.
+        `load_embedding_model` loads it back.
+        """
+        if self.embedding_model is None:
+            return
+
+        logger.info(f"Releasing embedding model {self.global_config.embedding_model_name}")
+        self.embedding_model.close()
+        self.embedding_model = None
+        for embedding_store in (self.chunk_embedding_store, self.entity_embedding_store, self.fact_embedding_store):
+            embedding_store.embedding_model = None
+        self.ready_to_retrieve = False
+
+        import gc
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
 
     def index(self, docs: List[str]):
         """
@@ -247,10 +358,14 @@ class HippoRAG:
 
         logger.info(f"Indexing Documents")
 
+        docs = self.chunk_docs(docs)
+
         logger.info(f"Performing OpenIE")
 
-        if self.global_config.openie_mode == 'offline':
+        if self.global_config.openie_mode in ('offline', 'Transformers-offline'):
+            # Phase one extracts with the offline LLM and saves the results, phase two below reuses them
             self.pre_openie(docs)
+            self.load_embedding_model()
 
         self.chunk_embedding_store.insert_strings(docs)
         chunk_to_rows = self.chunk_embedding_store.get_all_id_to_rows()
@@ -259,7 +374,7 @@ class HippoRAG:
         new_openie_rows = {k : chunk_to_rows[k] for k in chunk_keys_to_process}
 
         if len(chunk_keys_to_process) > 0:
-            new_ner_results_dict, new_triple_results_dict = self.openie.batch_openie(new_openie_rows)
+            new_ner_results_dict, new_triple_results_dict = self.run_openie(all_openie_info, new_openie_rows)
             self.merge_openie_results(all_openie_info, new_openie_rows, new_ner_results_dict, new_triple_results_dict)
 
         if self.global_config.save_openie:
@@ -272,12 +387,17 @@ class HippoRAG:
         # prepare data_store
         chunk_ids = list(chunk_to_rows.keys())
 
-        chunk_triples = [[text_processing(t) for t in triple_results_dict[chunk_id].triples] for chunk_id in chunk_ids]
-        entity_nodes, chunk_triple_entities = extract_entity_nodes(chunk_triples)
-        facts = flatten_facts(chunk_triples)
+        chunk_triples = normalize_chunk_triples([triple_results_dict[chunk_id].triples for chunk_id in chunk_ids],
+                                                num_workers=self.global_config.triple_processing_num_workers)
+        precomputed_entity_embeddings = {}
+        if self.entity_canonicalizer is not None:
+            precomputed_entity_embeddings = self.entity_canonicalizer.resolve(
+                [t[idx] for triples in chunk_triples for t in triples if len(t) == 3 for idx in (0, 2)])
+            chunk_triples = self.entity_canonicalizer.rewrite(chunk_triples)
+        entity_nodes, chunk_triple_entities, facts = build_triple_tables(chunk_triples)
 
         logger.info(f"Encoding Entities")
-        self.entity_embedding_store.insert_strings(entity_nodes)
+        self.entity_embedding_store.insert_strings(entity_nodes, precomputed_embeddings=precomputed_entity_embeddings)
 
         logger.info(f"Encoding Facts")
         self.fact_embedding_store.insert_strings([str(fact) for fact in facts])
@@ -297,6 +417,18 @@ class HippoRAG:
             self.augment_graph()
             self.save_igraph()
 
+        # Queries are encoded in this process, data-parallel embedding workers are only needed again by the next `index`
+        if self.embedding_model is not None:
+            self.embedding_model.close()
+
+    def canonicalize_triples(self, chunk_triples: List[List[List[str]]]) -> List[List[List[str]]]:
+        """
+        Rewrites normalized triples onto canonical entities with the entity canonicalization lookup table, if enabled.
+        """
+        if self.entity_canonicalizer is None:
+            return chunk_triples
+        return self.entity_canonicalizer.rewrite(chunk_triples)
+
     def delete(self, docs_to_delete: List[str]):
         """
         Deletes the given documents from all data structures within the HippoRAG class.
@@ -311,12 +443,8 @@ class HippoRAG:
         if not self.ready_to_retrieve:
             self.prepare_retrieval_objects()
 
-        current_docs = set(self.chunk_embedding_store.get_all_texts())
-        docs_to_delete = [doc for doc in docs_to_delete if doc in current_docs]
-
-        #Get ids for chunks to delete
-        chunk_ids_to_delete = set(
-            [self.chunk_embedding_store.text_to_hash_id[chunk] for chunk in docs_to_delete])
+        #Get ids for chunks to delete, the chunk to document mapping is only updated once they are deleted
+        chunk_ids_to_delete = self.get_chunk_ids_to_delete(docs_to_delete)
 
         #Find triples in chunks to delete
         all_openie_info, chunk_keys_to_process = self.load_existing_openie([])
@@ -336,7 +464,7 @@ class HippoRAG:
         true_triples_to_delete = []
 
         for triple in triples_to_delete:
-            proc_triple = tuple(text_processing(list(triple)))
+            proc_triple = tuple(self.canonicalize_triples([[text_processing(list(triple))]])[0][0])
 
             doc_ids = self.proc_triples_to_docs[str(proc_triple)]
 
@@ -345,7 +473,7 @@ class HippoRAG:
             if len(non_deleted_docs) == 0:
                 true_triples_to_delete.append(triple)
 
-        processed_true_triples_to_delete = [[text_processing(list(triple)) for triple in true_triples_to_delete]]
+        processed_true_triples_to_delete = self.canonicalize_triples([[text_processing(list(triple)) for triple in true_triples_to_delete]])
         entities_to_delete, _ = extract_entity_nodes(processed_true_triples_to_delete)
         processed_true_triples_to_delete = flatten_facts(processed_true_triples_to_delete)
 
@@ -378,6 +506,8 @@ class HippoRAG:
         self.graph.delete_vertices(list(filtered_ent_ids_to_delete) + list(chunk_ids_to_delete))
         self.save_igraph()
 
+        self.text_preprocessor.delete_docs(docs_to_delete)
+
         self.ready_to_retrieve = False
 
     def retrieve(self,
@@ -430,7 +560,7 @@ class HippoRAG:
             rerank_start = time.time()
             
             # 为当前查询获取embedding，用于记录访问历史和计算动态激活
-            query_embedding_for_fact = self.query_to_embedding['triple'].get(query)
+            query_embedding_for_fact = self.query_to_embedding['memory'].get(query)
             if query_embedding_for_fact is not None:
                 # 添加查询到上下文历史
                 self.memory_manager.add_query_context(query, query_embedding_for_fact)
@@ -476,7 +606,8 @@ class HippoRAG:
                     similarity_score=similarity
                 )
 
-            retrieval_results.append(QuerySolution(question=query, docs=top_k_docs, doc_scores=sorted_doc_scores[:num_to_retrieve]))
+            retrieval_results.append(QuerySolution(question=query, docs=top_k_docs, doc_scores=sorted_doc_scores[:num_to_retrieve],
+                                                   source_doc_ids=self.get_source_doc_ids(sorted_doc_ids[:num_to_retrieve], top_k_docs)))
 
         retrieve_end_time = time.time()  # Record end time
 
@@ -636,7 +767,8 @@ class HippoRAG:
                           sorted_doc_ids[:num_to_retrieve]]
 
             retrieval_results.append(
-                QuerySolution(question=query, docs=top_k_docs, doc_scores=sorted_doc_scores[:num_to_retrieve]))
+                QuerySolution(question=query, docs=top_k_docs, doc_scores=sorted_doc_scores[:num_to_retrieve],
+                              source_doc_ids=self.get_source_doc_ids(sorted_doc_ids[:num_to_retrieve], top_k_docs)))
 
         retrieve_end_time = time.time()  # Record end time
 
@@ -905,7 +1037,7 @@ class HippoRAG:
 
         logger.info(f"Performing KNN retrieval for each phrase nodes ({len(entity_node_keys)}).")
 
-        entity_embs = self.entity_embedding_store.get_embeddings(entity_node_keys)
+        entity_embs = self.entity_embedding_store.get_retrieval_embeddings(entity_node_keys)
 
         # Here we build synonymy edges only between newly inserted phrase nodes and all phrase nodes in the storage to reduce cost for incremental graph updates
         query_node_key2knn_node_keys = retrieve_knn(query_ids=entity_node_keys,
@@ -985,10 +1117,92 @@ class HippoRAG:
                     chunk_keys_to_save.add(chunk_key)
         else:
             all_openie_info = []
-            chunk_keys_to_save = chunk_keys
+            chunk_keys_to_save = set(chunk_keys)
+
+        # Chunks streamed to disk by an interrupted run are reused instead of extracted again
+        if self.openie_result_store is not None:
+            if self.global_config.force_openie_from_scratch:
+                self.openie_result_store.clear()
+            else:
+                existing_openie_keys = set([info['idx'] for info in all_openie_info])
+                streamed_openie_info = [
+                    {key: info[key] for key in ('idx', 'passage', 'extracted_entities', 'extracted_triples')}
+                    for info in self.openie_result_store.load()
+                    if info['idx'] in chunk_keys_to_save and info['idx'] not in existing_openie_keys
+                ]
+                if len(streamed_openie_info) > 0:
+                    logger.info(f"Resuming from {len(streamed_openie_info)} chunks in {self.openie_result_store.path}")
+                    all_openie_info.extend(streamed_openie_info)
+                    chunk_keys_to_save.difference_update(info['idx'] for info in streamed_openie_info)
 
         return all_openie_info, chunk_keys_to_save
 
+    def run_openie(self,
+                   all_openie_info: List[dict],
+                   chunks_to_process: Dict[str, dict]) -> Tuple[Dict[str, NerRawOutput], Dict[str, TripleRawOutput]]:
+        """
+        Runs OpenIE over the given chunks. If `openie_dedup_threshold` is set, chunks that near-duplicate an already
+        extracted chunk or an earlier chunk of this batch skip extraction and reuse the entities and triples of that
+        representative, with `near_duplicate_of` recorded in their metadata. The MinHash signatures of extracted
+        chunks are saved to `openie_dedup_path`, so later calls only hash chunks they have not seen.
+
+        Parameters:
+            all_openie_info (List[dict]): Existing OpenIE results, used as representatives for near-duplicates.
+            chunks_to_process (Dict[str, dict]): Chunk keys to rows with `hash_id` and `content` keys.
+
+        Returns:
+            Tuple[Dict[str, NerRawOutput], Dict[str, TripleRawOutput]]: NER and triple extraction results keyed by chunk key.
+        """
+        if self.global_config.openie_dedup_threshold is None:
+            return self.openie.batch_openie(chunks_to_process)
+
+        existing_openie_info = {openie_info['idx']: openie_info for openie_info in all_openie_info}
+        if self.openie_deduplicator is None:
+            self.openie_deduplicator = MinHashDeduplicator(threshold=self.global_config.openie_dedup_threshold,
+                                                           num_perm=self.global_config.openie_dedup_num_perm) \
+                if self.global_config.force_openie_from_scratch else \
+                MinHashDeduplicator.load(self.openie_dedup_path, threshold=self.global_config.openie_dedup_threshold,
+                                         num_perm=self.global_config.openie_dedup_num_perm)
+        # Chunks whose OpenIE results are gone, e.g. deleted ones, cannot represent near-duplicates anymore
+        self.openie_deduplicator.remove([chunk_key for chunk_key in self.openie_deduplicator.keys()
+                                         if chunk_key not in existing_openie_info])
+        duplicate_of = find_near_duplicates(
+            {chunk_key: row['content'] for chunk_key, row in chunks_to_process.items()},
+            reference_texts={chunk_key: openie_info['passage'] for chunk_key, openie_info in existing_openie_info.items()},
+            deduplicator=self.openie_deduplicator
+        )
+        self.openie_deduplicator.save(self.openie_dedup_path)
+
+        chunks_to_extract = {chunk_key: row for chunk_key, row in chunks_to_process.items() if chunk_key not in duplicate_of}
+        if len(chunks_to_extract) > 0:
+            ner_results_dict, triple_results_dict = self.openie.batch_openie(chunks_to_extract)
+        else:
+            ner_results_dict, triple_results_dict = {}, {}
+
+        chunks_without_representative = {}
+        for chunk_key, representative_key in duplicate_of.items():
+            if representative_key in ner_results_dict and representative_key in triple_results_dict:
+                entities = ner_results_dict[representative_key].unique_entities
+                triples = triple_results_dict[representative_key].triples
+            elif representative_key in existing_openie_info:
+                entities = existing_openie_info[representative_key]['extracted_entities']
+                triples = existing_openie_info[representative_key]['extracted_triples']
+            else:
+                logger.warning(f"Near-duplicate representative {representative_key} of chunk {chunk_key} has no OpenIE "
+                               f"results, extracting the chunk itself")
+                chunks_without_representative[chunk_key] = chunks_to_process[chunk_key]
+                continue
+            metadata = {'near_duplicate_of': representative_key}
+            ner_results_dict[chunk_key] = NerRawOutput(chunk_id=chunk_key, response=None, unique_entities=list(entities), metadata=metadata)
+            triple_results_dict[chunk_key] = TripleRawOutput(chunk_id=chunk_key, response=None, triples=[list(t) for t in triples], metadata=metadata)
+
+        if len(chunks_without_representative) > 0:
+            fallback_ner_results_dict, fallback_triple_results_dict = self.openie.batch_openie(chunks_without_representative)
+            ner_results_dict.update(fallback_ner_results_dict)
+            triple_results_dict.update(fallback_triple_results_dict)
+
+        return ner_results_dict, triple_results_dict
+
     def merge_openie_results(self,
                              all_openie_info: List[dict],
                              chunks_to_save: Dict[str, dict],
@@ -1069,6 +1283,10 @@ class HippoRAG:
                 json.dump(openie_dict, f)
             logger.info(f"OpenIE results saved to {self.openie_results_path}")
 
+            # Everything streamed so far is now part of the results file
+            if self.openie_result_store is not None:
+                self.openie_result_store.clear()
+
     def augment_graph(self):
         """
         Provides utility functions to augment a graph by adding new nodes and edges.
@@ -1218,8 +1436,10 @@ class HippoRAG:
 
         logger.info("Preparing for fast retrieval.")
 
+        # Offline mode that skipped indexing in this process still needs the embedding model to encode queries
+        self.load_embedding_model()
+
         logger.info("Loading keys.")
-        self.query_to_embedding: Dict = {'triple': {}, 'passage': {}}
 
         self.entity_node_keys: List = list(self.entity_embedding_store.get_all_ids()) # a list of phrase node keys
         self.passage_node_keys: List = list(self.chunk_embedding_store.get_all_ids()) # a list of passage node keys
@@ -1265,21 +1485,29 @@ class HippoRAG:
             self.passage_node_idxs = []
 
         logger.info("Loading embeddings.")
-        self.entity_embeddings = np.array(self.entity_embedding_store.get_embeddings(self.entity_node_keys))
-        self.passage_embeddings = np.array(self.chunk_embedding_store.get_embeddings(self.passage_node_keys))
+        self.entity_embeddings = self.load_retrieval_embeddings(self.entity_embedding_store, self.entity_node_keys)
+        self.passage_embeddings = self.load_retrieval_embeddings(self.chunk_embedding_store, self.passage_node_keys)
+
+        self.fact_embeddings = self.load_retrieval_embeddings(self.fact_embedding_store, self.fact_node_keys)
 
-        self.fact_embeddings = np.array(self.fact_embedding_store.get_embeddings(self.fact_node_keys))
+        # Cached query embeddings stay valid as long as the model, instruction and projection they were made with are unchanged
+        self.query_to_embedding['triple'].set_namespace(
+            f"{self.embedding_model.embedding_cache_namespace()}|{get_query_instruction('query_to_fact')}|{self.fact_embedding_store.projection_fingerprint()}")
+        self.query_to_embedding['passage'].set_namespace(
+            f"{self.embedding_model.embedding_cache_namespace()}|{get_query_instruction('query_to_passage')}|{self.chunk_embedding_store.projection_fingerprint()}")
+        self.query_to_embedding['memory'].set_namespace(
+            f"{self.embedding_model.embedding_cache_namespace()}|{get_query_instruction('query_to_fact')}|none")
 
         all_openie_info, chunk_keys_to_process = self.load_existing_openie([])
 
         self.proc_triples_to_docs = {}
 
-        for doc in all_openie_info:
-            triples = flatten_facts([doc['extracted_triples']])
-            for triple in triples:
-                if len(triple) == 3:
-                    proc_triple = tuple(text_processing(list(triple)))
-                    self.proc_triples_to_docs[str(proc_triple)] = self.proc_triples_to_docs.get(str(proc_triple), set()).union(set([doc['idx']]))
+        docs_triples = [[list(triple) for triple in flatten_facts([doc['extracted_triples']]) if len(triple) == 3] for doc in all_openie_info]
+        docs_proc_triples = self.canonicalize_triples(
+            normalize_chunk_triples(docs_triples, num_workers=self.global_config.triple_processing_num_workers))
+        for doc, proc_triples in zip(all_openie_info, docs_proc_triples):
+            for proc_triple in proc_triples:
+                self.proc_triples_to_docs.setdefault(str(tuple(proc_triple)), set()).add(doc['idx'])
 
         if self.ent_node_to_chunk_ids is None:
             ner_results_dict, triple_results_dict = reformat_openie_results(all_openie_info)
@@ -1306,7 +1534,9 @@ class HippoRAG:
                         )
 
             # prepare data_store
-            chunk_triples = [[text_processing(t) for t in triple_results_dict[chunk_id].triples] for chunk_id in self.passage_node_keys]
+            chunk_triples = self.canonicalize_triples(
+                normalize_chunk_triples([triple_results_dict[chunk_id].triples for chunk_id in self.passage_node_keys],
+                                        num_workers=self.global_config.triple_processing_num_workers))
 
             self.node_to_node_stats = {}
             self.ent_node_to_chunk_ids = {}
@@ -1314,10 +1544,19 @@ class HippoRAG:
 
         self.ready_to_retrieve = True
 
+    def load_retrieval_embeddings(self, embedding_store: EmbeddingStore, hash_ids: List[str]):
+        """
+        Loads the embeddings of `hash_ids` for retrieval, projected if `embedding_projection` is set, as float32 or, with
+        `embedding_quantization`, as a `QuantizedEmbeddings` matrix whose best candidates are re-scored in float32.
+        """
+        if self.global_config.embedding_quantization is None:
+            return np.array(embedding_store.get_retrieval_embeddings(hash_ids))
+        return QuantizedEmbeddings.from_store(embedding_store, hash_ids, self.global_config.embedding_quantization)
+
     def get_query_embeddings(self, queries: List[str] | List[QuerySolution]):
         """
         Retrieves embeddings for given queries and updates the internal query-to-embedding mapping. The method determines whether each query
-        is already present in the `self.query_to_embedding` dictionary under the keys 'triple' and 'passage'. If a query is not present in
+        is already present in the `self.query_to_embedding` caches under the keys 'triple', 'passage' and 'memory'. If a query is not present in
         either, it is encoded into embeddings using the embedding model and stored.
 
         Args:
@@ -1327,28 +1566,24 @@ class HippoRAG:
 
         all_query_strings = []
         for query in queries:
-            if isinstance(query, QuerySolution) and (
-                    query.question not in self.query_to_embedding['triple'] or query.question not in
-                    self.query_to_embedding['passage']):
-                all_query_strings.append(query.question)
-            elif query not in self.query_to_embedding['triple'] or query not in self.query_to_embedding['passage']:
-                all_query_strings.append(query)
+            query_string = query.question if isinstance(query, QuerySolution) else query
+            if any(query_string not in self.query_to_embedding[kind] for kind in ('triple', 'passage', 'memory')):
+                all_query_strings.append(query_string)
 
         if len(all_query_strings) > 0:
-            # get all query embeddings
-            logger.info(f"Encoding {len(all_query_strings)} queries for query_to_fact.")
-            query_embeddings_for_triple = self.embedding_model.batch_encode(all_query_strings,
-                                                                            instruction=get_query_instruction('query_to_fact'),
-                                                                            norm=True)
-            for query, embedding in zip(all_query_strings, query_embeddings_for_triple):
-                self.query_to_embedding['triple'][query] = embedding
-
-            logger.info(f"Encoding {len(all_query_strings)} queries for query_to_passage.")
-            query_embeddings_for_passage = self.embedding_model.batch_encode(all_query_strings,
-                                                                             instruction=get_query_instruction('query_to_passage'),
-                                                                             norm=True)
-            for query, embedding in zip(all_query_strings, query_embeddings_for_passage):
-                self.query_to_embedding['passage'][query] = embedding
+            # get all query embeddings, in a single pass when the model ignores the difference between both instructions
+            logger.info(f"Encoding {len(all_query_strings)} queries for query_to_fact and query_to_passage.")
+            query_embeddings_for_triple, query_embeddings_for_passage = self.embedding_model.batch_encode_multi(
+                all_query_strings,
+                instructions=[get_query_instruction('query_to_fact'), get_query_instruction('query_to_passage')],
+                norm=True)
+            # Context-aware memory compares queries with the full embeddings of every store, so it keeps them unprojected
+            self.query_to_embedding['memory'].update(zip(all_query_strings, query_embeddings_for_triple))
+            query_embeddings_for_triple = self.fact_embedding_store.project(query_embeddings_for_triple)
+            self.query_to_embedding['triple'].update(zip(all_query_strings, query_embeddings_for_triple))
+
+            query_embeddings_for_passage = self.chunk_embedding_store.project(query_embeddings_for_passage)
+            self.query_to_embedding['passage'].update(zip(all_query_strings, query_embeddings_for_passage))
 
     def get_fact_scores(self, query: str) -> np.ndarray:
         """
@@ -1375,6 +1610,7 @@ class HippoRAG:
             query_embedding = self.embedding_model.batch_encode(query,
                                                                 instruction=get_query_instruction('query_to_fact'),
                                                                 norm=True)
+            query_embedding = self.fact_embedding_store.project(query_embedding)
 
         # Check if there are any facts
         if len(self.fact_embeddings) == 0:
@@ -1382,7 +1618,8 @@ class HippoRAG:
             return np.array([])
             
         try:
-            query_fact_scores = np.dot(self.fact_embeddings, query_embedding.T) # shape: (#facts, )
+            query_fact_scores = embedding_scores(self.fact_embeddings, query_embedding.T,
+                                                 rescore_top_k=self.global_config.embedding_quantization_rescore_top_k) # shape: (#facts, )
             query_fact_scores = np.squeeze(query_fact_scores) if query_fact_scores.ndim == 2 else query_fact_scores
             query_fact_scores = min_max_normalize(query_fact_scores)
             return query_fact_scores
@@ -1419,7 +1656,9 @@ class HippoRAG:
             query_embedding = self.embedding_model.batch_encode(query,
                                                                 instruction=get_query_instruction('query_to_passage'),
                                                                 norm=True)
-        query_doc_scores = np.dot(self.passage_embeddings, query_embedding.T)
+            query_embedding = self.chunk_embedding_store.project(query_embedding)
+        query_doc_scores = embedding_scores(self.passage_embeddings, query_embedding.T,
+                                            rescore_top_k=self.global_config.embedding_quantization_rescore_top_k)
         query_doc_scores = np.squeeze(query_doc_scores) if query_doc_scores.ndim == 2 else query_doc_scores
         query_doc_scores = min_max_normalize(query_doc_scores)
 
@@ -1649,11 +1888,11 @@ class HippoRAG:
         Returns:
             包含消退统计信息的字典
         """
-        if current_query is None or self.query_to_embedding['triple'].get(current_query) is None:
+        if current_query is None or self.query_to_embedding['memory'].get(current_query) is None:
             logger.warning("No valid current query for context-aware decay. Using default strategy.")
             current_query_embedding = None
         else:
-            current_query_embedding = self.query_to_embedding['triple'][current_query]
+            current_query_embedding = self.query_to_embedding['memory'][current_query]
         
         decay_stats = {
             'total_chunks': len(self.chunk_embedding_store.get_all_ids()),
@@ -1725,11 +1964,11 @@ class HippoRAG:
         Returns:
             包含激活分析的字典
         """
-        if current_query is None or self.query_to_embedding['triple'].get(current_query) is None:
+        if current_query is None or self.query_to_embedding['memory'].get(current_query) is None:
             logger.warning("No valid current query for activation analysis.")
             return {'error': 'No valid query'}
         
-        current_query_embedding = self.query_to_embedding['triple'][current_query]
+        current_query_embedding = self.query_to_embedding['memory'][current_query]
         
         # 计算chunk的激活分数
         chunk_activation = self.memory_manager.calculate_batch_activation(
@@ -1793,11 +2032,11 @@ class HippoRAG:
         Returns:
             包含清除统计的字典
         """
-        if current_query is None or self.query_to_embedding['triple'].get(current_query) is None:
+        if current_query is None or self.query_to_embedding['memory'].get(current_query) is None:
             logger.warning("No valid current query for low activation cleanup.")
             return {'error': 'No valid query'}
         
-        current_query_embedding = self.query_to_embedding['triple'][current_query]
+        current_query_embedding = self.query_to_embedding['memory'][current_query]
         
         cleanup_stats = {
             'chunks_to_delete': [],
@@ -19,7 +19,10 @@ import time
 
 from .llm import _get_llm_class, BaseLLM
 from .embedding_model import _get_embedding_model_class, BaseEmbeddingModel
+from .embedding_model.cache import EmbeddingDiskCache, QueryEmbeddingCache
 from .embedding_store import EmbeddingStore
+from .document_index import DocumentIndexMixin
+from .preprocessing import _get_text_preprocessor_class
 from .information_extraction import OpenIE
 from .information_extraction.openie_vllm_offline import VLLMOfflineOpenIE
 from .evaluation.retrieval_eval import RetrievalRecall
@@ -29,12 +32,13 @@ from .prompts.prompt_template_manager import PromptTemplateManager
 from .rerank import DSPyFilter
 from .utils.misc_utils import *
 from .utils.embed_utils import retrieve_knn
+from .utils.quantization_utils import QuantizedEmbeddings, embedding_scores
 from .utils.typing import Triple
 from .utils.config_utils import BaseConfig
 
 logger = logging.getLogger(__name__)
 
-class StandardRAG:
+class StandardRAG(DocumentIndexMixin):
 
     def __init__(self,
                  global_config=None,
@@ -91,12 +95,25 @@ class StandardRAG:
                 embedding_model_name=self.global_config.embedding_model_name)(global_config=self.global_config,
                                                                               embedding_model_name=self.global_config.embedding_model_name)
 
-        import ipdb;
-        ipdb.set_trace()
+        self.text_preprocessor = _get_text_preprocessor_class(self.global_config, save_dir=self.working_dir)
 
         self.chunk_embedding_store = EmbeddingStore(self.embedding_model,
                                                     os.path.join(self.working_dir, "chunk_embeddings"),
-                                                    self.global_config.embedding_batch_size, 'chunk')
+                                                    self.global_config.embedding_batch_size, 'chunk',
+                                                    projection=self.global_config.embedding_projection,
+                                                    projection_dim=self.global_config.embedding_projection_dim,
+                                                    projection_max_fit_rows=self.global_config.embedding_projection_max_fit_rows,
+                                                    memory_map=self.global_config.embedding_quantization is not None)
+
+        # Query embeddings are kept in bounded caches, optionally persisted, that outlive prepare_retrieval_objects
+        query_embedding_disk_cache = EmbeddingDiskCache(
+            os.path.join(self.global_config.save_dir, "embedding_cache", "query_embedding_cache.sqlite")) \
+            if self.global_config.query_embedding_cache_persist else None
+        self.query_to_embedding: Dict = {
+            kind: QueryEmbeddingCache(max_entries=self.global_config.query_embedding_cache_max_entries,
+                                      ttl_seconds=self.global_config.query_embedding_cache_ttl_seconds,
+                                      disk_cache=query_embedding_disk_cache)
+            for kind in ('triple', 'passage')}
 
         self.ready_to_retrieve = False
 
@@ -116,8 +133,13 @@ class StandardRAG:
 
         logger.info(f"Indexing Documents")
 
+        docs = self.chunk_docs(docs)
         self.chunk_embedding_store.insert_strings(docs)
 
+        # Queries are encoded in this process, data-parallel embedding workers are only needed again by the next `index`
+        if self.embedding_model is not None:
+            self.embedding_model.close()
+
     def delete(self, docs_to_delete: List[str]):
         """
 
@@ -127,17 +149,15 @@ class StandardRAG:
         if not self.ready_to_retrieve:
             self.prepare_retrieval_objects()
 
-        current_docs = set(self.chunk_embedding_store.get_all_texts())
-        docs_to_delete = [doc for doc in docs_to_delete if doc in current_docs]
-
-        #Get ids for chunks to delete
-        chunk_ids_to_delete = set(
-            [self.chunk_embedding_store.text_to_hash_id[chunk] for chunk in docs_to_delete])
+        #Get ids for chunks to delete, the chunk to document mapping is only updated once they are deleted
+        chunk_ids_to_delete = self.get_chunk_ids_to_delete(docs_to_delete)
 
         logger.info(f"Deleting {len(chunk_ids_to_delete)} Chunks")
 
         self.chunk_embedding_store.delete(chunk_ids_to_delete)
 
+        self.text_preprocessor.delete_docs(docs_to_delete)
+
         self.ready_to_retrieve = False
 
     def retrieve(self,
@@ -191,7 +211,8 @@ class StandardRAG:
                           sorted_doc_ids[:num_to_retrieve]]
 
             retrieval_results.append(
-                QuerySolution(question=query, docs=top_k_docs, doc_scores=sorted_doc_scores[:num_to_retrieve]))
+                QuerySolution(question=query, docs=top_k_docs, doc_scores=sorted_doc_scores[:num_to_retrieve],
+                              source_doc_ids=self.get_source_doc_ids(sorted_doc_ids[:num_to_retrieve], top_k_docs)))
 
         retrieve_end_time = time.time()  # Record end time
 
@@ -354,15 +375,27 @@ class StandardRAG:
         logger.info("Preparing for fast retrieval.")
 
         logger.info("Loading keys.")
-        self.query_to_embedding: Dict = {'triple': {}, 'passage': {}}
 
         self.passage_node_keys: List = list(self.chunk_embedding_store.get_all_ids()) # a list of passage node keys
 
         logger.info("Loading embeddings.")
-        self.passage_embeddings = np.array(self.chunk_embedding_store.get_embeddings(self.passage_node_keys))
+        self.passage_embeddings = self.load_retrieval_embeddings(self.chunk_embedding_store, self.passage_node_keys)
+
+        # Cached query embeddings stay valid as long as the model, instruction and projection they were made with are unchanged
+        self.query_to_embedding['passage'].set_namespace(
+            f"{self.embedding_model.embedding_cache_namespace()}|{get_query_instruction('query_to_passage')}|{self.chunk_embedding_store.projection_fingerprint()}")
 
         self.ready_to_retrieve = True
 
+    def load_retrieval_embeddings(self, embedding_store: EmbeddingStore, hash_ids: List[str]):
+        """
+        Loads the embeddings of `hash_ids` for retrieval, projected if `embedding_projection` is set, as float32 or, with
+        `embedding_quantization`, as a `QuantizedEmbeddings` matrix whose best candidates are re-scored in float32.
+        """
+        if self.global_config.embedding_quantization is None:
+            return np.array(embedding_store.get_retrieval_embeddings(hash_ids))
+        return QuantizedEmbeddings.from_store(embedding_store, hash_ids, self.global_config.embedding_quantization)
+
     def get_query_embeddings(self, queries: List[str] | List[QuerySolution]):
         """
         Retrieves embeddings for given queries and updates the internal query-to-embedding mapping. The method determines whether each query
@@ -376,11 +409,9 @@ class StandardRAG:
 
         all_query_strings = []
         for query in queries:
-            if isinstance(query, QuerySolution) and (
-                    query.question not in self.query_to_embedding['triple'] or query.question not in
-                    self.query_to_embedding['passage']):
+            if isinstance(query, QuerySolution) and query.question not in self.query_to_embedding['passage']:
                 all_query_strings.append(query.question)
-            elif query not in self.query_to_embedding['triple'] or query not in self.query_to_embedding['passage']:
+            elif not isinstance(query, QuerySolution) and query not in self.query_to_embedding['passage']:
                 all_query_strings.append(query)
 
         if len(all_query_strings) > 0:
@@ -388,8 +419,8 @@ class StandardRAG:
             query_embeddings_for_passage = self.embedding_model.batch_encode(all_query_strings,
                                                                              instruction=get_query_instruction('query_to_passage'),
                                                                              norm=True)
-            for query, embedding in zip(all_query_strings, query_embeddings_for_passage):
-                self.query_to_embedding['passage'][query] = embedding
+            query_embeddings_for_passage = self.chunk_embedding_store.project(query_embeddings_for_passage)
+            self.query_to_embedding['passage'].update(zip(all_query_strings, query_embeddings_for_passage))
 
     def dense_passage_retrieval(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
         """
@@ -420,7 +451,9 @@ class StandardRAG:
             query_embedding = self.embedding_model.batch_encode(query,
                                                                 instruction=get_query_instruction('query_to_passage'),
                                                                 norm=True)
-        query_doc_scores = np.dot(self.passage_embeddings, query_embedding.T)
+            query_embedding = self.chunk_embedding_store.project(query_embedding)
+        query_doc_scores = embedding_scores(self.passage_embeddings, query_embedding.T,
+                                            rescore_top_k=self.global_config.embedding_quantization_rescore_top_k)
         query_doc_scores = np.squeeze(query_doc_scores) if query_doc_scores.ndim == 2 else query_doc_scores
         query_doc_scores = min_max_normalize(query_doc_scores)
 
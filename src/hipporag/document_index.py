@@ -0,0 +1,57 @@
+from typing import List, Set
+
+
+class DocumentIndexMixin:
+    """
+    Document-level bookkeeping shared by HippoRAG and StandardRAG: chunking documents before they are indexed,
+    tracing retrieved passages back to their source documents, and resolving documents to delete into the chunks
+    that go with them.
+
+    Expects `global_config`, `text_preprocessor`, `chunk_embedding_store` and `embedding_model` attributes, and
+    `passage_node_keys` once retrieval objects are prepared.
+    """
+
+    def close(self):
+        """
+        Frees the worker processes held for indexing, e.g. data-parallel embedding workers. The instance stays usable.
+        """
+        if self.embedding_model is not None:
+            self.embedding_model.close()
+
+    def chunk_docs(self, docs: List[str]) -> List[str]:
+        """
+        Splits documents into chunks with the configured text preprocessor, recording which documents each chunk
+        comes from. Documents are returned untouched if `preprocess_chunk_max_token_size` is not set.
+
+        Parameters:
+            docs : List[str]
+                A list of full documents.
+
+        Returns:
+            List[str]: The chunk contents to index.
+        """
+        if self.global_config.preprocess_chunk_max_token_size is None:
+            return docs
+
+        chunks = self.text_preprocessor.chunk_docs(docs)
+        return [chunk['content'] for chunk in chunks.values()]
+
+    def get_source_doc_ids(self, passage_indices, passages: List[str]) -> List[List[str]]:
+        """
+        Maps retrieved passages, given by their indices in `passage_node_keys`, back to the ids of their source documents.
+        """
+        return [self.text_preprocessor.get_doc_ids(self.passage_node_keys[idx], passage) for idx, passage in zip(passage_indices, passages)]
+
+    def get_chunk_ids_to_delete(self, docs_to_delete: List[str]) -> Set[str]:
+        """
+        Returns the chunk store ids going with the given documents, without changing anything yet: chunked documents
+        through the chunks only they were split into, and documents indexed whole as their own chunk unless that text
+        is also a chunk of a remaining document.
+        """
+        chunk_ids_to_delete = set(chunk_id for chunk_id in self.text_preprocessor.orphaned_chunk_keys(docs_to_delete)
+                                  if chunk_id in self.chunk_embedding_store.hash_id_to_text)
+        for doc in docs_to_delete:
+            chunk_id = self.chunk_embedding_store.text_to_hash_id.get(doc)
+            if chunk_id is not None and chunk_id not in self.text_preprocessor.chunk_to_doc_ids:
+                chunk_ids_to_delete.add(chunk_id)
+        return chunk_ids_to_delete
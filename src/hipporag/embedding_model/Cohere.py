@@ -1,13 +1,14 @@
-from typing import List
+from typing import List, Optional
 import json
 
 import boto3
-from botocore.exceptions import ClientError
+from botocore.config import Config
 import numpy as np
-from tqdm import tqdm
 
 from .base import BaseEmbeddingModel
+from .cache import cache_embeddings
 from ..utils.config_utils import BaseConfig
+from ..utils.embed_utils import encode_batches_concurrently
 from ..prompts.linking import get_query_instruction
 
 
@@ -23,7 +24,11 @@ class CohereEmbeddingModel(BaseEmbeddingModel):
         self.embedding_type = 'float'
         self.batch_size = 64
 
-        self.bedrock_runtime = boto3.client(service_name='bedrock-runtime')
+        # boto3 clients are thread-safe; size the connection pool for the concurrent batches of `batch_encode`, which
+        # also retries throttled requests itself
+        self.bedrock_runtime = boto3.client(service_name='bedrock-runtime',
+                                            config=Config(max_pool_connections=global_config.embedding_max_concurrency,
+                                                          retries={'max_attempts': 1}))
 
         self.search_query_instr = set([
             get_query_instruction('query_to_fact'),
@@ -36,27 +41,25 @@ class CohereEmbeddingModel(BaseEmbeddingModel):
              'input_type': input_type,
              'embedding_types': [self.embedding_type]
         }
-        try:
-            response = self.bedrock_runtime.invoke_model(
-                body=json.dumps(request),
-                modelId=self.model_id,
-                accept='*/*',
-                contentType='application/json'
-            )
-        except ClientError as err:
-            raise Exception(f"A client error occurred: {err.response['Error']['Message']}")
-        
+        # A ClientError is left as is, its error code tells throttling from rejected inputs to the retries of `batch_encode`
+        response = self.bedrock_runtime.invoke_model(
+            body=json.dumps(request),
+            modelId=self.model_id,
+            accept='*/*',
+            contentType='application/json'
+        )
+
         response = json.loads(response.get('body').read())
         return np.array(response['embeddings'][self.embedding_type])
 
+    def instruction_key(self, instruction: Optional[str]) -> Optional[str]:
+        # Cohere only tells queries from documents
+        return 'search_query' if instruction in self.search_query_instr else 'search_document'
+
+    @cache_embeddings
     def batch_encode(self, texts: List[str], **kwargs) -> None:
-        input_type = 'search_query' if (kwargs.get("instruction") in self.search_query_instr) else 'search_document'
-
-        if len(texts) < self.batch_size:
-            return self.encode(texts, input_type)
-        
-        results = []
-        batch_indexes = list(range(0, len(texts), self.batch_size))
-        for i in tqdm(batch_indexes, desc="Batch Encoding"):
-            results.append(self.encode(texts[i:i + self.batch_size], input_type))
-        return np.concatenate(results)
+        input_type = self.instruction_key(kwargs.get("instruction"))
+
+        return encode_batches_concurrently(texts, lambda batch: self.encode(batch, input_type), self.batch_size,
+                                           max_concurrency=self.global_config.embedding_max_concurrency,
+                                           max_retries=self.global_config.embedding_max_retries)
@@ -3,12 +3,13 @@ from typing import List, Optional
 
 import numpy as np
 import torch
-from tqdm import tqdm
 from transformers import AutoModel, AutoTokenizer
 
 from ..utils.config_utils import BaseConfig
+from ..utils.embed_utils import encode_in_length_buckets, token_lengths
 from ..utils.logging_utils import get_logger
 from .base import BaseEmbeddingModel, EmbeddingConfig
+from .cache import cache_embeddings
 
 logger = get_logger(__name__)
 
@@ -19,6 +20,8 @@ def mean_pooling(token_embeddings, mask):
 
 class ContrieverModel(BaseEmbeddingModel):
 
+    supports_data_parallel = True
+
     def __init__(self, global_config: Optional[BaseConfig] = None, embedding_model_name: Optional[str] = None) -> None:
         super().__init__(global_config=global_config)
 
@@ -83,6 +86,11 @@ class ContrieverModel(BaseEmbeddingModel):
 
         return embeddings
 
+    def instruction_key(self, instruction: Optional[str]) -> Optional[str]:
+        # Contriever has no instructions
+        return None
+
+    @cache_embeddings
     def batch_encode(self, texts: List[str], **kwargs) -> None:
         if isinstance(texts, str): texts = [texts]
 
@@ -92,20 +100,11 @@ class ContrieverModel(BaseEmbeddingModel):
         batch_size = params.pop("batch_size", 16)
 
         logger.debug(f"Calling {self.__class__.__name__} with:\n{params}")
-        if len(texts) <= batch_size:
-            results = self.encode(texts)
-        else:
-            pbar = tqdm(total=len(texts), desc="Batch Encoding")
-            results = []
-            for i in range(0, len(texts), batch_size):
-                results.append(self.encode(texts[i:i + batch_size]))
-                pbar.update(batch_size)
-            pbar.close()
-            results = torch.cat(results, dim=0)
-
-        if isinstance(results, torch.Tensor):
-            results = results.cpu()
-            results = results.numpy()
+
+        # Sorting by length keeps short entity and fact strings from being padded to the longest passage
+        lengths = token_lengths(texts, self.tokenizer, max_length=min(params["max_length"], self.tokenizer.model_max_length))
+        max_batch_tokens = self.global_config.embedding_max_batch_tokens or batch_size * max(lengths, default=1)
+        results = encode_in_length_buckets(texts, self.encode, lengths, max_batch_tokens)
 
         if self.embedding_config.norm:
             results = (results.T / np.linalg.norm(results, axis=1)).T
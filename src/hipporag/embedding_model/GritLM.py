@@ -11,7 +11,8 @@ from ..utils.config_utils import BaseConfig
 from ..utils.logging_utils import get_logger
 from ..utils.llm_utils import TextChatMessage
 
-from .base import BaseEmbeddingModel, EmbeddingConfig, make_cache_embed
+from .base import BaseEmbeddingModel, EmbeddingConfig
+from .cache import cache_embeddings
 
 
 logger = get_logger(__name__)
@@ -19,6 +20,8 @@ logger = get_logger(__name__)
 
 class GritLMEmbeddingModel(BaseEmbeddingModel):
 
+    supports_data_parallel = True
+
     def __init__(self, global_config: Optional[BaseConfig] = None, embedding_model_name: Optional[str] = None) -> None:
         super().__init__(global_config=global_config)
         
@@ -68,6 +71,7 @@ class GritLMEmbeddingModel(BaseEmbeddingModel):
         return "<|user|>\n" + instruction + "\n<|embed|>\n" if instruction else "<|embed|>\n"
     
     
+    @cache_embeddings
     def batch_encode(self, texts: List[str], **kwargs) -> None:
         if isinstance(texts, str): texts = [texts]
         
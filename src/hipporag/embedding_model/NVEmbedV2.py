@@ -3,12 +3,13 @@ from typing import List, Optional
 
 import numpy as np
 import torch
-from tqdm import tqdm
 from transformers import AutoModel
 
 from ..utils.config_utils import BaseConfig
+from ..utils.embed_utils import encode_in_length_buckets, token_lengths
 from ..utils.logging_utils import get_logger
-from .base import BaseEmbeddingModel, EmbeddingConfig, make_cache_embed
+from .base import BaseEmbeddingModel, EmbeddingConfig
+from .cache import cache_embeddings
 
 logger = get_logger(__name__)
 
@@ -65,6 +66,7 @@ class NVEmbedV2EmbeddingModel(BaseEmbeddingModel):
     #     # Adds EOS token to each text
     #     return [text + self.embedding_model.tokenizer.eos_token for text in texts]
 
+    @cache_embeddings
     def batch_encode(self, texts: List[str], **kwargs) -> None:
         if isinstance(texts, str): texts = [texts]
 
@@ -79,22 +81,15 @@ class NVEmbedV2EmbeddingModel(BaseEmbeddingModel):
         batch_size = params.pop("batch_size", 16)
 
         logger.debug(f"Calling {self.__class__.__name__} with:\n{params}")
-        if len(texts) <= batch_size:
-            params["prompts"] = texts  # self._add_eos(texts=texts)
-            results = self.embedding_model.encode(**params)
-        else:
-            pbar = tqdm(total=len(texts), desc="Batch Encoding")
-            results = []
-            for i in range(0, len(texts), batch_size):
-                params["prompts"] = texts[i:i + batch_size]
-                results.append(self.embedding_model.encode(**params))
-                pbar.update(batch_size)
-            pbar.close()
-            results = torch.cat(results, dim=0)
-
-        if isinstance(results, torch.Tensor):
-            results = results.cpu()
-            results = results.numpy()
+
+        def encode_batch(batch: List[str]):
+            return self.embedding_model.encode(**params, prompts=batch)
+
+        # Sorting by length keeps short entity and fact strings from being padded to the longest passage
+        lengths = token_lengths(texts, getattr(self.embedding_model, "tokenizer", None), max_length=params.get("max_length"))
+        max_batch_tokens = self.global_config.embedding_max_batch_tokens or batch_size * max(lengths, default=1)
+        results = encode_in_length_buckets(texts, encode_batch, lengths, max_batch_tokens)
+
         if self.embedding_config.norm:
             results = (results.T / np.linalg.norm(results, axis=1)).T
 
@@ -0,0 +1,212 @@
+import json
+import os
+from copy import deepcopy
+from typing import List, Optional
+
+import numpy as np
+from transformers import AutoConfig, AutoTokenizer
+
+from ..utils.config_utils import BaseConfig
+from ..utils.embed_utils import encode_in_length_buckets, token_lengths
+from ..utils.logging_utils import get_logger
+from .base import BaseEmbeddingModel, EmbeddingConfig
+from .cache import cache_embeddings
+
+logger = get_logger(__name__)
+
+# Texts the exported encoder is compared on against its PyTorch reference
+VERIFICATION_TEXTS = [
+    "What county is Erik Hort's birthplace a part of?",
+    "Montebello is a part of Rockland County.",
+    "Erik Hort (born February 16, 1987) is an American soccer player. He was born in Montebello, New York, and played "
+    "college soccer at Rutgers University before turning professional with the Rochester Rhinos in 2009.",
+    "a",
+]
+# Min cosine similarity of verification embeddings to the PyTorch reference, for float32 and int8 exports
+MIN_COSINE = {"float32": 0.9999, "int8": 0.99}
+
+
+def pool(token_embeddings: np.ndarray, mask: np.ndarray, pooling: str) -> np.ndarray:
+    if pooling == "cls":
+        return token_embeddings[:, 0]
+    mask = mask[..., None].astype(token_embeddings.dtype)
+    return (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+
+def _min_cosine(a: np.ndarray, b: np.ndarray) -> float:
+    a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    return float((a * b).sum(axis=1).min())
+
+
+class ONNXEmbeddingModel(BaseEmbeddingModel):
+    """
+    Runs a Hugging Face encoder (e.g. Contriever or a sentence-transformers model) on CPU with ONNX Runtime.
+
+    To select this implementation you can initialise HippoRAG with:
+        embedding_model_name starts with "ONNX/", followed by the Hugging Face model id
+
+    On first use the encoder is exported to ONNX under `save_dir/onnx_models`, and dynamically quantized to int8 if
+    `embedding_onnx_quantize` is set. Both exports are checked against the PyTorch model before they are used,
+    which is the only time PyTorch is needed. Embeddings are pooled from the last hidden state following
+    `embedding_onnx_pooling`, and ONNX Runtime uses `embedding_onnx_num_threads` intra-op threads.
+    """
+
+    supports_data_parallel = True
+
+    def __init__(self, global_config: Optional[BaseConfig] = None, embedding_model_name: Optional[str] = None) -> None:
+        super().__init__(global_config=global_config)
+
+        if embedding_model_name is not None:
+            self.embedding_model_name = embedding_model_name
+            logger.debug(
+                f"Overriding {self.__class__.__name__}'s embedding_model_name with: {self.embedding_model_name}")
+
+        self.model_id = self.embedding_model_name[len("ONNX/"):]
+        self._init_embedding_config()
+
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("ONNX embedding models need onnxruntime, install it with `pip install onnxruntime`")
+
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_id)
+        self.pooling = self.global_config.embedding_onnx_pooling
+
+        self.precision = "int8" if self.global_config.embedding_onnx_quantize else "float32"
+        export_dir = os.path.join(self.global_config.save_dir, "onnx_models", self.model_id.replace("/", "_"))
+        onnx_path = self._export(export_dir, self.precision)
+
+        session_options = onnxruntime.SessionOptions()
+        session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session_options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        if self.global_config.embedding_onnx_num_threads is not None:
+            session_options.intra_op_num_threads = self.global_config.embedding_onnx_num_threads
+        session_options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(onnx_path, sess_options=session_options,
+                                                    providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+        self.embedding_dim = AutoConfig.from_pretrained(self.model_id).hidden_size
+        logger.info(f"Loaded {self.precision} ONNX export of {self.model_id} from {onnx_path}")
+
+    def _init_embedding_config(self) -> None:
+        """
+        Extract embedding model-specific parameters to init the EmbeddingConfig.
+
+        Returns:
+            None
+        """
+
+        config_dict = {
+            "embedding_model_name": self.embedding_model_name,
+            "norm": self.global_config.embedding_return_as_normalized,
+            "encode_params": {
+                "max_length": self.global_config.embedding_max_seq_len,
+                "batch_size": self.global_config.embedding_batch_size,
+            },
+        }
+
+        self.embedding_config = EmbeddingConfig.from_dict(config_dict=config_dict)
+        logger.debug(f"Init {self.__class__.__name__}'s embedding_config: {self.embedding_config}")
+
+    def _export(self, export_dir: str, precision: str) -> str:
+        """
+        Exports the encoder, and its int8 quantization for `precision` int8, unless a verified export exists.
+        An `export_info.json` file, written once an export passed verification, marks it as complete.
+
+        Returns:
+            str: The path of the ONNX model to load.
+        """
+        fp32_path = os.path.join(export_dir, "model.onnx")
+        onnx_path = fp32_path if precision == "float32" else os.path.join(export_dir, "model.int8.onnx")
+        info_path = os.path.join(export_dir, "export_info.json")
+        export_info = {}
+        if os.path.exists(info_path):
+            with open(info_path) as f:
+                export_info = json.load(f)
+            if precision in export_info and os.path.exists(onnx_path):
+                return onnx_path
+
+        import torch
+        from transformers import AutoModel
+
+        logger.info(f"Exporting {self.model_id} to ONNX in {export_dir}")
+        os.makedirs(export_dir, exist_ok=True)
+        model = AutoModel.from_pretrained(self.model_id, torch_dtype=torch.float32)
+        model.eval()
+
+        sample = self.tokenizer(VERIFICATION_TEXTS, padding=True, truncation=True, return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+        with torch.no_grad():
+            reference = pool(model(**sample)[0].numpy(), sample["attention_mask"].numpy(), self.pooling)
+
+            if "float32" not in export_info or not os.path.exists(fp32_path):
+                dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+                torch.onnx.export(model, tuple(sample[name] for name in input_names), fp32_path,
+                                  input_names=input_names, output_names=["last_hidden_state"],
+                                  dynamic_axes=dynamic_axes, opset_version=17, do_constant_folding=True)
+                export_info["float32"] = self._verify(fp32_path, reference, "float32")
+
+        if precision == "int8":
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(fp32_path, onnx_path, weight_type=QuantType.QInt8)
+            export_info["int8"] = self._verify(onnx_path, reference, "int8")
+
+        with open(info_path, "w") as f:
+            json.dump(export_info, f, indent=2)
+        return onnx_path
+
+    def _verify(self, onnx_path: str, reference: np.ndarray, precision: str) -> dict:
+        """
+        Checks that an export reproduces the PyTorch reference embeddings of `VERIFICATION_TEXTS`.
+        """
+        import onnxruntime
+
+        session = onnxruntime.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+        input_names = [model_input.name for model_input in session.get_inputs()]
+        inputs = self.tokenizer(VERIFICATION_TEXTS, padding=True, truncation=True, return_tensors="np")
+        outputs = session.run(None, {name: inputs[name].astype(np.int64) for name in input_names})[0]
+        embeddings = pool(outputs, inputs["attention_mask"], self.pooling)
+
+        min_cosine = _min_cosine(embeddings, reference)
+        max_abs_diff = float(np.abs(embeddings - reference).max())
+        logger.info(f"{precision} ONNX export of {self.model_id}: min cosine {min_cosine:.6f}, max abs diff {max_abs_diff:.2e} to PyTorch")
+        if min_cosine < MIN_COSINE[precision]:
+            raise ValueError(f"{precision} ONNX export of {self.model_id} deviates from PyTorch: min cosine similarity "
+                             f"{min_cosine:.6f} < {MIN_COSINE[precision]}")
+        return {"min_cosine": min_cosine, "max_abs_diff": max_abs_diff}
+
+    def encode(self, texts: List[str], max_length: Optional[int] = None) -> np.ndarray:
+        inputs = self.tokenizer(texts, padding=True, truncation=True, max_length=max_length, return_tensors="np")
+        outputs = self.session.run(None, {name: inputs[name].astype(np.int64) for name in self.input_names})[0]
+        return pool(outputs, inputs["attention_mask"], self.pooling)
+
+    def embedding_cache_namespace(self) -> str:
+        # int8 exports and other poolings give different vectors than the float32 export of the same model
+        return f"{super().embedding_cache_namespace()}|{self.precision}|{self.pooling}"
+
+    def instruction_key(self, instruction: Optional[str]) -> Optional[str]:
+        # The exported encoders take no instructions
+        return None
+
+    @cache_embeddings
+    def batch_encode(self, texts: List[str], **kwargs) -> None:
+        if isinstance(texts, str): texts = [texts]
+
+        params = deepcopy(self.embedding_config.encode_params)
+        if kwargs: params.update(kwargs)
+
+        batch_size = params.pop("batch_size", 16)
+        max_length = min(params["max_length"], self.tokenizer.model_max_length)
+
+        logger.debug(f"Calling {self.__class__.__name__} with:\n{params}")
+
+        # Sorting by length keeps short entity and fact strings from being padded to the longest passage
+        lengths = token_lengths(texts, self.tokenizer, max_length=max_length)
+        max_batch_tokens = self.global_config.embedding_max_batch_tokens or batch_size * max(lengths, default=1)
+        results = encode_in_length_buckets(texts, lambda batch: self.encode(batch, max_length=max_length), lengths, max_batch_tokens)
+
+        if self.embedding_config.norm:
+            results = (results.T / np.linalg.norm(results, axis=1)).T
+
+        return results
@@ -1,16 +1,18 @@
 from copy import deepcopy
 from typing import List, Optional
 
+import httpx
 import numpy as np
 import torch
-from tqdm import tqdm
 from transformers import AutoModel
 from openai import OpenAI
 from openai import AzureOpenAI
 
 from ..utils.config_utils import BaseConfig
+from ..utils.embed_utils import encode_batches_concurrently
 from ..utils.logging_utils import get_logger
-from .base import BaseEmbeddingModel, EmbeddingConfig, make_cache_embed
+from .base import BaseEmbeddingModel, EmbeddingConfig
+from .cache import cache_embeddings
 
 logger = get_logger(__name__)
 
@@ -30,13 +32,21 @@ class OpenAIEmbeddingModel(BaseEmbeddingModel):
         logger.debug(
             f"Initializing {self.__class__.__name__}'s embedding model with params: {self.embedding_config.model_init_params}")
 
+        # One pooled HTTP client sized for the concurrent batches of `batch_encode`; retries are done there too
+        max_concurrency = self.global_config.embedding_max_concurrency
+        http_client = httpx.Client(limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+                                   timeout=httpx.Timeout(5*60, read=5*60))
         if self.global_config.azure_embedding_endpoint is None:
             self.client = OpenAI(
-                base_url=self.global_config.embedding_base_url
+                base_url=self.global_config.embedding_base_url,
+                http_client=http_client,
+                max_retries=0
             )
         else:
             self.client = AzureOpenAI(api_version=self.global_config.azure_embedding_endpoint.split('api-version=')[1],
-                                      azure_endpoint=self.global_config.azure_embedding_endpoint)
+                                      azure_endpoint=self.global_config.azure_embedding_endpoint,
+                                      http_client=http_client,
+                                      max_retries=0)
 
 
     def _init_embedding_config(self) -> None:
@@ -78,6 +88,11 @@ class OpenAIEmbeddingModel(BaseEmbeddingModel):
 
         return results
 
+    def instruction_key(self, instruction: Optional[str]) -> Optional[str]:
+        # The instruction is not sent to the embeddings endpoint
+        return None
+
+    @cache_embeddings
     def batch_encode(self, texts: List[str], **kwargs) -> None:
         if isinstance(texts, str): texts = [texts]
 
@@ -93,20 +108,9 @@ class OpenAIEmbeddingModel(BaseEmbeddingModel):
 
         batch_size = params.pop("batch_size", 16)
 
-        if len(texts) <= batch_size:
-            results = self.encode(texts)
-        else:
-            pbar = tqdm(total=len(texts), desc="Batch Encoding")
-            results = []
-            for i in range(0, len(texts), batch_size):
-                batch = texts[i:i + batch_size]
-                try:
-                    results.append(self.encode(batch))
-                except:
-                    import ipdb; ipdb.set_trace()
-                pbar.update(batch_size)
-            pbar.close()
-            results = np.concatenate(results)
+        results = encode_batches_concurrently(texts, self.encode, batch_size,
+                                              max_concurrency=self.global_config.embedding_max_concurrency,
+                                              max_retries=self.global_config.embedding_max_retries)
 
         if isinstance(results, torch.Tensor):
             results = results.cpu()
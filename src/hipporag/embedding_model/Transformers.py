@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 import json
 
 import torch
@@ -6,6 +6,7 @@ import numpy as np
 from tqdm import tqdm
 
 from .base import BaseEmbeddingModel
+from .cache import cache_embeddings
 from ..utils.config_utils import BaseConfig
 from ..prompts.linking import get_query_instruction
 from sentence_transformers import SentenceTransformer
@@ -15,6 +16,8 @@ class TransformersEmbeddingModel(BaseEmbeddingModel):
     To select this implementation you can initialise HippoRAG with:
         embedding_model_name starts with "Transformers/"
     """
+    supports_data_parallel = True
+
     def __init__(self, global_config:BaseConfig, embedding_model_name:str) -> None:
         super().__init__(global_config=global_config)
 
@@ -36,6 +39,11 @@ class TransformersEmbeddingModel(BaseEmbeddingModel):
             raise Exception(f"An error occurred: {err}")
         return np.array(response)
 
+    def instruction_key(self, instruction: Optional[str]) -> Optional[str]:
+        # Sentence transformers are called without instructions
+        return None
+
+    @cache_embeddings
     def batch_encode(self, texts: List[str], **kwargs) -> None:
         if len(texts) < self.batch_size:
             return self.encode(texts)
@@ -1,11 +1,13 @@
-from typing import List
+from typing import List, Optional
 import numpy as np
-from tqdm import tqdm
 
 from .base import BaseEmbeddingModel
+from .cache import cache_embeddings
 from ..utils.config_utils import BaseConfig
+from ..utils.embed_utils import encode_batches_concurrently
 from ..prompts.linking import get_query_instruction
 import requests
+import requests.adapters
 
 class VLLMEmbeddingModel(BaseEmbeddingModel):
     """
@@ -22,6 +24,12 @@ class VLLMEmbeddingModel(BaseEmbeddingModel):
 
         self.url = global_config.embedding_base_url
 
+        # One pooled session shared by the concurrent batches of `batch_encode`
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=global_config.embedding_max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
         self.search_query_instr = set([
             get_query_instruction('query_to_fact'),
             get_query_instruction('query_to_passage')
@@ -39,7 +47,8 @@ class VLLMEmbeddingModel(BaseEmbeddingModel):
             "input": input_text,
         }
 
-        response = requests.post(self.base_url, headers=headers, json=payload)
+        # Bounded like the OpenAI client, so a hung connection fails into the retries of `batch_encode` instead of blocking
+        response = self.session.post(self.url, headers=headers, json=payload, timeout=(30, 5 * 60))
         response.raise_for_status()
         result = response.json()
         return np.array([result["data"][i]["embedding"] for i in range(len(result["data"]))])
@@ -48,12 +57,12 @@ class VLLMEmbeddingModel(BaseEmbeddingModel):
         response = self.call_model(texts)
         return response
 
+    def instruction_key(self, instruction: Optional[str]) -> Optional[str]:
+        # The embeddings server is called without instructions
+        return None
+
+    @cache_embeddings
     def batch_encode(self, texts: List[str], **kwargs) -> None:
-        if len(texts) < self.batch_size:
-            return self.encode(texts)
-        
-        results = []
-        batch_indexes = list(range(0, len(texts), self.batch_size))
-        for i in tqdm(batch_indexes, desc="Batch Encoding"):
-            results.append(self.encode(texts[i:i + self.batch_size]))
-        return np.concatenate(results)
+        return encode_batches_concurrently(texts, self.encode, self.batch_size,
+                                           max_concurrency=self.global_config.embedding_max_concurrency,
+                                           max_retries=self.global_config.embedding_max_retries)
@@ -6,6 +6,7 @@ from .OpenAI import OpenAIEmbeddingModel
 from .Cohere import CohereEmbeddingModel
 from .Transformers import TransformersEmbeddingModel
 from .VLLM import VLLMEmbeddingModel
+from .ONNX import ONNXEmbeddingModel
 
 from ..utils.logging_utils import get_logger
 
@@ -27,4 +28,6 @@ def _get_embedding_model_class(embedding_model_name: str = "nvidia/NV-Embed-v2")
         return TransformersEmbeddingModel
     elif embedding_model_name.startswith("VLLM/"):
         return VLLMEmbeddingModel
+    elif embedding_model_name.startswith("ONNX/"):
+        return ONNXEmbeddingModel
     assert False, f"Unknown embedding model name: {embedding_model_name}"
\ No newline at end of file
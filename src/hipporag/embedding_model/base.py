@@ -1,19 +1,23 @@
 import json
-from dataclasses import dataclass, field, asdict
+from dataclasses import dataclass, field, asdict, replace
 from typing import (
     Optional,
     Tuple,
     Any, 
     Dict,
+    Hashable,
+    Iterator,
     List
 )
+import os
 import numpy as np
 import threading
-import multiprocessing
 
 
 from ..utils.logging_utils import get_logger
 from ..utils.config_utils import BaseConfig
+from .cache import EmbeddingCacheBackend, make_embedding_cache
+from .parallel import DataParallelEncoder
 
 
 logger = get_logger(__name__)
@@ -104,94 +108,15 @@ class EmbeddingConfig:
         return json.dumps(self._data, indent=4)
     
 
-from filelock import FileLock
-import sqlite3
-import hashlib
-import os
-import torch
-def make_cache_embed(encode_func, cache_file_name, device):
-    def wrapper(**kwargs):
-        # FOCUS_KEYS = ["instruction", "prompts", "max_length"]
-        instruction = kwargs.get("instruction", "")
-        max_length = kwargs.get("max_length", "")
-
-        hash_strs = []
-        for prompt in kwargs['prompts']:
-            key_str = json.dumps({
-                "instruction": instruction,
-                "promps": prompt,
-                "max_length": max_length
-            }, sort_keys=True, default=str)
-            hash_strs.append(hashlib.sha256(key_str.encode("utf-8")).hexdigest())
-
-        missed_prompts = []
-        lock_file = cache_file_name + ".lock"
-
-        with FileLock(lock_file):
-            with sqlite3.connect(cache_file_name) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS embeddings (
-                        hash TEXT PRIMARY KEY,
-                        embedding BLOB
-                    )
-                ''')
-                conn.commit()
-
-                embeddings = []
-                for i, hash_str in enumerate(hash_strs):
-                    cursor.execute('SELECT embedding FROM embeddings WHERE hash = ?', (hash_str,))
-                    result = cursor.fetchone()
-                    if result:
-                        # Convert the BLOB back to a NumPy array
-                        emb = np.frombuffer(result[0], dtype=np.float32)
-                        embeddings.append(emb)
-                    else:
-                        missed_prompts.append(i)
-                        embeddings.append(None)
-
-        if missed_prompts:
-            # Update kwargs to include only the missed prompts.
-            kwargs['prompts'] = [kwargs['prompts'][i] for i in missed_prompts]
-            # Call the encoder function (which returns a 2D torch tensor)
-            new_embeddings = encode_func(**kwargs)
-            # Insert the new embeddings back into the correct positions.
-            for idx, embedding in enumerate(new_embeddings):
-                embeddings[missed_prompts[idx]] = embedding
-
-            # Save the new embeddings to the cache.
-            with FileLock(lock_file):
-                with sqlite3.connect(cache_file_name) as conn:
-                    cursor = conn.cursor()
-                    for i in missed_prompts:
-                        hash_str = hash_strs[i]
-                        emb = embeddings[i]
-                        # Convert torch tensor to numpy bytes if necessary.
-                        if isinstance(emb, torch.Tensor):
-                            emb_bytes = emb.cpu().numpy().tobytes()
-                        else:
-                            emb_bytes = emb.tobytes()
-                        cursor.execute('INSERT INTO embeddings (hash, embedding) VALUES (?, ?)', (hash_str, emb_bytes))
-                    conn.commit()
-
-        # Convert all embeddings to torch tensors if they're not already
-        final_embeddings = [
-            emb if isinstance(emb, torch.Tensor) else torch.Tensor(emb.copy())
-            for emb in embeddings
-        ]
-
-        final_embeddings = [emb.to(device) for emb in final_embeddings]
-        # Return a 2D tensor where each row is an embedding.
-        return torch.stack(final_embeddings)
-
-    return wrapper
-    
 class BaseEmbeddingModel:
     global_config: BaseConfig
     embedding_model_name: str # Class name indicating which embedding model to use.
     embedding_config: EmbeddingConfig
     
     embedding_dim: int # Need subclass to init
+
+    # Local models whose encoding can be spread over processes, see `iter_batch_encode`
+    supports_data_parallel: bool = False
     
     def __init__(self, global_config: Optional[BaseConfig] = None) -> None:
         if global_config is None: 
@@ -205,9 +130,112 @@ class BaseEmbeddingModel:
 
         logger.debug(f"Init {self.__class__.__name__}'s embedding_model_name with: {self.embedding_model_name}")
 
+        self._embedding_cache = None
+        self._data_parallel_encoder = None
+
+    @property
+    def embedding_cache(self) -> Optional[EmbeddingCacheBackend]:
+        """
+        The embedding cache used by `batch_encode`, or None if `embedding_cache` is disabled.
+        Created on first use, since subclasses may override `embedding_model_name` after this base init.
+        """
+        if not self.global_config.embedding_cache:
+            return None
+        if getattr(self, "_embedding_cache", None) is None:
+            cache_dir = os.path.join(self.global_config.save_dir, "embedding_cache")
+            self._embedding_cache = make_embedding_cache(
+                self.global_config.embedding_cache_backend,
+                cache_filepath=os.path.join(cache_dir, f"{self.embedding_model_name.replace('/', '_')}_cache.sqlite"),
+                dtype=self.global_config.embedding_cache_dtype,
+                max_entries=self.global_config.embedding_cache_max_entries)
+        return self._embedding_cache
+
+    def embedding_cache_namespace(self) -> str:
+        # Settings that change the returned vectors are part of the "model" component of cache keys
+        return (f"{self.embedding_model_name}|norm={self.global_config.embedding_return_as_normalized}"
+                f"|max_len={self.global_config.embedding_max_seq_len}")
+
+    @property
+    def data_parallel_encoder(self) -> Optional[DataParallelEncoder]:
+        """
+        The worker processes `iter_batch_encode` spreads encoding over, or None if `embedding_num_workers` is 1 or
+        the model is not local. Workers only share the embedding cache if it is the `disk` one.
+        """
+        if not self.supports_data_parallel or self.global_config.embedding_num_workers <= 1:
+            return None
+        if getattr(self, "_data_parallel_encoder", None) is None:
+            worker_config = replace(
+                self.global_config,
+                embedding_num_workers=1,
+                embedding_cache=self.global_config.embedding_cache and self.global_config.embedding_cache_backend == "disk")
+            self._data_parallel_encoder = DataParallelEncoder(
+                type(self), worker_config, self.embedding_model_name,
+                num_workers=self.global_config.embedding_num_workers,
+                cores_per_worker=self.global_config.embedding_cores_per_worker,
+                shard_size=self.global_config.embedding_shard_size)
+        return self._data_parallel_encoder
+
+    def close(self) -> None:
+        """
+        Stops the data-parallel workers of this model, if any were started, so their model copies are freed.
+        The model itself stays usable, and workers are started again when needed.
+        """
+        if getattr(self, "_data_parallel_encoder", None) is not None:
+            self._data_parallel_encoder.close()
+            self._data_parallel_encoder = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
     def batch_encode(self, texts: List[str], **kwargs) -> None:
         raise NotImplementedError
-    
+
+    def iter_batch_encode(self, texts: List[str], **kwargs) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Encodes texts like `batch_encode`, yielding (start index, embeddings) of consecutive slices of `texts` in order,
+        so callers can store results while later slices are still being encoded. With a `data_parallel_encoder`,
+        slices are encoded by its workers; otherwise all texts are encoded here in one slice.
+        """
+        if isinstance(texts, str): texts = [texts]
+
+        encoder = self.data_parallel_encoder
+        if encoder is None or len(texts) <= encoder.shard_size:
+            yield 0, self.batch_encode(texts, **kwargs)
+            return
+        yield from encoder.imap(texts, **kwargs)
+
+    def instruction_key(self, instruction: Optional[str]) -> Hashable:
+        """
+        What an instruction changes about the encoding. Instructions with equal keys give identical embeddings, so
+        models that ignore instructions, or map several onto one input type, override this to let them share a pass.
+        """
+        return instruction or ""
+
+    def batch_encode_multi(self, texts: List[str], instructions: List[Optional[str]], **kwargs) -> List[np.ndarray]:
+        """
+        Encodes the same texts under several instructions, e.g. a query for both fact and passage retrieval.
+        Texts are encoded once per distinct `instruction_key`, and instructions sharing a key share the result.
+
+        Returns:
+            List[np.ndarray]: The embeddings of `texts` for every instruction, in the order of `instructions`.
+        """
+        if isinstance(texts, str): texts = [texts]
+
+        key_to_embeddings = {}
+        results = []
+        for instruction in instructions:
+            key = self.instruction_key(instruction)
+            if key not in key_to_embeddings:
+                key_to_embeddings[key] = self.batch_encode(texts, instruction=instruction, **kwargs)
+            results.append(key_to_embeddings[key])
+
+        if len(key_to_embeddings) < len(instructions):
+            logger.debug(f"{self.__class__.__name__} encoded {len(texts)} texts for {len(instructions)} instructions in {len(key_to_embeddings)} passes")
+        return results
+
     
     def get_query_doc_scores(self, query_vec: np.ndarray, doc_vecs: np.ndarray):
         # """
@@ -220,30 +248,56 @@ class BaseEmbeddingModel:
 
 
 class EmbeddingCache:
-    """A multiprocessing-safe global cache for storing embeddings."""
-    
-    _manager = multiprocessing.Manager()
-    _cache = _manager.dict()  # Shared dictionary for multiprocessing
-    _lock = threading.Lock()  # Thread-safe lock for concurrent access
+    """
+    Process-wide embedding cache keyed by content, backed by an `lru` (default), `shared` or `disk` embedding cache.
+
+    Nothing is created when this module is imported: the backend, and for `shared` its manager process, is only
+    set up on first use, so importing the package stays cheap and forked workers do not inherit a manager.
+    Call `configure` before first use to pick another backend.
+    """
+
+    _backend: Optional[EmbeddingCacheBackend] = None
+    _backend_kwargs: Dict[str, Any] = {"backend": "lru"}
+    _lock = threading.Lock()  # Thread-safe lock for lazy initialization
+
+    @classmethod
+    def configure(cls, backend: str = "lru", **kwargs) -> None:
+        """Selects the backend and its `make_embedding_cache` arguments, dropping any backend already in use."""
+        with cls._lock:
+            if cls._backend is not None:
+                cls._backend.close()
+            cls._backend = None
+            cls._backend_kwargs = {"backend": backend, **kwargs}
+
+    @classmethod
+    def backend(cls) -> EmbeddingCacheBackend:
+        if cls._backend is None:
+            with cls._lock:
+                if cls._backend is None:
+                    cls._backend = make_embedding_cache(**cls._backend_kwargs)
+        return cls._backend
+
+    @staticmethod
+    def _key(content: str) -> bytes:
+        return EmbeddingCacheBackend.make_key("", None, content)
 
     @classmethod
     def get(cls, content):
         """Retrieve the embedding if cached."""
-        return cls._cache.get(content)
+        return cls.backend().read_many([cls._key(content)])[0]
 
     @classmethod
     def set(cls, content, embedding):
         """Store an embedding in the cache."""
-        with cls._lock:  # Ensures thread safety
-            cls._cache[content] = embedding
+        cls.backend().write_many([cls._key(content)], [embedding])
 
     @classmethod
     def contains(cls, content):
         """Check if the embedding exists in cache."""
-        return content in cls._cache
+        return cls.get(content) is not None
 
     @classmethod
     def clear(cls):
         """Clear the entire cache."""
-        with cls._lock:
-            cls._cache.clear()
\ No newline at end of file
+        if cls._backend is not None:
+            cls._backend.clear()
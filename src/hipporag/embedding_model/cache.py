@@ -0,0 +1,484 @@
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.managers import BaseManager
+from typing import Any, Dict, List, Literal, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..utils.logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+
+class EmbeddingCacheBackend:
+    """
+    Interface shared by the embedding cache backends: bulk `read_many` / `write_many` over 16-byte keys made by
+    `make_key`, with hit, miss and write counters of this process. Subclasses implement `_read` and `_write`.
+    """
+
+    def __init__(self) -> None:
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_writes = 0
+
+    @staticmethod
+    def make_key(model: str, instruction: Optional[str], text: str) -> bytes:
+        """Hashes (model, instruction, text) into a 16-byte key."""
+        key_str = "\x00".join((model, instruction or "", text))
+        return hashlib.blake2b(key_str.encode("utf-8"), digest_size=16).digest()
+
+    def _read(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        raise NotImplementedError
+
+    def _write(self, items: List[Tuple[bytes, np.ndarray]]) -> None:
+        raise NotImplementedError
+
+    def read_many(self, keys: Sequence[bytes]) -> List[Optional[np.ndarray]]:
+        """Returns the cached float32 embedding of every key, None for misses, in the order of `keys`."""
+        found = self._read(list(dict.fromkeys(keys)))
+        results = [found.get(key) for key in keys]
+        num_hits = sum(embedding is not None for embedding in results)
+        self.num_hits += num_hits
+        self.num_misses += len(results) - num_hits
+        return results
+
+    def write_many(self, keys: Sequence[bytes], embeddings: np.ndarray) -> None:
+        items = list(zip(keys, embeddings))
+        self._write(items)
+        self.num_writes += len(items)
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit/miss/write counters of this process and the hit rate."""
+        num_lookups = self.num_hits + self.num_misses
+        return {
+            "hits": self.num_hits,
+            "misses": self.num_misses,
+            "writes": self.num_writes,
+            "hit_rate": self.num_hits / num_lookups if num_lookups > 0 else 0.0,
+        }
+
+    def close(self) -> None:
+        pass
+
+
+class LRUEmbeddingCache(EmbeddingCacheBackend):
+    """
+    In-process embedding cache holding at most `max_entries` embeddings, evicting the least recently used ones.
+    """
+
+    def __init__(self, max_entries: Optional[int] = 100000, dtype: Literal["float16", "float32"] = "float32") -> None:
+        super().__init__()
+        self.max_entries = max_entries
+        self.dtype = dtype
+        self._data: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _read(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                embedding = self._data.get(key)
+                if embedding is not None:
+                    self._data.move_to_end(key)
+                    found[key] = embedding.astype(np.float32)
+        return found
+
+    def _write(self, items: List[Tuple[bytes, np.ndarray]]) -> None:
+        with self._lock:
+            for key, embedding in items:
+                self._data[key] = np.asarray(embedding, dtype=self.dtype)
+                self._data.move_to_end(key)
+            if self.max_entries is not None:
+                while len(self._data) > self.max_entries:
+                    self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class _SharedEmbeddingStore(LRUEmbeddingCache):
+    # Lives in the manager process; bulk methods keep each lookup to one round trip
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        return self._read(keys)
+
+    def set_many(self, items: List[Tuple[bytes, np.ndarray]]) -> None:
+        self._write(items)
+
+    def size(self) -> int:
+        return len(self)
+
+
+class _EmbeddingCacheManager(BaseManager):
+    pass
+
+
+_EmbeddingCacheManager.register("SharedEmbeddingStore", _SharedEmbeddingStore)
+
+
+class SharedEmbeddingCache(EmbeddingCacheBackend):
+    """
+    Embedding cache shared by the processes of one run through a manager process that holds an LRU store.
+
+    The manager is only started on first use. Worker processes share the cache when they are started (or handed
+    a pickled copy of this cache) after that first use; processes that start their own manager do not share it.
+    """
+
+    def __init__(self, max_entries: Optional[int] = 100000, dtype: Literal["float16", "float32"] = "float32") -> None:
+        super().__init__()
+        self.max_entries = max_entries
+        self.dtype = dtype
+        self._manager = None
+        self._store = None
+        self._lock = threading.Lock()
+
+    @property
+    def store(self):
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._manager = _EmbeddingCacheManager()
+                    self._manager.start()
+                    self._store = self._manager.SharedEmbeddingStore(self.max_entries, self.dtype)
+                    logger.info(f"Started shared embedding cache manager (pid {self._manager._process.pid})")
+        return self._store
+
+    def _read(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        return self.store.get_many(keys)
+
+    def _write(self, items: List[Tuple[bytes, np.ndarray]]) -> None:
+        self.store.set_many([(key, np.asarray(embedding, dtype=self.dtype)) for key, embedding in items])
+
+    def clear(self) -> None:
+        self.store.clear()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._manager is not None:
+                self._manager.shutdown()
+            self._manager, self._store = None, None
+
+    def __getstate__(self):
+        # The store proxy travels to other processes, the manager handle stays with its owner
+        state = self.__dict__.copy()
+        state["_lock"], state["_manager"] = None, None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class EmbeddingDiskCache(EmbeddingCacheBackend):
+    """
+    SQLite-backed embedding cache shared by all embedding models.
+
+    Entries are keyed on (model, instruction, text) and hold the raw float16 or float32 bytes of the vector.
+    A batch is looked up with a few `IN (...)` queries rather than one query per text. Like `LLMCache`, one
+    connection is kept per instance and guarded by a thread lock, and cross-process concurrency is left to
+    SQLite's WAL journal. The connection is opened on first use, and again in a forked child process.
+    """
+
+    # SQLite builds before 3.32 allow at most 999 bound parameters per statement.
+    MAX_QUERY_PARAMS = 900
+
+    def __init__(self, cache_filepath: str, dtype: Literal["float16", "float32"] = "float32") -> None:
+        """
+        Args:
+            cache_filepath (str): Path to the SQLite file, created on first use if missing.
+            dtype (Literal["float16", "float32"]): Precision new embeddings are stored in. Entries are read back
+                in the precision they were written in and returned as float32.
+        """
+        assert dtype in ("float16", "float32"), f"Unsupported embedding cache dtype: {dtype}"
+        super().__init__()
+        self.cache_filepath = cache_filepath
+        self.dtype = dtype
+
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections must not be shared across a fork, so a child process opens its own.
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_filepath)), exist_ok=True)
+            self._conn = sqlite3.connect(self.cache_filepath, check_same_thread=False, timeout=60)
+            self._pid = os.getpid()
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key BLOB PRIMARY KEY,
+                    dtype TEXT,
+                    embedding BLOB
+                ) WITHOUT ROWID
+            """)
+            self._conn.commit()
+        return self._conn
+
+    def _read(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        found = {}
+        with self._lock:
+            conn = self._connection()
+            for start in range(0, len(keys), self.MAX_QUERY_PARAMS):
+                batch_keys = keys[start:start + self.MAX_QUERY_PARAMS]
+                placeholders = ",".join("?" * len(batch_keys))
+                rows = conn.execute(f"SELECT key, dtype, embedding FROM embeddings WHERE key IN ({placeholders})",
+                                    batch_keys).fetchall()
+                for key, dtype, embedding in rows:
+                    found[key] = np.frombuffer(embedding, dtype=dtype).astype(np.float32)
+        return found
+
+    def _write(self, items: List[Tuple[bytes, np.ndarray]]) -> None:
+        rows = [(key, self.dtype, sqlite3.Binary(np.ascontiguousarray(embedding, dtype=self.dtype).tobytes()))
+                for key, embedding in items]
+        with self._lock:
+            conn = self._connection()
+            conn.executemany("INSERT OR REPLACE INTO embeddings (key, dtype, embedding) VALUES (?, ?, ?)", rows)
+            conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM embeddings")
+            conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def __getstate__(self):
+        # Pickled copies (e.g. sent to worker processes) reopen the file themselves.
+        state = self.__dict__.copy()
+        state["_lock"], state["_conn"], state["_pid"] = None, None, None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+def make_embedding_cache(backend: Literal["lru", "shared", "disk"],
+                         cache_filepath: Optional[str] = None,
+                         dtype: Literal["float16", "float32"] = "float32",
+                         max_entries: Optional[int] = 100000) -> EmbeddingCacheBackend:
+    """
+    Creates an embedding cache backend. None of them starts a process or opens a file before its first lookup.
+
+    Args:
+        backend (Literal["lru", "shared", "disk"]): `lru` keeps embeddings in this process, `shared` in a manager
+            process shared with worker processes, `disk` in the SQLite file `cache_filepath` across runs.
+        cache_filepath (Optional[str]): SQLite file of the `disk` backend.
+        dtype (Literal["float16", "float32"]): Precision embeddings are stored in.
+        max_entries (Optional[int]): Max number of embeddings of the in-memory backends. None means unbounded.
+    """
+    if backend == "lru":
+        return LRUEmbeddingCache(max_entries=max_entries, dtype=dtype)
+    if backend == "shared":
+        return SharedEmbeddingCache(max_entries=max_entries, dtype=dtype)
+    if backend == "disk":
+        assert cache_filepath is not None, "The disk embedding cache needs a cache_filepath"
+        return EmbeddingDiskCache(cache_filepath, dtype=dtype)
+    raise ValueError(f"Unknown embedding cache backend: {backend}")
+
+
+# `batch_encode` arguments that do not change the returned vectors, left out of cache keys (the instruction has its own key part)
+KEY_NEUTRAL_KWARGS = {"instruction", "batch_size"}
+
+
+def call_cache_namespace(model, kwargs: Dict[str, Any]) -> str:
+    """
+    The model component of cache keys for a `batch_encode` call: the model's `embedding_cache_namespace`, extended
+    with the call's arguments that change the vectors (e.g. `norm`, `max_length`) and differ from the model's defaults.
+    """
+    namespace = model.embedding_cache_namespace()
+    embedding_config = getattr(model, "embedding_config", None)
+    defaults = {}
+    if embedding_config is not None:
+        if "encode_params" in embedding_config:
+            defaults.update(embedding_config["encode_params"])
+        if "norm" in embedding_config:
+            defaults["norm"] = embedding_config["norm"]
+
+    shaping_kwargs = {key: value for key, value in kwargs.items()
+                      if key not in KEY_NEUTRAL_KWARGS and not (key in defaults and defaults[key] == value)}
+    if not shaping_kwargs:
+        return namespace
+    return f"{namespace}|{json.dumps(shaping_kwargs, sort_keys=True, default=str)}"
+
+
+def cache_embeddings(batch_encode):
+    """
+    Wraps the `batch_encode` of a `BaseEmbeddingModel` so texts found in its `embedding_cache` are not encoded
+    again. Only the misses, deduplicated, reach the wrapped method; their embeddings are written back to the cache.
+    Keys cover the model, the instruction, the text and any other argument that changes the vectors.
+    """
+    @functools.wraps(batch_encode)
+    def wrapper(self, texts: List[str], **kwargs) -> Any:
+        cache = self.embedding_cache
+        if cache is None:
+            return batch_encode(self, texts, **kwargs)
+        if isinstance(texts, str):
+            texts = [texts]
+        if len(texts) == 0:
+            return batch_encode(self, texts, **kwargs)
+
+        namespace = call_cache_namespace(self, kwargs)
+        instruction = kwargs.get("instruction")
+        keys = [cache.make_key(namespace, instruction, text) for text in texts]
+        embeddings = cache.read_many(keys)
+
+        missing = {}
+        for idx, (key, embedding) in enumerate(zip(keys, embeddings)):
+            if embedding is None and key not in missing:
+                missing[key] = idx
+
+        if missing:
+            logger.debug(f"Embedding cache: {len(texts) - len(missing)} of {len(texts)} texts cached, encoding the rest")
+            new_embeddings = np.asarray(batch_encode(self, [texts[idx] for idx in missing.values()], **kwargs), dtype=np.float32)
+            cache.write_many(list(missing), new_embeddings)
+            encoded = dict(zip(missing, new_embeddings))
+            embeddings = [embedding if embedding is not None else encoded[key] for key, embedding in zip(keys, embeddings)]
+
+        return np.stack(embeddings)
+
+    return wrapper
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded, dict-like cache of query embeddings, e.g. `HippoRAG.query_to_embedding`, for long-running retrieval services.
+
+    At most `max_entries` queries are kept in memory, evicting the least recently used ones, and entries older than
+    `ttl_seconds` are dropped on lookup. With a `disk_cache`, every embedding is also written to SQLite and looked up
+    there on a memory miss, so embeddings survive restarts. Entries are keyed on `namespace` as well, which callers
+    set to whatever changes the embeddings (model, instruction, projection); changing it empties the memory tier.
+
+    Membership tests are what callers use to decide whether a query has to be encoded, so `in` drives the hit and miss
+    counters of `stats`, while `get` and `[]` do not count.
+    """
+
+    def __init__(self, max_entries: Optional[int] = 100000, ttl_seconds: Optional[float] = None,
+                 disk_cache: Optional[EmbeddingDiskCache] = None, namespace: str = "") -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_cache = disk_cache
+        self.namespace = namespace
+        self._data: "OrderedDict[str, Tuple[float, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_evictions = 0
+        self.num_expirations = 0
+
+    def set_namespace(self, namespace: str) -> None:
+        if namespace != self.namespace:
+            with self._lock:
+                self._data.clear()
+            self.namespace = namespace
+
+    def _disk_key(self, query: str) -> bytes:
+        return EmbeddingCacheBackend.make_key(self.namespace, None, query)
+
+    def _insert(self, items: List[Tuple[str, np.ndarray]]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for query, embedding in items:
+                self._data[query] = (now, embedding)
+                self._data.move_to_end(query)
+            if self.max_entries is not None:
+                while len(self._data) > self.max_entries:
+                    self._data.popitem(last=False)
+                    self.num_evictions += 1
+
+    def _lookup(self, query: str) -> Optional[np.ndarray]:
+        with self._lock:
+            entry = self._data.get(query)
+            if entry is not None:
+                inserted_at, embedding = entry
+                if self.ttl_seconds is not None and time.monotonic() - inserted_at > self.ttl_seconds:
+                    del self._data[query]
+                    self.num_expirations += 1
+                else:
+                    self._data.move_to_end(query)
+                    return embedding
+
+        if self.disk_cache is not None:
+            embedding = self.disk_cache.read_many([self._disk_key(query)])[0]
+            if embedding is not None:
+                self._insert([(query, embedding)])
+                return embedding
+        return None
+
+    def __contains__(self, query: str) -> bool:
+        found = self._lookup(query) is not None
+        if found:
+            self.num_hits += 1
+        else:
+            self.num_misses += 1
+        return found
+
+    def get(self, query: str, default: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        embedding = self._lookup(query)
+        return default if embedding is None else embedding
+
+    def __getitem__(self, query: str) -> np.ndarray:
+        embedding = self._lookup(query)
+        if embedding is None:
+            raise KeyError(query)
+        return embedding
+
+    def __setitem__(self, query: str, embedding: np.ndarray) -> None:
+        self.update([(query, embedding)])
+
+    def update(self, items) -> None:
+        """Adds (query, embedding) pairs or a mapping, writing them to the disk tier in one transaction."""
+        items = list(items.items() if hasattr(items, "items") else items)
+        if len(items) == 0:
+            return
+        self._insert(items)
+        if self.disk_cache is not None:
+            self.disk_cache.write_many([self._disk_key(query) for query, _ in items],
+                                       np.stack([np.asarray(embedding, dtype=np.float32).reshape(-1) for _, embedding in items]))
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self) -> None:
+        """Empties the memory tier; the disk tier is kept, as its entries are still valid for their namespace."""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        num_lookups = self.num_hits + self.num_misses
+        return {
+            "size": len(self._data),
+            "hits": self.num_hits,
+            "misses": self.num_misses,
+            "hit_rate": self.num_hits / num_lookups if num_lookups > 0 else 0.0,
+            "evictions": self.num_evictions,
+            "expirations": self.num_expirations,
+        }
@@ -0,0 +1,135 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from tqdm import tqdm
+
+from ..utils.logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+# Per-process embedding model of data-parallel encoding workers, loaded once per worker
+_worker_model = None
+
+
+def _available_cores() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def core_subsets(num_workers: int, cores_per_worker: Optional[int] = None) -> List[List[int]]:
+    """
+    Splits the cores this process may run on into one contiguous subset per worker. Without `cores_per_worker`,
+    the cores are shared out evenly; subsets wrap around when more cores are asked for than available.
+    """
+    cores = _available_cores()
+    cores_per_worker = cores_per_worker or max(1, len(cores) // num_workers)
+    return [[cores[(worker_idx * cores_per_worker + offset) % len(cores)] for offset in range(cores_per_worker)]
+            for worker_idx in range(num_workers)]
+
+
+def _init_worker(model_class, global_config, embedding_model_name: str, core_queue):
+    global _worker_model
+    # Workers are for CPU encoding, a GPU is left to the parent process. CUDA is initialized lazily, so this still
+    # applies after torch was imported
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
+    cores = core_queue.get()
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    # torch was already imported while unpickling the initargs, so OMP/MKL environment variables would come too
+    # late here; its intra-op thread pool is sized directly instead
+    try:
+        import torch
+        torch.set_num_threads(len(cores))
+    except ImportError:
+        pass
+
+    # ONNX Runtime sizes its own thread pool, which must not exceed the cores of this worker either
+    global_config = replace(global_config, embedding_onnx_num_threads=len(cores))
+    _worker_model = model_class(global_config=global_config, embedding_model_name=embedding_model_name)
+    logger.debug(f"Data-parallel embedding worker {os.getpid()} pinned to cores {cores}")
+
+
+def _encode_shard_in_worker(texts: List[str], kwargs: Dict[str, Any]) -> np.ndarray:
+    return np.asarray(_worker_model.batch_encode(texts, **kwargs), dtype=np.float32)
+
+
+class DataParallelEncoder:
+    """
+    Encodes texts with `num_workers` processes, each pinned to its own subset of cores and holding its own copy of
+    the embedding model, for CPU indexing with local models.
+
+    Inputs are cut into shards of `shard_size` texts that are handed out to the workers as they become free, at most
+    two per worker in flight, and `imap` yields the encoded shards back in input order. Workers are started with
+    `spawn` on first use and kept until `close`, so models are only loaded once per indexing run.
+
+    `spawn` starts every worker by importing the user's main module, so scripts that index with more than one
+    embedding worker must keep their entry point under an `if __name__ == "__main__":` guard.
+    """
+
+    def __init__(self, model_class, global_config, embedding_model_name: str, num_workers: int,
+                 cores_per_worker: Optional[int] = None, shard_size: int = 2048):
+        self.model_class = model_class
+        self.global_config = global_config
+        self.embedding_model_name = embedding_model_name
+        self.num_workers = num_workers
+        self.core_subsets = core_subsets(num_workers, cores_per_worker)
+        self.shard_size = shard_size
+        self._executor = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Forking a process that already holds a model and its thread pools is unsafe
+            mp_context = multiprocessing.get_context("spawn")
+            core_queue = mp_context.Queue()
+            for cores in self.core_subsets:
+                core_queue.put(cores)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.num_workers, mp_context=mp_context, initializer=_init_worker,
+                initargs=(self.model_class, self.global_config, self.embedding_model_name, core_queue))
+            logger.info(f"Started {self.num_workers} data-parallel embedding workers for {self.embedding_model_name} "
+                        f"with {len(self.core_subsets[0])} cores each")
+        return self._executor
+
+    def imap(self, texts: List[str], **kwargs) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Yields (start index, embeddings) of consecutive shards of `texts`, in order. `kwargs` go to `batch_encode`.
+        """
+        executor = self.executor
+        pending = deque()
+        pbar = tqdm(total=len(texts), desc="Data-parallel Encoding")
+        for start in range(0, len(texts), self.shard_size):
+            pending.append((start, executor.submit(_encode_shard_in_worker, texts[start:start + self.shard_size], kwargs)))
+            if len(pending) >= 2 * self.num_workers:
+                shard_start, future = pending.popleft()
+                embeddings = future.result()
+                pbar.update(len(embeddings))
+                yield shard_start, embeddings
+        while pending:
+            shard_start, future = pending.popleft()
+            embeddings = future.result()
+            pbar.update(len(embeddings))
+            yield shard_start, embeddings
+        pbar.close()
+
+    def close(self):
+        """
+        Shuts the workers down, freeing their model copies. They are started again by the next `imap`.
+        """
+        if self._executor is not None:
+            logger.info(f"Stopping {self.num_workers} data-parallel embedding workers for {self.embedding_model_name}")
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
@@ -1,3 +1,4 @@
+import io
 import numpy as np
 from tqdm import tqdm
 import os
@@ -9,11 +10,14 @@ import json
 from datetime import datetime
 
 from .utils.misc_utils import compute_mdhash_id, NerRawOutput, TripleRawOutput
+from .utils.projection_utils import EmbeddingProjector
 
 logger = logging.getLogger(__name__)
 
 class EmbeddingStore:
-    def __init__(self, embedding_model, db_filename, batch_size, namespace):
+    def __init__(self, embedding_model, db_filename, batch_size, namespace,
+                 projection: Optional[Literal["pca", "truncate"]] = None, projection_dim: Optional[int] = None,
+                 projection_max_fit_rows: int = 100000, memory_map: bool = False):
         """
         Initializes the class with necessary configurations and sets up the working directory.
 
@@ -22,6 +26,12 @@ class EmbeddingStore:
         db_filename: The directory path where data will be stored or retrieved.
         batch_size: The batch size used for processing.
         namespace: A unique identifier for data segregation.
+        projection: Optional dimensionality reduction ("pca" or "truncate") applied to retrieval embeddings.
+        projection_dim: The number of dimensions kept by the projection.
+        projection_max_fit_rows: The max number of stored vectors a PCA projection is fitted on.
+        memory_map: Whether to keep the embeddings in a float32 .npy file next to the parquet file, read through a
+            read-only memory map, instead of in process memory, e.g. when retrieval scores quantized copies of them.
+            `embeddings` is then the 2D memory-mapped matrix rather than a list of rows.
 
         Functionality:
         - Assigns the provided parameters to instance variables.
@@ -41,11 +51,31 @@ class EmbeddingStore:
         self.filename = os.path.join(
             db_filename, f"vdb_{self.namespace}.parquet"
         )
+        self.memory_map = memory_map
+        self.matrix_filename = os.path.join(db_filename, f"vdb_{self.namespace}_embeddings.npy")
+        # Memory-map mode: rows added, and rows kept by a deletion, since the matrix file was last written
+        self._pending_embeddings = []
+        self._kept_rows: Optional[np.ndarray] = None
         # 访问历史和元数据存储
         self.access_history_file = os.path.join(
             db_filename, f"access_history_{self.namespace}.json"
         )
         self.access_history = {}  # hash_id -> list of access events
+
+        # The parquet file keeps the full embeddings, the projection is persisted next to it
+        self.projection = projection
+        self.projection_dim = projection_dim
+        self.projection_max_fit_rows = projection_max_fit_rows
+        self.projector_file = os.path.join(db_filename, f"projection_{self.namespace}.npz")
+        self.projector: Optional[EmbeddingProjector] = None
+        if self.projection is not None and os.path.exists(self.projector_file):
+            projector = EmbeddingProjector.load(self.projector_file)
+            if projector.kind == self.projection and projector.dim == self.projection_dim:
+                self.projector = projector
+            else:
+                logger.info(f"Ignoring stored {projector.kind} projection to {projector.dim} dimensions of {self.namespace} embeddings, "
+                            f"{self.projection} to {self.projection_dim} dimensions is configured")
+
         self._load_data()
 
     def get_missing_string_hash_ids(self, texts: List[str]):
@@ -67,7 +97,7 @@ class EmbeddingStore:
 
         return {h: {"hash_id": h, "content": t} for h, t in zip(missing_ids, texts_to_encode)}
 
-    def insert_strings(self, texts: List[str]):
+    def insert_strings(self, texts: List[str], precomputed_embeddings: Optional[Dict[str, np.ndarray]] = None):
         nodes_dict = {}
 
         for text in texts:
@@ -92,14 +122,40 @@ class EmbeddingStore:
         # Prepare the texts to encode from the "content" field.
         texts_to_encode = [nodes_dict[hash_id]["content"] for hash_id in missing_ids]
 
-        missing_embeddings = self.embedding_model.batch_encode(texts_to_encode)
+        text_to_missing_id = dict(zip(texts_to_encode, missing_ids))
 
-        self._upsert(missing_ids, texts_to_encode, missing_embeddings)
+        # Texts whose embeddings were already computed elsewhere (e.g. during entity canonicalization) are not encoded again
+        precomputed_embeddings = precomputed_embeddings or {}
+        precomputed_texts = [text for text in texts_to_encode if text in precomputed_embeddings]
+        self._append([text_to_missing_id[text] for text in precomputed_texts], precomputed_texts,
+                     [precomputed_embeddings[text] for text in precomputed_texts])
+
+        # Encoded slices are appended as they come back, in order, possibly while data-parallel workers encode later ones
+        texts_to_compute = [text for text in texts_to_encode if text not in precomputed_embeddings]
+        if texts_to_compute:
+            for start, embeddings in self.embedding_model.iter_batch_encode(texts_to_compute):
+                slice_texts = texts_to_compute[start:start + len(embeddings)]
+                self._append([text_to_missing_id[text] for text in slice_texts], slice_texts, list(embeddings))
+
+        logger.info(f"Saving new records.")
+        self._save_data()
 
     def _load_data(self):
         if os.path.exists(self.filename):
-            df = pd.read_parquet(self.filename)
-            self.hash_ids, self.texts, self.embeddings = df["hash_id"].values.tolist(), df["content"].values.tolist(), df["embedding"].values.tolist()
+            if self.memory_map:
+                # Embeddings are read from the memory-mapped matrix when it is up to date, without loading them from parquet
+                df = pd.read_parquet(self.filename, columns=["hash_id", "content"])
+                self.hash_ids, self.texts = df["hash_id"].values.tolist(), df["content"].values.tolist()
+                if self._matrix_file_is_current(len(self.hash_ids)):
+                    self._map_matrix()
+                else:
+                    self.embeddings = np.empty((0, 0), dtype=np.float32)
+                    self._pending_embeddings = pd.read_parquet(self.filename, columns=["embedding"])["embedding"].values.tolist()
+                    self._sync_matrix()
+            else:
+                df = pd.read_parquet(self.filename)
+                self.hash_ids, self.texts, self.embeddings = df["hash_id"].values.tolist(), df["content"].values.tolist(), df["embedding"].values.tolist()
+            del df
             self.hash_id_to_idx = {h: idx for idx, h in enumerate(self.hash_ids)}
             self.hash_id_to_row = {
                 h: {"hash_id": h, "content": t}
@@ -110,31 +166,127 @@ class EmbeddingStore:
             assert len(self.hash_ids) == len(self.texts) == len(self.embeddings)
             logger.info(f"Loaded {len(self.hash_ids)} records from {self.filename}")
         else:
-            self.hash_ids, self.texts, self.embeddings = [], [], []
+            self.hash_ids, self.texts = [], []
+            self.embeddings = np.empty((0, 0), dtype=np.float32) if self.memory_map else []
             self.hash_id_to_idx, self.hash_id_to_row = {}, {}
         
         # 加载访问历史
         self._load_access_history()
 
     def _save_data(self):
+        if self.memory_map:
+            # Row views of the memory map, only held while the parquet file is written
+            saved_rows = range(len(self.embeddings)) if self._kept_rows is None else self._kept_rows
+            embeddings = [self.embeddings[idx] for idx in saved_rows] + self._pending_embeddings
+        else:
+            embeddings = self.embeddings
         data_to_save = pd.DataFrame({
             "hash_id": self.hash_ids,
             "content": self.texts,
-            "embedding": self.embeddings
+            "embedding": embeddings
         })
         data_to_save.to_parquet(self.filename, index=False)
-        self.hash_id_to_row = {h: {"hash_id": h, "content": t} for h, t, e in zip(self.hash_ids, self.texts, self.embeddings)}
+        del data_to_save, embeddings
+        if self.memory_map:
+            self._sync_matrix()
+        self.hash_id_to_row = {h: {"hash_id": h, "content": t} for h, t in zip(self.hash_ids, self.texts)}
         self.hash_id_to_idx = {h: idx for idx, h in enumerate(self.hash_ids)}
         self.hash_id_to_text = {h: self.texts[idx] for idx, h in enumerate(self.hash_ids)}
         self.text_to_hash_id = {self.texts[idx]: h for idx, h in enumerate(self.hash_ids)}
         self._save_access_history()
         logger.info(f"Saved {len(self.hash_ids)} records to {self.filename}")
 
-    def _upsert(self, hash_ids, texts, embeddings):
-        self.embeddings.extend(embeddings)
+    def _matrix_file_is_current(self, num_rows: int) -> bool:
+        # The matrix is synced after every parquet save, so an older one lags behind the parquet file
+        if not os.path.exists(self.matrix_filename) or os.path.getmtime(self.matrix_filename) < os.path.getmtime(self.filename):
+            return False
+        return np.load(self.matrix_filename, mmap_mode="r").shape[0] == num_rows
+
+    def _map_matrix(self):
+        # Only rows that are read get paged in, as page cache the OS can reclaim
+        self.embeddings = np.load(self.matrix_filename, mmap_mode="r")
+
+    def _sync_matrix(self, block_size: int = 4096):
+        """
+        Brings the memory-mapped matrix in line with the rows just saved to parquet. Added rows are appended to the
+        end of the file; it is only rewritten when rows were deleted or its header cannot grow in place.
+        """
+        pending, self._pending_embeddings = self._pending_embeddings, []
+        kept_rows, self._kept_rows = self._kept_rows, None
+        if kept_rows is None and not pending:
+            if os.path.exists(self.matrix_filename):
+                # Unchanged rows, the matrix is only marked as matching the parquet file just written
+                os.utime(self.matrix_filename)
+            return
+        if kept_rows is None and len(self.embeddings) > 0 and self._append_to_matrix(pending):
+            return
+
+        old_matrix = self.embeddings
+        saved_rows = np.arange(len(old_matrix)) if kept_rows is None else kept_rows
+        num_rows = len(saved_rows) + len(pending)
+        # The old mapping is dropped before its file is replaced or removed
+        self.embeddings = np.empty((0, 0), dtype=np.float32)
+        if num_rows == 0:
+            del old_matrix
+            if os.path.exists(self.matrix_filename):
+                os.remove(self.matrix_filename)
+            return
+
+        dim = old_matrix.shape[1] if len(saved_rows) > 0 else len(pending[0])
+        tmp_filename = self.matrix_filename + ".tmp.npy"
+        matrix = np.lib.format.open_memmap(tmp_filename, mode="w+", dtype=np.float32, shape=(num_rows, dim))
+        for start in range(0, len(saved_rows), block_size):
+            matrix[start:start + block_size] = old_matrix[saved_rows[start:start + block_size]]
+        for start in range(0, len(pending), block_size):
+            matrix[len(saved_rows) + start:len(saved_rows) + start + block_size] = \
+                np.asarray(pending[start:start + block_size], dtype=np.float32)
+        matrix.flush()
+        del matrix, old_matrix
+        os.replace(tmp_filename, self.matrix_filename)
+        self._map_matrix()
+
+    def _append_to_matrix(self, rows) -> bool:
+        """
+        Writes `rows` after the last row of the matrix file and rewrites the row count in its header, which numpy
+        pads so the shape can grow in place. Returns False, leaving the file as it is, if the new header does not fit.
+        """
+        num_rows, dim = self.embeddings.shape
+        rows = np.ascontiguousarray(rows, dtype=np.float32)
+        if rows.ndim != 2 or rows.shape[1] != dim:
+            return False
+        with open(self.matrix_filename, "rb") as f:
+            version = np.lib.format.read_magic(f)
+            (np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0)(f)
+            data_offset = f.tell()
+        header = io.BytesIO()
+        header_info = {"descr": np.lib.format.dtype_to_descr(np.dtype(np.float32)), "fortran_order": False,
+                       "shape": (num_rows + len(rows), dim)}
+        (np.lib.format.write_array_header_1_0 if version == (1, 0) else np.lib.format.write_array_header_2_0)(header, header_info)
+        if len(header.getvalue()) != data_offset:
+            return False
+
+        # The old mapping is dropped before the file grows; the rows go first so a crash leaves the old row count
+        self.embeddings = np.empty((0, 0), dtype=np.float32)
+        with open(self.matrix_filename, "r+b") as f:
+            f.seek(data_offset + num_rows * dim * rows.itemsize)
+            f.write(rows.tobytes())
+            f.seek(0)
+            f.write(header.getvalue())
+        self._map_matrix()
+        return True
+
+    def _append(self, hash_ids, texts, embeddings):
+        if self.memory_map:
+            # Added to the memory-mapped matrix by the next `_save_data`
+            self._pending_embeddings.extend(embeddings)
+        else:
+            self.embeddings.extend(embeddings)
         self.hash_ids.extend(hash_ids)
         self.texts.extend(texts)
 
+    def _upsert(self, hash_ids, texts, embeddings):
+        self._append(hash_ids, texts, embeddings)
+
         logger.info(f"Saving new records.")
         self._save_data()
 
@@ -145,12 +297,16 @@ class EmbeddingStore:
             indices.append(self.hash_id_to_idx[hash])
 
         sorted_indices = np.sort(indices)[::-1]
+        if self.memory_map:
+            # The memory-mapped matrix is rewritten without the deleted rows by `_save_data`
+            self._kept_rows = np.setdiff1d(np.arange(len(self.hash_ids)), indices)
 
         for idx in sorted_indices:
             hash_id = self.hash_ids[idx]
             self.hash_ids.pop(idx)
             self.texts.pop(idx)
-            self.embeddings.pop(idx)
+            if not self.memory_map:
+                self.embeddings.pop(idx)
             # 删除对应的访问历史
             if hash_id in self.access_history:
                 del self.access_history[hash_id]
@@ -188,11 +344,65 @@ class EmbeddingStore:
         if not hash_ids:
             return []
 
-        indices = np.array([self.hash_id_to_idx[h] for h in hash_ids], dtype=np.intp)
-        embeddings = np.array(self.embeddings, dtype=dtype)[indices]
+        # Only the requested rows are copied, not the whole store
+        embeddings = self._get_rows([self.hash_id_to_idx[h] for h in hash_ids], dtype=dtype)
 
         return embeddings
+
+    def _get_rows(self, idxs, dtype=np.float32) -> np.ndarray:
+        if self.memory_map:
+            # One gather from the memory-mapped matrix, which pages in just these rows
+            return np.asarray(self.embeddings[np.asarray(idxs, dtype=np.int64)], dtype=dtype)
+        return np.array([self.embeddings[idx] for idx in idxs], dtype=dtype)
     
+    def _ensure_projector(self, allow_refit: bool = True) -> Optional[EmbeddingProjector]:
+        """
+        Fits the configured projection on the stored vectors the first time it is needed, and refits a PCA projection
+        once the store has grown to twice the vectors it was fitted on, up to `projection_max_fit_rows` vectors.
+        """
+        if self.projection is None or len(self.embeddings) == 0:
+            return self.projector
+
+        needs_fit = self.projector is None or (
+            allow_refit and self.projection == "pca"
+            and self.projector.num_fit_rows < self.projection_max_fit_rows
+            and len(self.embeddings) >= 2 * self.projector.num_fit_rows)
+        if needs_fit:
+            num_rows = len(self.embeddings)
+            if self.projection == "pca" and num_rows > self.projection_max_fit_rows:
+                fit_idxs = np.sort(np.random.default_rng(0).choice(num_rows, self.projection_max_fit_rows, replace=False))
+            else:
+                fit_idxs = np.arange(num_rows)
+            fit_embeddings = self._get_rows(fit_idxs) \
+                if self.projection == "pca" else np.zeros((len(fit_idxs), 0), dtype=np.float32)
+            self.projector = EmbeddingProjector.fit(self.projection, self.projection_dim, fit_embeddings)
+            self.projector.save(self.projector_file)
+        return self.projector
+
+    def projection_fingerprint(self) -> str:
+        return self.projector.fingerprint if self.projector is not None else "none"
+
+    def project(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        Applies the projection of this store to query or corpus embeddings, leaving them unchanged without one.
+        """
+        projector = self._ensure_projector(allow_refit=False)
+        if projector is None:
+            return embeddings
+        return projector.transform(embeddings)
+
+    def get_retrieval_embeddings(self, hash_ids, dtype=np.float32) -> np.ndarray:
+        """
+        Returns the embeddings of `hash_ids` as they are scored at retrieval time, i.e. projected if a projection is configured.
+        """
+        if not hash_ids:
+            return []
+        projector = self._ensure_projector()
+        embeddings = self.get_embeddings(hash_ids, dtype=np.float32)
+        if projector is not None:
+            embeddings = projector.transform(embeddings)
+        return embeddings.astype(dtype, copy=False)
+
     def record_access(self, hash_id: str, query: str = None, query_embedding: np.ndarray = None, 
                       ranking_position: int = -1, similarity_score: float = None):
         """
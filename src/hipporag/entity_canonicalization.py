@@ -0,0 +1,198 @@
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .utils.logging_utils import get_logger
+from .utils.misc_utils import text_processing
+
+logger = get_logger(__name__)
+
+
+def _normalize_rows(vecs: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    return vecs / np.maximum(norms, 1e-12)
+
+
+class EntityCanonicalizer:
+    """
+    Maps surface variants of entities (e.g. "u s", "united states", "usa") to one canonical entity before
+    they reach the entity and fact embedding stores and the graph.
+
+    New entities are resolved in two stages:
+    1. An alias dictionary, a JSON file of alias to canonical name, both compared after `text_processing`.
+    2. Embedding similarity clustering: an entity whose embedding has a cosine similarity of at least
+       `sim_threshold` with an already stored entity, or with an earlier new entity, is mapped onto it.
+
+    Resolutions are kept in a lookup table persisted under `save_dir`, so every variant is only embedded once
+    and later ingests, retrieval preparation and deletion rewrite triples consistently. The normalized embeddings
+    of stored canonical entities are kept in a matrix that grows with the entity store, so each ingest only
+    normalizes the entities stored since the previous one.
+    """
+
+    def __init__(self, entity_embedding_store, save_dir: str, alias_path: Optional[str] = None,
+                 sim_threshold: Optional[float] = 0.95, block_size: int = 1024):
+        self.entity_embedding_store = entity_embedding_store
+        self.sim_threshold = sim_threshold
+        self.block_size = block_size
+
+        self.alias_to_canonical: Dict[str, str] = {}
+        if alias_path is not None:
+            with open(alias_path) as f:
+                aliases = json.load(f)
+            self.alias_to_canonical = {text_processing(alias): text_processing(canonical) for alias, canonical in aliases.items()}
+            logger.info(f"Loaded {len(self.alias_to_canonical)} entity aliases from {alias_path}")
+
+        # Normalized embeddings and texts of the canonical entities among the first `_num_indexed_rows` stored entities
+        self._canonical_embeddings = np.empty((0, 0), dtype=np.float32)
+        self._canonical_texts: List[str] = []
+        self._num_indexed_rows = 0
+        self._last_indexed_hash_id: Optional[str] = None
+
+        self.lookup_path = os.path.join(save_dir, "entity_canonical_lookup.json")
+        self.lookup: Dict[str, str] = {}
+        if os.path.exists(self.lookup_path):
+            with open(self.lookup_path) as f:
+                self.lookup = json.load(f)
+
+    def canonical(self, entity: str) -> str:
+        return self.lookup.get(entity, entity)
+
+    def resolve(self, entities: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Adds the given entities to the lookup table, resolving the ones seen for the first time.
+
+        Returns:
+            Dict[str, np.ndarray]: The embeddings computed for new canonical entities, so the entity embedding
+            store can insert them without encoding them again.
+        """
+        new_entities = [entity for entity in dict.fromkeys(entities) if entity not in self.lookup]
+        if len(new_entities) == 0:
+            return {}
+
+        unresolved = []
+        for entity in new_entities:
+            target = self.alias_to_canonical.get(entity)
+            if target is not None and target != entity:
+                self.lookup[entity] = self.lookup.setdefault(target, target)
+            else:
+                unresolved.append(entity)
+
+        precomputed_embeddings = {}
+        embedding_model = self.entity_embedding_store.embedding_model
+        if self.sim_threshold is not None and embedding_model is not None and len(unresolved) > 0:
+            raw_embeddings = np.array(embedding_model.batch_encode(unresolved), dtype=np.float32)
+            canonical_idxs = self._cluster(_normalize_rows(raw_embeddings))
+            for idx, (entity, canonical_idx) in enumerate(zip(unresolved, canonical_idxs)):
+                if isinstance(canonical_idx, str):
+                    self.lookup[entity] = canonical_idx
+                elif canonical_idx == idx:
+                    self.lookup[entity] = entity
+                    precomputed_embeddings[entity] = raw_embeddings[idx]
+                else:
+                    self.lookup[entity] = unresolved[canonical_idx]
+        else:
+            for entity in unresolved:
+                self.lookup[entity] = entity
+
+        num_merged = sum(1 for entity in new_entities if self.lookup[entity] != entity)
+        logger.info(f"Canonicalized {len(new_entities)} new entities, {num_merged} merged into existing or new canonical entities")
+        self.save()
+        return precomputed_embeddings
+
+    def _sync_canonical_embeddings(self) -> np.ndarray:
+        """
+        Adds the canonical entities stored since the last call to the normalized embedding matrix and returns its
+        filled rows. The store only appends entities, unless it deleted some, in which case the matrix is rebuilt.
+        """
+        store = self.entity_embedding_store
+        hash_ids = store.hash_ids
+        if self._num_indexed_rows > 0 and (len(hash_ids) < self._num_indexed_rows
+                                           or hash_ids[self._num_indexed_rows - 1] != self._last_indexed_hash_id):
+            self._canonical_texts, self._num_indexed_rows = [], 0
+
+        new_hash_ids = hash_ids[self._num_indexed_rows:]
+        # Only canonical entities can absorb new variants
+        new_hash_ids = [hash_id for hash_id in new_hash_ids
+                        if self.canonical(store.hash_id_to_text[hash_id]) == store.hash_id_to_text[hash_id]]
+        if len(new_hash_ids) > 0:
+            new_embeddings = _normalize_rows(np.asarray(store.get_embeddings(new_hash_ids), dtype=np.float32))
+            num_rows = len(self._canonical_texts)
+            if num_rows + len(new_embeddings) > len(self._canonical_embeddings):
+                # Capacity doubles, so appending stays amortized linear in the number of new entities
+                grown = np.empty((max(2 * len(self._canonical_embeddings), num_rows + len(new_embeddings)),
+                                  new_embeddings.shape[1]), dtype=np.float32)
+                if num_rows > 0:
+                    grown[:num_rows] = self._canonical_embeddings[:num_rows]
+                self._canonical_embeddings = grown
+            self._canonical_embeddings[num_rows:num_rows + len(new_embeddings)] = new_embeddings
+            self._canonical_texts.extend(store.hash_id_to_text[hash_id] for hash_id in new_hash_ids)
+
+        self._num_indexed_rows = len(hash_ids)
+        self._last_indexed_hash_id = hash_ids[-1] if len(hash_ids) > 0 else None
+        return self._canonical_embeddings[:len(self._canonical_texts)]
+
+    def _cluster(self, embeddings: np.ndarray) -> List:
+        """
+        Greedy leader clustering: each embedding joins its most similar stored entity (returned by text) or earlier
+        new leader (returned by index) reaching `sim_threshold`, and otherwise leads a cluster itself (its own index).
+        """
+        stored_embeddings = self._sync_canonical_embeddings()
+        assignments: List = [None] * len(embeddings)
+
+        if len(stored_embeddings) > 0:
+            for start in range(0, len(embeddings), self.block_size):
+                sims = embeddings[start:start + self.block_size] @ stored_embeddings.T
+                best = sims.argmax(axis=1)
+                for offset, best_idx in enumerate(best):
+                    if sims[offset, best_idx] >= self.sim_threshold:
+                        assignments[start + offset] = self._canonical_texts[best_idx]
+
+        # New entities are compared with the leaders of earlier blocks in one matrix product per block, and with
+        # earlier leaders of their own block through the block's similarity matrix, which keeps the greedy order
+        leaders = np.empty_like(embeddings)
+        leader_idxs = []
+        pending_idxs = [idx for idx in range(len(embeddings)) if assignments[idx] is None]
+        for start in range(0, len(pending_idxs), self.block_size):
+            block_idxs = pending_idxs[start:start + self.block_size]
+            block = embeddings[block_idxs]
+            num_prev_leaders = len(leader_idxs)
+            if num_prev_leaders > 0:
+                prev_sims = block @ leaders[:num_prev_leaders].T
+                prev_best = prev_sims.argmax(axis=1)
+                prev_best_sims = prev_sims[np.arange(len(block)), prev_best]
+            block_sims = block @ block.T
+
+            block_leader_positions = []
+            for pos, idx in enumerate(block_idxs):
+                best_sim, best_leader = -np.inf, None
+                if num_prev_leaders > 0:
+                    best_sim, best_leader = prev_best_sims[pos], leader_idxs[prev_best[pos]]
+                if len(block_leader_positions) > 0:
+                    in_block_sims = block_sims[pos, block_leader_positions]
+                    in_block_best = int(in_block_sims.argmax())
+                    if in_block_sims[in_block_best] > best_sim:
+                        best_sim, best_leader = in_block_sims[in_block_best], block_idxs[block_leader_positions[in_block_best]]
+                if best_sim >= self.sim_threshold:
+                    assignments[idx] = best_leader
+                else:
+                    block_leader_positions.append(pos)
+                    assignments[idx] = idx
+
+            leaders[num_prev_leaders:num_prev_leaders + len(block_leader_positions)] = block[block_leader_positions]
+            leader_idxs.extend(block_idxs[pos] for pos in block_leader_positions)
+
+        return assignments
+
+    def rewrite(self, chunk_triples: List[List[List[str]]]) -> List[List[List[str]]]:
+        """
+        Replaces subjects and objects of normalized triples with their canonical entities.
+        """
+        lookup = self.lookup
+        return [[[lookup.get(t[0], t[0]), t[1], lookup.get(t[2], t[2])] if len(t) == 3 else t for t in triples]
+                for triples in chunk_triples]
+
+    def save(self):
+        with open(self.lookup_path, 'w') as f:
+            json.dump(self.lookup, f)
@@ -0,0 +1,148 @@
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Literal, Optional
+
+import numpy as np
+
+from ..utils.logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class StageMetrics:
+    """
+    Counters of one OpenIE stage (e.g. `ner`, `triples`, `ner_triples`) over a `batch_openie` call.
+    """
+    stage: str
+    num_requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    num_cache_hits: int = 0
+    num_truncated: int = 0
+    num_parse_failures: int = 0
+    num_request_failures: int = 0
+    latencies: List[float] = field(default_factory=list, repr=False)
+    start_time: float = field(default_factory=time.perf_counter, repr=False)
+    end_time: Optional[float] = field(default=None, repr=False)
+
+    def record(self, metadata: Dict[str, Any], num_parse_failures: int = 0):
+        """
+        Records one LLM request from the metadata returned along with its response. A packed request can fail to
+        parse for several of its chunks, a failed request without a response counts as a request failure instead.
+        """
+        self.num_requests += 1
+        self.prompt_tokens += metadata.get('prompt_tokens', 0)
+        self.completion_tokens += metadata.get('completion_tokens', 0)
+        if metadata.get('cache_hit'):
+            self.num_cache_hits += 1
+        if metadata.get('finish_reason') == 'length':
+            self.num_truncated += 1
+        if num_parse_failures:
+            self.num_parse_failures += num_parse_failures
+        elif 'error' in metadata:
+            self.num_request_failures += 1
+        if 'latency' in metadata:
+            self.latencies.append(metadata['latency'])
+        self.end_time = time.perf_counter()
+
+    def record_batch(self, metadata: Dict[str, Any], elapsed: float, num_parse_failures: int = 0):
+        """
+        Records an offline batch of `metadata['num_request']` requests, which only has batch-level totals.
+        """
+        self.num_requests += metadata.get('num_request', 0)
+        self.prompt_tokens += metadata.get('prompt_tokens', 0)
+        self.completion_tokens += metadata.get('completion_tokens', 0)
+        self.num_cache_hits += metadata.get('num_cache_hit', 0)
+        self.num_truncated += metadata.get('num_truncated', 0)
+        self.num_parse_failures += num_parse_failures
+        self.end_time = self.start_time + elapsed if self.end_time is None else self.end_time + elapsed
+
+    def postfix(self) -> Dict[str, int]:
+        # Running totals shown on the progress bars
+        return {'total_prompt_tokens': self.prompt_tokens, 'total_completion_tokens': self.completion_tokens,
+                'num_cache_hit': self.num_cache_hits}
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = max((self.end_time or time.perf_counter()) - self.start_time, 1e-9)
+        num_requests = max(self.num_requests, 1)
+        latencies = np.array(self.latencies) if self.latencies else None
+        return {
+            'num_requests': self.num_requests,
+            'elapsed_seconds': elapsed,
+            'requests_per_second': self.num_requests / elapsed,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'prompt_tokens_per_second': self.prompt_tokens / elapsed,
+            'completion_tokens_per_second': self.completion_tokens / elapsed,
+            'latency_p50_seconds': float(np.percentile(latencies, 50)) if latencies is not None else None,
+            'latency_p95_seconds': float(np.percentile(latencies, 95)) if latencies is not None else None,
+            'num_cache_hits': self.num_cache_hits,
+            'cache_hit_rate': self.num_cache_hits / num_requests,
+            'num_truncated': self.num_truncated,
+            'truncation_rate': self.num_truncated / num_requests,
+            'num_parse_failures': self.num_parse_failures,
+            'parse_failure_rate': self.num_parse_failures / num_requests,
+            'num_request_failures': self.num_request_failures,
+        }
+
+
+class OpenIEMetrics:
+    """
+    Per-stage throughput, latency, cache and failure metrics of one `batch_openie` call.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, StageMetrics] = {}
+
+    def stage(self, name: str) -> StageMetrics:
+        if name not in self.stages:
+            self.stages[name] = StageMetrics(stage=name)
+        return self.stages[name]
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        return {name: stage_metrics.summary() for name, stage_metrics in self.stages.items()}
+
+    def __str__(self) -> str:
+        lines = []
+        for name, stage_summary in self.summary().items():
+            latency = (f", p50/p95 latency {stage_summary['latency_p50_seconds']:.2f}s/{stage_summary['latency_p95_seconds']:.2f}s"
+                       if stage_summary['latency_p50_seconds'] is not None else "")
+            lines.append(f"{name}: {stage_summary['num_requests']} requests ({stage_summary['requests_per_second']:.2f}/s), "
+                         f"{stage_summary['prompt_tokens_per_second']:.0f} prompt and {stage_summary['completion_tokens_per_second']:.0f} completion tokens/s"
+                         f"{latency}, cache hit rate {stage_summary['cache_hit_rate']:.2%}, "
+                         f"{stage_summary['num_truncated']} truncated, {stage_summary['num_parse_failures']} parse failures")
+        return "\n".join(lines)
+
+
+class OpenIEMetricsSink:
+    """
+    Writes `OpenIEMetrics` after every `batch_openie` call, either appended as a JSON line or as a Prometheus
+    text exposition file (overwritten atomically, e.g. for the node exporter textfile collector).
+    """
+
+    def __init__(self, path: str, format: Literal["jsonl", "prometheus"] = "jsonl"):
+        assert format in ("jsonl", "prometheus"), f"Unknown OpenIE metrics format: {format}"
+        self.path = path
+        self.format = format
+
+    def write(self, metrics: OpenIEMetrics):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if self.format == "jsonl":
+            with open(self.path, 'a') as f:
+                f.write(json.dumps({'timestamp': datetime.now().isoformat(), 'stages': metrics.summary()}) + "\n")
+        else:
+            lines = []
+            for name, stage_summary in metrics.summary().items():
+                for key, value in stage_summary.items():
+                    if value is None:
+                        continue
+                    lines.append(f'hipporag_openie_{key}{{stage="{name}"}} {value}')
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(tmp_path, self.path)
+        logger.debug(f"OpenIE metrics written to {self.path}")
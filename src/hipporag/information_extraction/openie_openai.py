@@ -1,46 +1,136 @@
+import ast
 import json
+import os
 import re
+import time
 from dataclasses import dataclass
-from typing import Dict, Any, List, TypedDict, Tuple
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional, TypedDict, Tuple
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
 from tqdm import tqdm
 
 from ..prompts import PromptTemplateManager
+from ..prompts.templates.packed_ner_triple_extraction import packed_passage_frame
 from ..utils.logging_utils import get_logger
-from ..utils.llm_utils import fix_broken_generated_json, filter_invalid_triples
+from ..utils.llm_utils import fix_broken_generated_json, filter_invalid_triples, num_tokens_by_tiktoken
 from ..utils.misc_utils import TripleRawOutput, NerRawOutput
+from ..utils.typing import ChunkInfo
 from ..llm.openai_gpt import CacheOpenAI
+from .metrics import OpenIEMetrics, OpenIEMetricsSink
+from .result_store import OpenIEResultStore
 
 logger = get_logger(__name__)
 
 
-class ChunkInfo(TypedDict):
-    num_tokens: int
-    content: str
-    chunk_order: List[Tuple]
-    full_doc_ids: List[str]
-
-
 @dataclass
 class LLMInput:
     chunk_id: str
     input_message: List[Dict]
 
 
-def _extract_ner_from_response(real_response):
-    pattern = r'\{[^{}]*"named_entities"\s*:\s*\[[^\]]*\][^{}]*\}'
+def _extract_json_field(real_response: str, field: str) -> List:
+    """
+    Reads `field` from a JSON response. Schema-constrained responses are parsed with a single `json.loads`;
+    free-form ones fall back to locating the JSON object around `field` and parsing it literally.
+    """
+    try:
+        return json.loads(real_response)[field]
+    except (json.JSONDecodeError, KeyError, TypeError):
+        pass
+
+    pattern = r'\{[^{}]*"' + field + r'"\s*:\s*\[[^\]]*\][^{}]*\}'
     match = re.search(pattern, real_response, re.DOTALL)
     if match is None:
-        # If pattern doesn't match, return an empty list
+        # Raised so the response counts as a parse failure, callers fall back to an empty list
+        raise ValueError(f"No JSON object with a '{field}' list found in response")
+    try:
+        return json.loads(match.group())[field]
+    except json.JSONDecodeError:
+        return ast.literal_eval(match.group())[field]
+
+
+def _extract_ner_from_response(real_response):
+    return _extract_json_field(real_response, "named_entities")
+
+
+def _extract_packed_passages(real_response: str) -> List:
+    """
+    Reads the per-paragraph items of a response to the `packed_ner_triple_extraction` prompt.
+    Free-form responses are cut down to their outermost JSON object before parsing.
+    """
+    try:
+        return json.loads(real_response)["passages"]
+    except (json.JSONDecodeError, KeyError, TypeError):
+        pass
+
+    start, end = real_response.find('{'), real_response.rfind('}')
+    if start == -1 or end <= start:
+        return []
+    try:
+        return json.loads(real_response[start:end + 1])["passages"]
+    except (json.JSONDecodeError, KeyError, TypeError):
         return []
-    return eval(match.group())["named_entities"]
 
 
 class OpenIE:
-    def __init__(self, llm_model: CacheOpenAI):
+    def __init__(self, llm_model: CacheOpenAI, max_workers: Optional[int] = None, joint_extraction: bool = False,
+                 pack_token_budget: Optional[int] = None, result_store: Optional[OpenIEResultStore] = None,
+                 keep_raw_responses: bool = True, metrics_sink: Optional[OpenIEMetricsSink] = None):
         # Init prompt template manager
         self.prompt_template_manager = PromptTemplateManager(role_mapping={"system": "system", "user": "user", "assistant": "assistant"})
         self.llm_model = llm_model
+        # Max number of concurrent LLM requests across both OpenIE stages, None uses ThreadPoolExecutor's default
+        self.max_workers = max_workers
+        # Extract entities and triples with the single `ner_triple_extraction` prompt instead of two calls per chunk
+        self.joint_extraction = joint_extraction
+        # Passage token budget of one `packed_ner_triple_extraction` request, None sends one passage per request
+        self.pack_token_budget = pack_token_budget
+        # Finished chunks are streamed to this store as they complete, when given
+        self.result_store = result_store
+        # Drop raw responses once streamed, so only parsed entities and triples of the batch stay in memory
+        self.keep_raw_responses = keep_raw_responses
+        # Per-stage metrics of every `batch_openie` call are written to this sink, when given
+        self.metrics_sink = metrics_sink
+
+    def _record_result(self, passage: str, ner_output: NerRawOutput, triple_output: TripleRawOutput):
+        """
+        Streams a finished chunk to the result store and drops its raw responses from memory unless they are kept.
+        """
+        if self.result_store is not None:
+            self.result_store.append(passage, ner_output, triple_output)
+        if not self.keep_raw_responses:
+            ner_output.response = None
+            triple_output.response = None
+
+    def release(self):
+        """
+        Frees resources held for extraction. Online OpenIE shares its LLM client with QA, so there is nothing to free.
+        """
+        pass
+
+    @staticmethod
+    def _num_parse_failures(result) -> int:
+        # Errors raised after a response came back are parse failures, errors without one are failed requests
+        return int('error' in result.metadata and bool(result.response))
+
+    def _json_template_kwargs(self, json_template: str) -> Dict[str, str]:
+        # Only CacheOpenAI with llm_structured_output configured understands the json_template argument
+        if getattr(self.llm_model, "structured_output", None):
+            return {"json_template": json_template}
+        return {}
+
+    def _infer(self, messages: List[Dict], json_template: str) -> Tuple[str, Dict[str, Any]]:
+        """
+        Runs one LLM request, adding whether it was a cache hit and its wall-clock latency to the metadata.
+        """
+        start_time = time.perf_counter()
+        raw_response, metadata, cache_hit = self.llm_model.infer(
+            messages=messages,
+            **self._json_template_kwargs(json_template)
+        )
+        metadata['cache_hit'] = cache_hit
+        metadata['latency'] = time.perf_counter() - start_time
+        return raw_response, metadata
 
     def ner(self, chunk_key: str, passage: str) -> NerRawOutput:
         # PREPROCESSING
@@ -49,10 +139,7 @@ class OpenIE:
         metadata = {}
         try:
             # LLM INFERENCE
-            raw_response, metadata, cache_hit = self.llm_model.infer(
-                messages=ner_input_message,
-            )
-            metadata['cache_hit'] = cache_hit
+            raw_response, metadata = self._infer(ner_input_message, 'ner')
             if metadata['finish_reason'] == 'length':
                 real_response = fix_broken_generated_json(raw_response)
             else:
@@ -80,12 +167,7 @@ class OpenIE:
 
     def triple_extraction(self, chunk_key: str, passage: str, named_entities: List[str]) -> TripleRawOutput:
         def _extract_triples_from_response(real_response):
-            pattern = r'\{[^{}]*"triples"\s*:\s*\[[^\]]*\][^{}]*\}'
-            match = re.search(pattern, real_response, re.DOTALL)
-            if match is None:
-                # If pattern doesn't match, return an empty list
-                return []
-            return eval(match.group())["triples"]
+            return _extract_json_field(real_response, "triples")
 
         # PREPROCESSING
         messages = self.prompt_template_manager.render(
@@ -98,10 +180,7 @@ class OpenIE:
         metadata = {}
         try:
             # LLM INFERENCE
-            raw_response, metadata, cache_hit = self.llm_model.infer(
-                messages=messages,
-            )
-            metadata['cache_hit'] = cache_hit
+            raw_response, metadata = self._infer(messages, 'triples')
             if metadata['finish_reason'] == 'length':
                 real_response = fix_broken_generated_json(raw_response)
             else:
@@ -127,84 +206,400 @@ class OpenIE:
             triples=triplets
         )
 
+    def parse_joint_response(self, chunk_key: str, raw_response: str, metadata: Dict[str, Any]) -> Tuple[NerRawOutput, TripleRawOutput]:
+        """
+        Splits a response to the `ner_triple_extraction` prompt into the NER and triple extraction results of the chunk.
+        Both results share the response and its metadata since they come from the same LLM call.
+        """
+        try:
+            if metadata.get('finish_reason') == 'length':
+                real_response = fix_broken_generated_json(raw_response)
+            else:
+                real_response = raw_response
+            unique_entities = list(dict.fromkeys(_extract_json_field(real_response, "named_entities")))
+            triplets = filter_invalid_triples(triples=_extract_json_field(real_response, "triples"))
+        except Exception as e:
+            logger.warning(f"Exception for chunk {chunk_key}: {e}")
+            metadata.update({'error': str(e)})
+            unique_entities, triplets = [], []
+
+        return (NerRawOutput(chunk_id=chunk_key, response=raw_response, unique_entities=unique_entities, metadata=metadata),
+                TripleRawOutput(chunk_id=chunk_key, response=raw_response, metadata=metadata, triples=triplets))
+
+    def ner_triple_extraction(self, chunk_key: str, passage: str) -> Tuple[NerRawOutput, TripleRawOutput]:
+        """
+        Extracts named entities and triples of a passage with one LLM call, sending the passage once instead of twice.
+        """
+        messages = self.prompt_template_manager.render(name='ner_triple_extraction', passage=passage)
+
+        raw_response = ""
+        metadata = {}
+        try:
+            # LLM INFERENCE
+            raw_response, metadata = self._infer(messages, 'ner_triples')
+        except Exception as e:
+            logger.warning(f"Exception for chunk {chunk_key}: {e}")
+            metadata.update({'error': str(e)})
+            return (NerRawOutput(chunk_id=chunk_key, response=raw_response, unique_entities=[], metadata=metadata),
+                    TripleRawOutput(chunk_id=chunk_key, response=raw_response, metadata=metadata, triples=[]))
+
+        return self.parse_joint_response(chunk_key, raw_response, metadata)
+
+    def pack_passages(self, chunk_passages: Dict[str, str]) -> List[List[str]]:
+        """
+        Greedily groups chunk keys, in order, into packs whose passages add up to at most `pack_token_budget` tokens.
+        A passage longer than the budget forms a pack of its own.
+        """
+        packs, current_pack, current_tokens = [], [], 0
+        for chunk_key, passage in chunk_passages.items():
+            num_tokens = num_tokens_by_tiktoken(passage)
+            if current_pack and current_tokens + num_tokens > self.pack_token_budget:
+                packs.append(current_pack)
+                current_pack, current_tokens = [], 0
+            current_pack.append(chunk_key)
+            current_tokens += num_tokens
+        if current_pack:
+            packs.append(current_pack)
+        return packs
+
+    def render_packed_messages(self, passages: List[str]) -> List[Dict]:
+        packed_passages = "\n".join(
+            packed_passage_frame.format(passage_id=str(idx + 1), passage=passage) for idx, passage in enumerate(passages)
+        )
+        return self.prompt_template_manager.render(name='packed_ner_triple_extraction', packed_passages=packed_passages)
+
+    def parse_packed_response(self, chunk_keys: List[str], raw_response: str, metadata: Dict[str, Any]) -> Tuple[Dict[str, NerRawOutput], Dict[str, TripleRawOutput]]:
+        """
+        Splits a response to the `packed_ner_triple_extraction` prompt into per-chunk NER and triple extraction results,
+        matching paragraph ids "1".."n" back to `chunk_keys`.
+        Chunks without a usable item in the response (e.g. cut off by a truncated generation) are left out of the returned dicts.
+        """
+        if metadata.get('finish_reason') == 'length':
+            real_response = fix_broken_generated_json(raw_response)
+        else:
+            real_response = raw_response
+        try:
+            passages = _extract_packed_passages(real_response)
+        except Exception as e:
+            logger.warning(f"Exception for packed chunks {chunk_keys}: {e}")
+            passages = []
+
+        chunk_metadata = {**metadata, 'num_packed_chunks': len(chunk_keys)}
+        ner_results_dict, triple_results_dict = {}, {}
+        for item in passages if isinstance(passages, list) else []:
+            if not isinstance(item, dict):
+                continue
+            passage_id = str(item.get('id', '')).strip()
+            if not passage_id.isdigit() or not 1 <= int(passage_id) <= len(chunk_keys):
+                continue
+            chunk_key = chunk_keys[int(passage_id) - 1]
+            if chunk_key in ner_results_dict:
+                continue
+            try:
+                unique_entities = list(dict.fromkeys(item.get('named_entities') or []))
+                triplets = filter_invalid_triples(triples=item.get('triples') or [])
+            except Exception as e:
+                logger.warning(f"Exception for chunk {chunk_key}: {e}")
+                continue
+            ner_results_dict[chunk_key] = NerRawOutput(chunk_id=chunk_key, response=raw_response, unique_entities=unique_entities, metadata=chunk_metadata)
+            triple_results_dict[chunk_key] = TripleRawOutput(chunk_id=chunk_key, response=raw_response, metadata=chunk_metadata, triples=triplets)
+
+        return ner_results_dict, triple_results_dict
+
+    def packed_ner_triple_extraction(self, chunk_keys: List[str], passages: List[str]) -> Tuple[Dict[str, NerRawOutput], Dict[str, TripleRawOutput], Dict[str, Any]]:
+        """
+        Extracts named entities and triples of several passages with one LLM call, so the instructions and
+        few-shot demonstration are sent once per pack instead of once per passage.
+        Returns the results of the chunks found in the response along with the metadata of the call.
+        """
+        messages = self.render_packed_messages(passages)
+
+        metadata = {}
+        try:
+            # LLM INFERENCE
+            raw_response, metadata = self._infer(messages, 'packed_ner_triples')
+        except Exception as e:
+            logger.warning(f"Exception for packed chunks {chunk_keys}: {e}")
+            metadata.update({'error': str(e)})
+            return {}, {}, metadata
+
+        ner_results_dict, triple_results_dict = self.parse_packed_response(chunk_keys, raw_response, metadata)
+        return ner_results_dict, triple_results_dict, metadata
+
     def openie(self, chunk_key: str, passage: str) -> Dict[str, Any]:
+        if self.joint_extraction:
+            ner_output, triple_output = self.ner_triple_extraction(chunk_key=chunk_key, passage=passage)
+            return {"ner": ner_output, "triplets": triple_output}
+
         ner_output = self.ner(chunk_key=chunk_key, passage=passage)
         triple_output = self.triple_extraction(chunk_key=chunk_key, passage=passage, named_entities=ner_output.unique_entities)
         return {"ner": ner_output, "triplets": triple_output}
 
-    def batch_openie(self, chunks: Dict[str, ChunkInfo]) -> Tuple[Dict[str, NerRawOutput], Dict[str, TripleRawOutput]]:
+    def batch_openie(self, chunks: Dict[str, ChunkInfo], return_metrics: bool = False) -> Tuple:
         """
         Conduct batch OpenIE synchronously using multi-threading which includes NER and triple extraction.
 
+        Both stages share one bounded thread pool and are pipelined per chunk: a chunk's triple extraction is
+        scheduled as soon as its own NER finishes, and ready triple extractions take free workers before any
+        remaining NER request, so a slow NER call only delays its own chunk.
+
+        Per-stage throughput, latency, cache hit, truncation and parse failure metrics are logged at the end,
+        and written to `metrics_sink` if one is set.
+
         Args:
             chunks (Dict[str, ChunkInfo]): chunks to be incorporated into graph. Each key is a hashed chunk 
             and the corresponding value is the chunk info to insert.
+            return_metrics (bool): Whether to also return the `OpenIEMetrics` of this call.
 
         Returns:
             Tuple[Dict[str, NerRawOutput], Dict[str, TripleRawOutput]]:
                 - A dict with keys as the chunk ids and values as the NER result instances.
                 - A dict with keys as the chunk ids and values as the triple extraction result instances.
+                - The `OpenIEMetrics` of this call, only if `return_metrics` is set.
         """
 
         # Extract passages from the provided chunks
         chunk_passages = {chunk_key: chunk["content"] for chunk_key, chunk in chunks.items()}
 
-        ner_results_list = []
-        total_prompt_tokens = 0
-        total_completion_tokens = 0
-        num_cache_hit = 0
+        metrics = OpenIEMetrics()
+        ner_results_dict, triple_results_dict = self._run_batch_openie(chunk_passages, metrics)
+
+        if metrics.stages:
+            logger.info(f"OpenIE metrics:\n{metrics}")
+        if self.metrics_sink is not None:
+            self.metrics_sink.write(metrics)
+
+        if return_metrics:
+            return ner_results_dict, triple_results_dict, metrics
+        return ner_results_dict, triple_results_dict
+
+    def _run_batch_openie(self, chunk_passages: Dict[str, str], metrics: OpenIEMetrics) -> Tuple[Dict[str, NerRawOutput], Dict[str, TripleRawOutput]]:
+        if self.pack_token_budget:
+            return self._batch_packed_openie(chunk_passages, metrics)
+        if self.joint_extraction:
+            return self._batch_joint_openie(chunk_passages, metrics)
+        return self._batch_pipelined_openie(chunk_passages, metrics)
+
+    def _batch_pipelined_openie(self, chunk_passages: Dict[str, str], metrics: OpenIEMetrics) -> Tuple[Dict[str, NerRawOutput], Dict[str, TripleRawOutput]]:
+
+        ner_results_dict = {}
+        triple_results_dict = {}
+        # Create both stages up front so their throughput is measured from the start of the batch
+        for stage in ('ner', 'triples'):
+            metrics.stage(stage)
+
+        max_workers = self.max_workers or min(32, (os.cpu_count() or 1) + 4)
+        ner_queue = deque(chunk_passages.keys())
+        triple_queue = deque()  # chunk keys whose NER is done and whose triple extraction is not submitted yet
+        in_flight = {}
 
-        with ThreadPoolExecutor() as executor:
-            # Create NER futures for each chunk
-            ner_futures = {
-                executor.submit(self.ner, chunk_key, passage): chunk_key
+        ner_pbar = tqdm(total=len(chunk_passages), desc="NER")
+        triple_pbar = tqdm(total=len(chunk_passages), desc="Extracting triples")
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+            def fill_workers():
+                while len(in_flight) < max_workers and (triple_queue or ner_queue):
+                    if triple_queue:
+                        chunk_key = triple_queue.popleft()
+                        future = executor.submit(self.triple_extraction, chunk_key, chunk_passages[chunk_key],
+                                                 ner_results_dict[chunk_key].unique_entities)
+                        in_flight[future] = ('triples', chunk_key)
+                    else:
+                        chunk_key = ner_queue.popleft()
+                        future = executor.submit(self.ner, chunk_key, chunk_passages[chunk_key])
+                        in_flight[future] = ('ner', chunk_key)
+
+            fill_workers()
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, chunk_key = in_flight.pop(future)
+                    result = future.result()
+
+                    # Update metrics based on the metadata from the result
+                    stats = metrics.stage(stage)
+                    stats.record(result.metadata, num_parse_failures=self._num_parse_failures(result))
+
+                    if stage == 'ner':
+                        ner_results_dict[chunk_key] = result
+                        triple_queue.append(chunk_key)
+                        pbar = ner_pbar
+                    else:
+                        triple_results_dict[chunk_key] = result
+                        self._record_result(chunk_passages[chunk_key], ner_results_dict[chunk_key], result)
+                        pbar = triple_pbar
+                    pbar.update(1)
+                    pbar.set_postfix(stats.postfix())
+
+                fill_workers()
+
+        ner_pbar.close()
+        triple_pbar.close()
+
+        return ner_results_dict, triple_results_dict
+
+    def _batch_joint_openie(self, chunk_passages: Dict[str, str], metrics: OpenIEMetrics) -> Tuple[Dict[str, NerRawOutput], Dict[str, TripleRawOutput]]:
+        ner_results_dict = {}
+        triple_results_dict = {}
+        stats = metrics.stage('ner_triples')
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self.ner_triple_extraction, chunk_key, passage): chunk_key
                 for chunk_key, passage in chunk_passages.items()
             }
 
-            pbar = tqdm(as_completed(ner_futures), total=len(ner_futures), desc="NER")
+            pbar = tqdm(as_completed(futures), total=len(futures), desc="Extracting entities and triples")
             for future in pbar:
-                result = future.result()
-                ner_results_list.append(result)
-                # Update metrics based on the metadata from the result
-                metadata = result.metadata
-                total_prompt_tokens += metadata.get('prompt_tokens', 0)
-                total_completion_tokens += metadata.get('completion_tokens', 0)
-                if metadata.get('cache_hit'):
-                    num_cache_hit += 1
-
-                pbar.set_postfix({
-                    'total_prompt_tokens': total_prompt_tokens,
-                    'total_completion_tokens': total_completion_tokens,
-                    'num_cache_hit': num_cache_hit
-                })
-
-        triple_results_list = []
-        total_prompt_tokens, total_completion_tokens, num_cache_hit = 0, 0, 0
-        with ThreadPoolExecutor() as executor:
-            # Create triple extraction futures for each chunk
-            re_futures = {
-                executor.submit(self.triple_extraction, ner_result.chunk_id,
-                                chunk_passages[ner_result.chunk_id],
-                                ner_result.unique_entities): ner_result.chunk_id
-                for ner_result in ner_results_list
+                ner_result, triple_result = future.result()
+                stats.record(triple_result.metadata, num_parse_failures=self._num_parse_failures(triple_result))
+                pbar.set_postfix(stats.postfix())
+
+                ner_results_dict[ner_result.chunk_id] = ner_result
+                triple_results_dict[triple_result.chunk_id] = triple_result
+                self._record_result(chunk_passages[ner_result.chunk_id], ner_result, triple_result)
+
+        return ner_results_dict, triple_results_dict
+
+    def _batch_packed_openie(self, chunk_passages: Dict[str, str], metrics: OpenIEMetrics) -> Tuple[Dict[str, NerRawOutput], Dict[str, TripleRawOutput]]:
+        ner_results_dict = {}
+        triple_results_dict = {}
+        stats = metrics.stage('packed_ner_triples')
+
+        packs = self.pack_passages(chunk_passages)
+        logger.info(f"Packed {len(chunk_passages)} chunks into {len(packs)} OpenIE requests")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self.packed_ner_triple_extraction, pack, [chunk_passages[chunk_key] for chunk_key in pack]): pack
+                for pack in packs
             }
-            # Collect triple extraction results with progress bar
-            pbar = tqdm(as_completed(re_futures), total=len(re_futures), desc="Extracting triples")
+
+            pbar = tqdm(as_completed(futures), total=len(futures), desc="Extracting entities and triples (packed)")
             for future in pbar:
-                result = future.result()
-                triple_results_list.append(result)
-                metadata = result.metadata
-                total_prompt_tokens += metadata.get('prompt_tokens', 0)
-                total_completion_tokens += metadata.get('completion_tokens', 0)
-                if metadata.get('cache_hit'):
-                    num_cache_hit += 1
-                pbar.set_postfix({
-                    'total_prompt_tokens': total_prompt_tokens,
-                    'total_completion_tokens': total_completion_tokens,
-                    'num_cache_hit': num_cache_hit
-                })
-
-        ner_results_dict = {res.chunk_id: res for res in ner_results_list}
-        triple_results_dict = {res.chunk_id: res for res in triple_results_list}
+                ner_results, triple_results, metadata = future.result()
+                # Token usage is counted once per pack, not once per packed chunk
+                num_missing = len(futures[future]) - len(ner_results)
+                stats.record(metadata, num_parse_failures=num_missing if 'error' not in metadata else 0)
+                pbar.set_postfix(stats.postfix())
+
+                for chunk_key in ner_results:
+                    self._record_result(chunk_passages[chunk_key], ner_results[chunk_key], triple_results[chunk_key])
+                ner_results_dict.update(ner_results)
+                triple_results_dict.update(triple_results)
+
+        missing_passages = {chunk_key: passage for chunk_key, passage in chunk_passages.items() if chunk_key not in ner_results_dict}
+        if missing_passages:
+            logger.warning(f"{len(missing_passages)} chunks are missing from packed OpenIE responses, extracting them one by one")
+            missing_ner_results, missing_triple_results = self._batch_joint_openie(missing_passages, metrics)
+            ner_results_dict.update(missing_ner_results)
+            triple_results_dict.update(missing_triple_results)
+
+        return ner_results_dict, triple_results_dict
+
+    def _offline_batch_infer(self, input_messages: List[List[Dict]], json_template: str, max_tokens: int) -> Tuple[List[str], Dict[str, Any], float]:
+        """
+        Runs one offline `batch_infer` of `self.llm_model`, returning its responses, metadata and wall-clock time.
+        """
+        start_time = time.perf_counter()
+        outputs, metadata = self.llm_model.batch_infer(input_messages, json_template=json_template, max_tokens=max_tokens)
+        elapsed = time.perf_counter() - start_time
+        logger.info(f"{json_template}: {metadata['num_request']} requests, {metadata['prompt_tokens']} prompt tokens, "
+                    f"prefix hit ratio {metadata['prefix_hit_ratio']:.2%}")
+        return outputs, metadata, elapsed
+
+    def _offline_batch_joint_openie(self, chunk_passages: Dict[str, str], metrics: OpenIEMetrics) -> Tuple[Dict[str, NerRawOutput], Dict[str, TripleRawOutput]]:
+        """
+        Joint NER and triple extraction through the offline `batch_infer` of `self.llm_model`.
+        """
+        joint_input_messages = [self.prompt_template_manager.render(name='ner_triple_extraction', passage=p) for p in chunk_passages.values()]
+        joint_output, joint_output_metadata, elapsed = self._offline_batch_infer(joint_input_messages, 'ner_triples', max_tokens=2048)
+
+        ner_results_dict, triple_results_dict = {}, {}
+        for chunk_key, response in zip(chunk_passages.keys(), joint_output):
+            ner_results_dict[chunk_key], triple_results_dict[chunk_key] = self.parse_joint_response(chunk_key, response, {})
+        metrics.stage('ner_triples').record_batch(joint_output_metadata, elapsed,
+                                                  num_parse_failures=sum(map(self._num_parse_failures, triple_results_dict.values())))
+
+        for chunk_key, passage in chunk_passages.items():
+            self._record_result(passage, ner_results_dict[chunk_key], triple_results_dict[chunk_key])
+        return ner_results_dict, triple_results_dict
+
+    def _offline_batch_packed_openie(self, chunk_passages: Dict[str, str], metrics: OpenIEMetrics) -> Tuple[Dict[str, NerRawOutput], Dict[str, TripleRawOutput]]:
+        """
+        Packed NER and triple extraction through the offline `batch_infer` of `self.llm_model`.
+        Chunks missing from their pack's response go through one more joint extraction batch.
+        """
+        packs = self.pack_passages(chunk_passages)
+        packed_input_messages = [self.render_packed_messages([chunk_passages[chunk_key] for chunk_key in pack]) for pack in packs]
+        logger.info(f"Packed {len(chunk_passages)} chunks into {len(packs)} OpenIE requests")
+        packed_output, packed_output_metadata, elapsed = self._offline_batch_infer(packed_input_messages, 'packed_ner_triples', max_tokens=2048)
+
+        ner_results_dict, triple_results_dict = {}, {}
+        for pack, response in zip(packs, packed_output):
+            ner_results, triple_results = self.parse_packed_response(pack, response, {})
+            for chunk_key in ner_results:
+                self._record_result(chunk_passages[chunk_key], ner_results[chunk_key], triple_results[chunk_key])
+            ner_results_dict.update(ner_results)
+            triple_results_dict.update(triple_results)
+
+        missing_passages = {chunk_key: passage for chunk_key, passage in chunk_passages.items() if chunk_key not in ner_results_dict}
+        metrics.stage('packed_ner_triples').record_batch(packed_output_metadata, elapsed, num_parse_failures=len(missing_passages))
+        if missing_passages:
+            logger.warning(f"{len(missing_passages)} chunks are missing from packed OpenIE responses, extracting them one by one")
+            missing_ner_results, missing_triple_results = self._offline_batch_joint_openie(missing_passages, metrics)
+            ner_results_dict.update(missing_ner_results)
+            triple_results_dict.update(missing_triple_results)
+
+        return ner_results_dict, triple_results_dict
+
+    def _offline_batch_pipelined_openie(self, chunk_passages: Dict[str, str], metrics: OpenIEMetrics) -> Tuple[Dict[str, NerRawOutput], Dict[str, TripleRawOutput]]:
+        """
+        NER followed by triple extraction, each stage as one offline `batch_infer` of `self.llm_model`.
+        """
+        ner_input_messages = [self.prompt_template_manager.render(name='ner', passage=p) for p in chunk_passages.values()]
+        ner_output, ner_output_metadata, ner_elapsed = self._offline_batch_infer(ner_input_messages, 'ner', max_tokens=512)
+
+        triple_extract_input_messages = [self.prompt_template_manager.render(
+            name='triple_extraction',
+            passage=passage,
+            named_entity_json=named_entities
+        ) for passage, named_entities in zip(chunk_passages.values(), ner_output)]
+        triple_output, triple_output_metadata, triple_elapsed = self._offline_batch_infer(triple_extract_input_messages, 'triples', max_tokens=2048)
+
+        ner_results_dict = {}
+        for chunk_id, response in zip(chunk_passages.keys(), ner_output):
+            metadata = {}
+            try:
+                unique_entities = json.loads(response)["named_entities"]
+            except Exception as e:
+                unique_entities = []
+                metadata['error'] = str(e)
+                logger.warning(f"Could not parse response from OpenIE: {e}")
+            if len(unique_entities) == 0:
+                logger.warning("No entities extracted for chunk_id: {}".format(chunk_id))
+            ner_results_dict[chunk_id] = NerRawOutput(chunk_id, response, unique_entities, metadata)
+
+        triple_results_dict = {}
+        for chunk_id, response in zip(chunk_passages.keys(), triple_output):
+            metadata = {}
+            try:
+                triples = json.loads(response)["triples"]
+            except Exception as e:
+                triples = []
+                metadata['error'] = str(e)
+                logger.warning(f"Could not parse response from OpenIE: {e}")
+            if len(triples) == 0:
+                logger.warning("No triples extracted for chunk_id: {}".format(chunk_id))
+            triple_results_dict[chunk_id] = TripleRawOutput(chunk_id, response, triples, metadata)
+
+        metrics.stage('ner').record_batch(ner_output_metadata, ner_elapsed,
+                                          num_parse_failures=sum(map(self._num_parse_failures, ner_results_dict.values())))
+        metrics.stage('triples').record_batch(triple_output_metadata, triple_elapsed,
+                                              num_parse_failures=sum(map(self._num_parse_failures, triple_results_dict.values())))
+
+        for chunk_key, passage in chunk_passages.items():
+            self._record_result(passage, ner_results_dict[chunk_key], triple_results_dict[chunk_key])
 
         return ner_results_dict, triple_results_dict
@@ -0,0 +1,88 @@
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+from ..utils.logging_utils import get_logger
+from ..utils.misc_utils import NerRawOutput, TripleRawOutput
+
+logger = get_logger(__name__)
+
+
+class OpenIEResultStore:
+    """
+    Append-only JSONL store that OpenIE results are streamed into as soon as each chunk is done.
+
+    Every line holds one chunk in the format of the `docs` entries of the OpenIE results file
+    (`idx`, `passage`, `extracted_entities`, `extracted_triples`), plus the raw LLM responses if
+    `keep_raw_responses` is set. A run that crashes midway therefore leaves every finished chunk on disk,
+    and `HippoRAG.load_existing_openie` picks them up on restart. Once the full OpenIE results file is
+    saved, the store is cleared.
+
+    Streaming is for durability, not memory: `batch_openie` still returns the results of every chunk it was
+    given, so those stay in memory until indexing is done either way.
+    """
+
+    def __init__(self, path: str, keep_raw_responses: bool = True):
+        self.path = path
+        self.keep_raw_responses = keep_raw_responses
+        self._lock = threading.Lock()
+        self._file = None
+
+    def append(self, passage: str, ner_output: NerRawOutput, triple_output: TripleRawOutput):
+        record = {
+            'idx': ner_output.chunk_id,
+            'passage': passage,
+            'extracted_entities': ner_output.unique_entities,
+            'extracted_triples': triple_output.triples,
+        }
+        if self.keep_raw_responses:
+            record['ner_response'] = ner_output.response
+            record['triple_response'] = triple_output.response
+
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+                if self._file.tell() > 0 and not self._ends_with_newline():
+                    # Terminate a line left partially written by a crash so it does not swallow this record
+                    self._file.write("\n")
+            self._file.write(line)
+            # Flush every record so a crash loses at most the chunk being written
+            self._file.flush()
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def load(self) -> List[Dict]:
+        """
+        Reads back all stored chunks, the last record winning for chunks stored more than once.
+        A partially written last line, left by a crash, is skipped.
+        """
+        if not os.path.isfile(self.path):
+            return []
+
+        records = {}
+        with open(self.path, encoding='utf-8') as f:
+            for line_idx, line in enumerate(f):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping unreadable line {line_idx} of OpenIE result store {self.path}")
+                    continue
+                records[record['idx']] = record
+        return list(records.values())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def clear(self):
+        self.close()
+        if os.path.isfile(self.path):
+            os.remove(self.path)
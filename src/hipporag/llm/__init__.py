@@ -7,6 +7,7 @@ from .openai_gpt import CacheOpenAI
 from .base import BaseLLM
 from .bedrock_llm import BedrockLLM
 from .transformers_llm import TransformersLLM
+from .cache import LLMCache
 
 
 logger = get_logger(__name__)
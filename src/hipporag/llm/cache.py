@@ -0,0 +1,348 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Literal, Optional, Tuple
+
+from ..utils.config_utils import BaseConfig
+from ..utils.logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+
+class LLMCache:
+    """
+    SQLite-backed response cache shared by all LLM backends (CacheOpenAI, BedrockLLM, TransformersLLM).
+
+    A single connection is kept open per cache instance and guarded by a thread lock; cross-process
+    concurrency is left to SQLite's WAL journal instead of a file lock around every operation.
+    Entries can be bounded by count, by total stored bytes (least recently hit entries are evicted first)
+    and by age. Responses larger than `compress_threshold` bytes have their message and metadata stored
+    compressed with zlib or, when the `zstandard` package is installed, zstd.
+    """
+
+    # Eviction is checked once every this many writes rather than after each one.
+    EVICTION_CHECK_INTERVAL = 100
+
+    # Hit times are buffered and written with the next write or eviction, or by a read once this many seconds
+    # passed since they were last written, so cache hits do not take the write lock.
+    HIT_FLUSH_INTERVAL = 60
+
+    # Entries `compact` re-encodes per transaction, so a large cache is never loaded at once.
+    RECOMPRESS_BATCH_SIZE = 1000
+
+    # Values of the `compressed` column.
+    CODEC_NONE, CODEC_ZLIB, CODEC_ZSTD = 0, 1, 2
+
+    def __init__(self,
+                 cache_filepath: str,
+                 max_entries: Optional[int] = None,
+                 ttl: Optional[float] = None,
+                 compress_threshold: Optional[int] = 4096,
+                 codec: Literal["zlib", "zstd"] = "zlib",
+                 max_size_bytes: Optional[int] = None) -> None:
+        """
+        Args:
+            cache_filepath (str): Path to the SQLite file, created if missing.
+            max_entries (Optional[int]): Max number of cached responses. None means unbounded.
+            ttl (Optional[float]): Seconds after which an entry expires. None means entries never expire.
+            compress_threshold (Optional[int]): Responses of at least this many bytes are compressed. None disables compression.
+            codec (Literal["zlib", "zstd"]): Compression codec for new entries. Falls back to zlib if `zstandard` is missing.
+            max_size_bytes (Optional[int]): Max total bytes of stored messages and metadata. None means unbounded.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(cache_filepath)), exist_ok=True)
+        self.cache_filepath = cache_filepath
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.compress_threshold = compress_threshold
+        self.max_size_bytes = max_size_bytes
+
+        self._zstd_compressor, self._zstd_decompressor = None, None
+        self.codec = self.CODEC_ZLIB
+        if codec == "zstd":
+            try:
+                import zstandard
+                self._zstd_compressor = zstandard.ZstdCompressor(level=3)
+                self._zstd_decompressor = zstandard.ZstdDecompressor()
+                self.codec = self.CODEC_ZSTD
+            except ImportError:
+                logger.warning("zstandard is not installed, falling back to zlib for LLM cache compression.")
+
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_writes = 0
+        self.num_evictions = 0
+
+        self._pending_hits: Dict[str, float] = {}
+        self._last_hit_flush = time.time()
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.cache_filepath, check_same_thread=False, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._init_table()
+
+    @classmethod
+    def from_experiment_config(cls, cache_filepath: str, global_config: BaseConfig) -> "LLMCache":
+        max_size_mb = global_config.llm_cache_max_size_mb
+        return cls(cache_filepath,
+                   max_entries=global_config.llm_cache_max_entries,
+                   ttl=global_config.llm_cache_ttl,
+                   compress_threshold=global_config.llm_cache_compress_threshold,
+                   codec=global_config.llm_cache_codec,
+                   max_size_bytes=int(max_size_mb * 1024 * 1024) if max_size_mb is not None else None)
+
+    def _init_table(self) -> None:
+        with self._lock:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    message TEXT,
+                    metadata TEXT
+                )
+            """)
+            # Caches written before eviction and compression existed only have the three columns above.
+            existing_columns = {row[1] for row in self._conn.execute("PRAGMA table_info(cache)")}
+            added_columns = []
+            for column, column_type in (("created_at", "REAL DEFAULT 0"),
+                                        ("last_hit_at", "REAL DEFAULT 0"),
+                                        ("compressed", "INTEGER DEFAULT 0"),
+                                        ("size", "INTEGER DEFAULT 0")):
+                if column not in existing_columns:
+                    self._conn.execute(f"ALTER TABLE cache ADD COLUMN {column} {column_type}")
+                    added_columns.append(column)
+            # Existing entries count as written and hit at migration time, otherwise a first `ttl` would
+            # expire the whole cache at once.
+            now = time.time()
+            for column in ("created_at", "last_hit_at"):
+                if column in added_columns:
+                    self._conn.execute(f"UPDATE cache SET {column} = ?", (now,))
+            # Existing entries count with their stored bytes towards `max_size_bytes`.
+            if "size" in added_columns:
+                self._conn.execute("UPDATE cache SET size = COALESCE(length(CAST(message AS BLOB)), 0) "
+                                   "+ COALESCE(length(CAST(metadata AS BLOB)), 0)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_last_hit_at ON cache (last_hit_at)")
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(messages: Any, model: Optional[str], seed: Optional[int] = None,
+                 temperature: Optional[float] = None, **extra_params) -> str:
+        """
+        Computes the cache key of a request.
+
+        The key hashes the messages, model, seed and temperature; any extra parameter that shapes the
+        response (e.g. `json_template`) is included only when it is not None, so keys of plain requests
+        stay identical to those written by earlier versions of `cache_response`.
+        """
+        key_data = {
+            "messages": messages,  # messages requires JSON serializable
+            "model": model,
+            "seed": seed,
+            "temperature": temperature,
+        }
+        key_data.update({k: v for k, v in extra_params.items() if v is not None})
+        key_str = json.dumps(key_data, sort_keys=True, default=str)
+        return hashlib.sha256(key_str.encode("utf-8")).hexdigest()
+
+    def _compress(self, data: bytes, codec: int) -> bytes:
+        if codec == self.CODEC_ZSTD:
+            return self._zstd_compressor.compress(data)
+        return zlib.compress(data)
+
+    def _decompress(self, data: bytes, codec: int) -> bytes:
+        if codec == self.CODEC_ZSTD:
+            if self._zstd_decompressor is None:
+                import zstandard
+                self._zstd_decompressor = zstandard.ZstdDecompressor()
+            return self._zstd_decompressor.decompress(data)
+        return zlib.decompress(data)
+
+    def _encode_row(self, message: str, metadata: Dict) -> Tuple[Any, Any, int, int]:
+        """Returns the stored message, stored metadata, codec and stored size of a response."""
+        encoded_message = message.encode("utf-8")
+        encoded_metadata = json.dumps(metadata).encode("utf-8")
+        if self.compress_threshold is not None and len(encoded_message) + len(encoded_metadata) >= self.compress_threshold:
+            stored_message = self._compress(encoded_message, self.codec)
+            stored_metadata = self._compress(encoded_metadata, self.codec)
+            return (sqlite3.Binary(stored_message), sqlite3.Binary(stored_metadata), self.codec,
+                    len(stored_message) + len(stored_metadata))
+        return message, encoded_metadata.decode("utf-8"), self.CODEC_NONE, len(encoded_message) + len(encoded_metadata)
+
+    def _decode_row(self, message: Any, metadata: Any, codec: int) -> Tuple[str, Dict]:
+        if codec:
+            message = self._decompress(message, codec).decode("utf-8")
+            # Entries compressed before metadata compression existed kept their metadata as plain text.
+            if isinstance(metadata, bytes):
+                metadata = self._decompress(metadata, codec).decode("utf-8")
+        return message, json.loads(metadata)
+
+    def read(self, key: str) -> Optional[Tuple[str, Dict]]:
+        """Returns the cached (message, metadata) for `key`, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT message, metadata, compressed, created_at FROM cache WHERE key = ?",
+                                     (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - (row[3] or 0) > self.ttl:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self.num_evictions += 1
+                row = None
+
+            if row is None:
+                self.num_misses += 1
+                return None
+
+            self._pending_hits[key] = now
+            if now - self._last_hit_flush >= self.HIT_FLUSH_INTERVAL:
+                self._flush_hits()
+                self._conn.commit()
+            self.num_hits += 1
+
+        message, metadata, compressed, _ = row
+        return self._decode_row(message, metadata, compressed)
+
+    def write(self, key: str, message: str, metadata: Dict) -> None:
+        """Stores the response of `key`, evicting old entries when the cache is over budget."""
+        now = time.time()
+        stored_message, stored_metadata, compressed, size = self._encode_row(message, metadata)
+        with self._lock:
+            self._flush_hits()
+            self._conn.execute("INSERT OR REPLACE INTO cache (key, message, metadata, created_at, last_hit_at, compressed, size) "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (key, stored_message, stored_metadata, now, now, compressed, size))
+            self._conn.commit()
+            self.num_writes += 1
+            if self.num_writes % self.EVICTION_CHECK_INTERVAL == 0:
+                self._evict()
+
+    def evict(self) -> int:
+        """Drops expired entries and, while over `max_entries` or `max_size_bytes`, the least recently hit ones."""
+        with self._lock:
+            return self._evict()
+
+    def _flush_hits(self) -> None:
+        """Writes buffered hit times, in the caller's transaction. Newer times written by other processes are kept."""
+        if self._pending_hits:
+            self._conn.executemany("UPDATE cache SET last_hit_at = MAX(last_hit_at, ?) WHERE key = ?",
+                                   [(hit_at, key) for key, hit_at in self._pending_hits.items()])
+            self._pending_hits = {}
+        self._last_hit_flush = time.time()
+
+    def _evict(self) -> int:
+        # Least recently hit entries are only known once buffered hits are written
+        self._flush_hits()
+        num_evicted = 0
+        if self.ttl is not None:
+            num_evicted += self._conn.execute("DELETE FROM cache WHERE created_at < ?",
+                                              (time.time() - self.ttl,)).rowcount
+        if self.max_entries is not None:
+            num_entries = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if num_entries > self.max_entries:
+                num_evicted += self._conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_hit_at ASC LIMIT ?)",
+                    (num_entries - self.max_entries,)).rowcount
+        if self.max_size_bytes is not None:
+            total_size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            if total_size > self.max_size_bytes:
+                keys_to_evict = []
+                for key, size in self._conn.execute("SELECT key, size FROM cache ORDER BY last_hit_at ASC"):
+                    if total_size <= self.max_size_bytes:
+                        break
+                    keys_to_evict.append((key,))
+                    total_size -= size or 0
+                self._conn.executemany("DELETE FROM cache WHERE key = ?", keys_to_evict)
+                num_evicted += len(keys_to_evict)
+        # Also ends the transaction a DELETE matching no rows opens, which would block other connections
+        self._conn.commit()
+        if num_evicted > 0:
+            self.num_evictions += num_evicted
+            logger.debug(f"Evicted {num_evicted} entries from {self.cache_filepath}")
+        return num_evicted
+
+    def _file_size(self) -> int:
+        """Bytes of the cache file and its write-ahead log."""
+        wal_filepath = self.cache_filepath + "-wal"
+        return os.path.getsize(self.cache_filepath) + (os.path.getsize(wal_filepath) if os.path.exists(wal_filepath) else 0)
+
+    def compact(self, recompress: bool = False) -> Dict[str, int]:
+        """
+        Offline maintenance: applies the eviction policy, optionally re-encodes every entry with the current
+        codec and threshold (also filling `size` for entries written before it was tracked), `RECOMPRESS_BATCH_SIZE`
+        entries per transaction, then VACUUMs the file to give freed pages back to the filesystem.
+
+        Returns:
+            Dict[str, int]: File size in bytes (including the WAL) before and after compaction, and the number
+            of evicted entries.
+        """
+        size_before = self._file_size()
+        with self._lock:
+            if recompress:
+                # Keyset pagination on rowid, which updating a row leaves unchanged
+                last_rowid = None
+                while True:
+                    rows = self._conn.execute(
+                        "SELECT rowid, message, metadata, compressed FROM cache WHERE ? IS NULL OR rowid > ? ORDER BY rowid LIMIT ?",
+                        (last_rowid, last_rowid, self.RECOMPRESS_BATCH_SIZE)).fetchall()
+                    if not rows:
+                        break
+                    updates = []
+                    for rowid, message, metadata, compressed in rows:
+                        stored_message, stored_metadata, codec, size = self._encode_row(*self._decode_row(message, metadata, compressed))
+                        updates.append((stored_message, stored_metadata, codec, size, rowid))
+                    self._conn.executemany("UPDATE cache SET message = ?, metadata = ?, compressed = ?, size = ? WHERE rowid = ?",
+                                           updates)
+                    self._conn.commit()
+                    last_rowid = rows[-1][0]
+            num_evicted = self._evict()
+            # VACUUM fails while a transaction is open, which an eviction that deleted nothing leaves behind
+            self._conn.commit()
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.execute("VACUUM")
+            # In WAL mode VACUUM writes the rebuilt pages to the WAL
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        size_after = self._file_size()
+        logger.info(f"Compacted {self.cache_filepath}: {size_before} -> {size_after} bytes, {num_evicted} entries evicted")
+        return {"size_before": size_before, "size_after": size_after, "evicted": num_evicted}
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit/miss/write/eviction counters of this process and the hit rate."""
+        num_lookups = self.num_hits + self.num_misses
+        return {
+            "hits": self.num_hits,
+            "misses": self.num_misses,
+            "writes": self.num_writes,
+            "evictions": self.num_evictions,
+            "hit_rate": self.num_hits / num_lookups if num_lookups > 0 else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_hits()
+            self._conn.commit()
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact LLM cache files: evict over-budget entries, optionally recompress, then VACUUM.")
+    parser.add_argument("cache_files", nargs="+", help="Paths to llm_cache/*.sqlite files.")
+    parser.add_argument("--max_size_mb", type=float, default=None, help="Size budget per cache file.")
+    parser.add_argument("--max_entries", type=int, default=None, help="Max number of entries per cache file.")
+    parser.add_argument("--ttl", type=float, default=None, help="Drop entries older than this many seconds.")
+    parser.add_argument("--codec", choices=["zlib", "zstd"], default="zlib", help="Codec used when recompressing.")
+    parser.add_argument("--compress_threshold", type=int, default=4096, help="Min response bytes to compress.")
+    parser.add_argument("--recompress", action="store_true", help="Re-encode every entry with --codec.")
+    args = parser.parse_args()
+
+    for cache_file in args.cache_files:
+        cache = LLMCache(cache_file,
+                         max_entries=args.max_entries,
+                         ttl=args.ttl,
+                         compress_threshold=args.compress_threshold,
+                         codec=args.codec,
+                         max_size_bytes=int(args.max_size_mb * 1024 * 1024) if args.max_size_mb is not None else None)
+        print(cache_file, cache.compact(recompress=args.recompress))
+        cache.close()
@@ -1,14 +1,10 @@
 import functools
-import hashlib
-import json
 import os
-import sqlite3
 from copy import deepcopy
 from typing import List, Tuple
 
 import httpx
 import openai
-from filelock import FileLock
 from openai import OpenAI
 from openai import AzureOpenAI
 from packaging import version
@@ -16,10 +12,12 @@ from tenacity import retry, stop_after_attempt, wait_fixed
 
 from ..utils.config_utils import BaseConfig
 from ..utils.llm_utils import (
-    TextChatMessage
+    TextChatMessage,
+    PROMPT_JSON_TEMPLATE
 )
 from ..utils.logging_utils import get_logger
 from .base import BaseLLM, LLMConfig
+from .cache import LLMCache
 
 logger = get_logger(__name__)
 
@@ -40,62 +38,23 @@ def cache_response(func):
         seed = kwargs.get("seed", gen_params.get("seed"))
         temperature = kwargs.get("temperature", gen_params.get("temperature"))
 
-        # build key data, convert to JSON string and hash to generate key_hash
-        key_data = {
-            "messages": messages,  # messages requires JSON serializable
-            "model": model,
-            "seed": seed,
-            "temperature": temperature,
-        }
-        key_str = json.dumps(key_data, sort_keys=True, default=str)
-        key_hash = hashlib.sha256(key_str.encode("utf-8")).hexdigest()
-
-        # the file name of lock, ensure mutual exclusion when accessing concurrently
-        lock_file = self.cache_file_name + ".lock"
-
-        # Try to read from SQLite cache
-        with FileLock(lock_file):
-            conn = sqlite3.connect(self.cache_file_name)
-            c = conn.cursor()
-            # if the table does not exist, create it
-            c.execute("""
-                CREATE TABLE IF NOT EXISTS cache (
-                    key TEXT PRIMARY KEY,
-                    message TEXT,
-                    metadata TEXT
-                )
-            """)
-            conn.commit()  # commit to save the table creation
-            c.execute("SELECT message, metadata FROM cache WHERE key = ?", (key_hash,))
-            row = c.fetchone()
-            conn.close()
-            if row is not None:
-                message, metadata_str = row
-                metadata = json.loads(metadata_str)
-                # return cached result and mark as hit
-                return message, metadata, True
+        # the schema only changes the request (and so the key) when structured output is enabled
+        json_template = kwargs.get("json_template") if getattr(self, "structured_output", None) else None
+
+        key_hash = LLMCache.make_key(messages, model, seed=seed, temperature=temperature, json_template=json_template)
+
+        cache_lookup = self.cache.read(key_hash)
+        if cache_lookup is not None:
+            message, metadata = cache_lookup
+            # return cached result and mark as hit
+            return message, metadata, True
 
         # if cache miss, call the original function to get the result
         result = func(self, *args, **kwargs)
         message, metadata = result
 
         # insert new result into cache
-        with FileLock(lock_file):
-            conn = sqlite3.connect(self.cache_file_name)
-            c = conn.cursor()
-            # make sure the table exists again (if it doesn't exist, it would be created)
-            c.execute("""
-                CREATE TABLE IF NOT EXISTS cache (
-                    key TEXT PRIMARY KEY,
-                    message TEXT,
-                    metadata TEXT
-                )
-            """)
-            metadata_str = json.dumps(metadata)
-            c.execute("INSERT OR REPLACE INTO cache (key, message, metadata) VALUES (?, ?, ?)",
-                      (key_hash, message, metadata_str))
-            conn.commit()
-            conn.close()
+        self.cache.write(key_hash, message, metadata)
 
         return message, metadata, False
 
@@ -134,6 +93,7 @@ class CacheOpenAI(BaseLLM):
         if cache_filename is None:
             cache_filename = f"{self.llm_name.replace('/', '_')}_cache.sqlite"
         self.cache_file_name = os.path.join(self.cache_dir, cache_filename)
+        self.cache = LLMCache.from_experiment_config(self.cache_file_name, global_config)
 
         self._init_llm_config()
         if high_throughput:
@@ -143,6 +103,7 @@ class CacheOpenAI(BaseLLM):
             client = None
 
         self.max_retries = kwargs.get("max_retries", 2)
+        self.structured_output = global_config.llm_structured_output
 
         if self.global_config.azure_endpoint is None:
             self.openai_client = OpenAI(base_url=self.llm_base_url, http_client=client, max_retries=self.max_retries)
@@ -171,12 +132,28 @@ class CacheOpenAI(BaseLLM):
     def infer(
         self,
         messages: List[TextChatMessage],
+        json_template: str = None,
         **kwargs
     ) -> Tuple[List[TextChatMessage], dict]:
+        """
+        Args:
+            messages (List[TextChatMessage]): Input chat history.
+            json_template (str, optional): Key of PROMPT_JSON_TEMPLATE the response must conform to. Only applied when
+                `llm_structured_output` is configured, otherwise the request is sent unconstrained.
+            kwargs: Overrides of the generate params.
+        """
         params = deepcopy(self.llm_config.generate_params)
         if kwargs:
             params.update(kwargs)
         params["messages"] = messages
+
+        if json_template is not None and self.structured_output == "response_format":
+            params["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": json_template, "schema": PROMPT_JSON_TEMPLATE[json_template]},
+            }
+        elif json_template is not None and self.structured_output == "guided_json":
+            params["extra_body"] = {"guided_json": PROMPT_JSON_TEMPLATE[json_template]}
         logger.debug(f"Calling OpenAI GPT API with:\n{params}")
 
         if 'gpt' not in params['model'] or version.parse(openai.__version__) < version.parse("1.45.0"): # if we use vllm to call openai api or if we use openai but the version is too old to use 'max_completion_tokens' argument
@@ -1,16 +1,13 @@
 import os
 from typing import List, Tuple
 from copy import deepcopy
-import sqlite3
-import json
 import time
-import hashlib
 import torch
 
 from transformers import AutoModelForCausalLM, AutoTokenizer
-from filelock import FileLock
 
 from .base import BaseLLM, LLMConfig
+from .cache import LLMCache
 from ..utils.llm_utils import TextChatMessage
 from ..utils.logging_utils import get_logger
 
@@ -24,57 +21,77 @@ def convert_text_chat_messages_to_input_ids(messages: List[TextChatMessage], tok
         tools=None,
         documents=None,
     )
-    input_ids = tokenizer.encode(prompt, return_tensors="pt")
+    # The chat template already starts the prompt with its BOS token
+    input_ids = tokenizer.encode(prompt, add_special_tokens=False, return_tensors="pt")
     return input_ids
 
 
 logger = get_logger(__name__)
 
 
-class LLM_Cache:
-    def __init__(self, cache_dir: str, cache_filename):
-        os.makedirs(cache_dir, exist_ok=True)
-        self.cache_filepath =  os.path.join(cache_dir, f"{cache_filename}.sqlite")
-        self.lock_file = self.cache_filepath + ".lock"
-
-        self.__db_operation("""
-            CREATE TABLE IF NOT EXISTS cache (
-                key TEXT PRIMARY KEY,
-                message TEXT,
-                metadata TEXT
-            )
-        """, commit=True)
-    
-    def __db_operation(self, sql, parameters=(), commit=False, fetchone=False):
-        with FileLock(self.lock_file):
-            conn = sqlite3.connect(self.cache_filepath)
-            c = conn.cursor()
-            c.execute(sql, parameters)
-            if commit:
-                conn.commit()
-            if fetchone:
-                row = c.fetchone()
-            conn.close()
-            if fetchone:
-                return row
-
-    def __params_to_key(self, params):
-        key_str = f"Model: {params['model']}, Temperature: {params['temperature']}, Messages: {params['messages']}"
-        return hashlib.sha256(key_str.encode("utf-8")).hexdigest()
-
-    def read(self, params):
-        key = self.__params_to_key(params)
-        row = self.__db_operation("SELECT message, metadata FROM cache WHERE key = ?", (key,), fetchone=True)
-        if row is None:
-            return None
-        message, metadata_str = row
-        metadata = json.loads(metadata_str)
-        return message, metadata
-
-    def write(self, params, message, metadata):
-        key = self.__params_to_key(params)
-        metadata_str = json.dumps(metadata)
-        self.__db_operation("INSERT OR REPLACE INTO cache (key, message, metadata) VALUES (?, ?, ?)", (key, message, metadata_str), commit=True)
+def generate_in_length_buckets(model, tokenizer, all_prompt_ids: List[List[int]], max_new_tokens: int = 200,
+                               batch_size: int = 8) -> Tuple[List[List[int]], List[str]]:
+    """
+    Greedy batched generation for a list of tokenized prompts.
+
+    Prompts are sorted by length and grouped into buckets of `batch_size`, so each batch only pads up to its
+    own longest prompt. Every bucket is left-padded and decoded with a single `generate` call, which runs
+    the decode steps of all requests in the bucket together and reuses their KV caches across steps.
+
+    Args:
+        model: A causal LM from `AutoModelForCausalLM`.
+        tokenizer: The tokenizer matching `model`.
+        all_prompt_ids (List[List[int]]): Token ids of each prompt (chat template already applied).
+        max_new_tokens (int): Max number of tokens to generate for each prompt.
+        batch_size (int): Max number of prompts decoded together.
+
+    Returns:
+        Tuple[List[List[int]], List[str]]: The generated token ids (prompt and padding excluded) and the
+        finish reason ("stop" or "length") for each prompt, in the input order.
+    """
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    eos_token_ids = model.generation_config.eos_token_id
+    if eos_token_ids is None:
+        eos_token_ids = [tokenizer.eos_token_id]
+    elif isinstance(eos_token_ids, int):
+        eos_token_ids = [eos_token_ids]
+    eos_token_ids = set(eos_token_ids)
+
+    order = sorted(range(len(all_prompt_ids)), key=lambda idx: len(all_prompt_ids[idx]))
+    all_completion_ids = [None] * len(all_prompt_ids)
+    all_finish_reasons = [None] * len(all_prompt_ids)
+
+    for start in range(0, len(order), batch_size):
+        bucket = order[start:start + batch_size]
+        max_prompt_len = max(len(all_prompt_ids[idx]) for idx in bucket)
+
+        input_ids = torch.full((len(bucket), max_prompt_len), pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(bucket), max_prompt_len), dtype=torch.long)
+        for row, idx in enumerate(bucket):
+            prompt_ids = all_prompt_ids[idx]
+            input_ids[row, max_prompt_len - len(prompt_ids):] = torch.tensor(prompt_ids, dtype=torch.long)
+            attention_mask[row, max_prompt_len - len(prompt_ids):] = 1
+
+        with torch.no_grad():
+            output_ids = model.generate(input_ids=input_ids.to(model.device),
+                                        attention_mask=attention_mask.to(model.device),
+                                        max_new_tokens=max_new_tokens,
+                                        do_sample=False,
+                                        use_cache=True,
+                                        pad_token_id=pad_token_id)
+
+        for row, idx in enumerate(bucket):
+            completion_ids = []
+            finish_reason = "length"
+            for token_id in output_ids[row, max_prompt_len:].tolist():
+                if token_id in eos_token_ids:
+                    finish_reason = "stop"
+                    break
+                completion_ids.append(token_id)
+            all_completion_ids[idx] = completion_ids
+            all_finish_reasons[idx] = finish_reason
+
+    return all_completion_ids, all_finish_reasons
 
 
 class TransformersLLM(BaseLLM):
@@ -87,9 +104,9 @@ class TransformersLLM(BaseLLM):
         super().__init__(global_config)
         self._init_llm_config()
 
-        self.cache = LLM_Cache(
-            os.path.join(global_config.save_dir, "llm_cache"),
-            self.llm_name.replace('/', '_'))
+        self.cache = LLMCache.from_experiment_config(
+            os.path.join(global_config.save_dir, "llm_cache", f"{self.llm_name.replace('/', '_')}.sqlite"),
+            global_config)
         self.model = AutoModelForCausalLM.from_pretrained(self.global_config.llm_name, device_map='auto', torch_dtype = torch.bfloat16)
         self.tokenizer = AutoTokenizer.from_pretrained(self.global_config.llm_name)
 
@@ -108,6 +125,10 @@ class TransformersLLM(BaseLLM):
         self.llm_config = LLMConfig.from_dict(config_dict=config_dict)
         logger.info(f"[TransformersLLM] Config: {self.llm_config}")
 
+    def _cache_key(self, params) -> str:
+        return LLMCache.make_key(params["messages"], params["model"], seed=params.get("seed"),
+                                 temperature=params.get("temperature"), json_template=params.get("json_template"))
+
     def __llm_call(self, params):
         inputs = params["prompt_text"].to(self.model.device)
         response = self.model.generate(inputs, max_new_tokens=params.get("max_tokens", 200))
@@ -121,7 +142,7 @@ class TransformersLLM(BaseLLM):
         params["messages"] = messages
         params["prompt_text"] = convert_text_chat_messages_to_input_ids(messages, self.tokenizer)
         
-        cache_lookup = self.cache.read(params)
+        cache_lookup = self.cache.read(self._cache_key(params))
         if cache_lookup is not None:
             cached = True
             message, metadata = cache_lookup
@@ -133,6 +154,96 @@ class TransformersLLM(BaseLLM):
                 "prompt_tokens": params["prompt_text"].shape[1], 
                 "completion_tokens": response.shape[1],
             }
-            self.cache.write(params, message, metadata)
+            self.cache.write(self._cache_key(params), message, metadata)
 
         return message, metadata, cached
+
+    def batch_infer(self, messages_list: List[List[TextChatMessage]], max_tokens=2048, json_template=None, batch_size=8):
+        """
+        Batched counterpart of `infer` with the same contract as `VLLMOffline.batch_infer`.
+
+        Cached prompts are answered from the LLM cache; the remaining ones are generated together with
+        `generate_in_length_buckets`, or with outlines' JSON-guided generator when `json_template` is given.
+
+        Returns:
+            Tuple[List[str], dict]: The responses in input order and the aggregated token usage. `generate` keeps
+            no KV cache across prompts, so `prefix_hit_tokens` and `prefix_hit_ratio` are always 0.
+        """
+        if len(messages_list) > 1:
+            logger.info(f"Calling TransformersLLM, # of messages {len(messages_list)}, using batchsize = {batch_size}")
+
+        all_params = []
+        all_responses = [None] * len(messages_list)
+        all_prompt_tokens = [0] * len(messages_list)
+        all_completion_tokens = [0] * len(messages_list)
+        all_finish_reasons = [None] * len(messages_list)
+        missed_indices = []
+        for idx, messages in enumerate(messages_list):
+            params = deepcopy(self.llm_config.generate_params)
+            params["model"] = self.global_config.llm_name
+            params["messages"] = messages
+            params["max_tokens"] = max_tokens
+            if json_template is not None:
+                params["json_template"] = json_template
+            all_params.append(params)
+
+            cache_lookup = self.cache.read(self._cache_key(params))
+            if cache_lookup is not None:
+                all_responses[idx], cached_metadata = cache_lookup
+                all_prompt_tokens[idx] = cached_metadata.get("prompt_tokens", 0)
+                all_completion_tokens[idx] = cached_metadata.get("completion_tokens", 0)
+                all_finish_reasons[idx] = cached_metadata.get("finish_reason")
+            else:
+                missed_indices.append(idx)
+
+        if missed_indices:
+            missed_prompt_ids = [convert_text_chat_messages_to_input_ids(messages_list[idx], self.tokenizer)[0].tolist()
+                                 for idx in missed_indices]
+
+            if json_template is not None:
+                import outlines.generate as generate
+                import outlines.models as models
+                from ..utils.llm_utils import get_pydantic_model
+
+                generator = generate.json(models.Transformers(self.model, self.tokenizer), get_pydantic_model(json_template))
+                missed_prompt_texts = [self.tokenizer.apply_chat_template(conversation=messages_list[idx], tokenize=False,
+                                                                          add_generation_prompt=True)
+                                       for idx in missed_indices]
+                missed_responses = []
+                for start in range(0, len(missed_prompt_texts), batch_size):
+                    outputs = generator(missed_prompt_texts[start:start + batch_size], max_tokens=max_tokens)
+                    missed_responses.extend(output.model_dump_json() for output in outputs)
+                missed_completion_tokens = [len(self.tokenizer.encode(response, add_special_tokens=False))
+                                            for response in missed_responses]
+                # Outlines does not report finish reasons, a generation that used up max_tokens was cut off
+                missed_finish_reasons = ["length" if num_tokens >= max_tokens else "stop"
+                                         for num_tokens in missed_completion_tokens]
+            else:
+                missed_completion_ids, missed_finish_reasons = generate_in_length_buckets(
+                    self.model, self.tokenizer, missed_prompt_ids, max_new_tokens=max_tokens, batch_size=batch_size)
+                missed_responses = [self.tokenizer.decode(completion_ids, skip_special_tokens=True)
+                                    for completion_ids in missed_completion_ids]
+                missed_completion_tokens = [len(completion_ids) for completion_ids in missed_completion_ids]
+
+            for i, idx in enumerate(missed_indices):
+                metadata = {
+                    "prompt_tokens": len(missed_prompt_ids[i]),
+                    "completion_tokens": missed_completion_tokens[i],
+                    "finish_reason": missed_finish_reasons[i],
+                }
+                self.cache.write(self._cache_key(all_params[idx]), missed_responses[i], metadata)
+                all_responses[idx] = missed_responses[i]
+                all_prompt_tokens[idx] = metadata["prompt_tokens"]
+                all_completion_tokens[idx] = metadata["completion_tokens"]
+                all_finish_reasons[idx] = metadata["finish_reason"]
+
+        metadata = {
+            "prompt_tokens": sum(all_prompt_tokens),
+            "completion_tokens": sum(all_completion_tokens),
+            "num_request": len(messages_list),
+            "num_cache_hit": len(messages_list) - len(missed_indices),
+            "num_truncated": sum(finish_reason == "length" for finish_reason in all_finish_reasons),
+            "prefix_hit_tokens": 0,
+            "prefix_hit_ratio": 0.0,
+        }
+        return all_responses, metadata
@@ -1,10 +1,12 @@
 from typing import Tuple, List
+import gc
 import torch.cuda
 import outlines.generate as generate
 import outlines.models as models
 import json
 
 from .base import BaseLLM, LLMConfig
+from .transformers_llm import generate_in_length_buckets
 from ..utils.llm_utils import TextChatMessage, get_pydantic_model
 from ..utils.logging_utils import get_logger
 
@@ -52,11 +54,12 @@ class TransformersOffline:
         logger.info(f"Calling Transformers offline, # of messages {len(messages)}")
         messages_list = [messages]
         prompt_text = convert_text_chat_messages_to_input_string(messages_list, self.tokenizer)
-        input_ids = self.tokenizer.encode(prompt_text)
+        # The chat template already starts the prompt with its BOS token
+        input_ids = self.tokenizer.encode(prompt_text, add_special_tokens=False)
         transformers_output = self.model.generate(input_ids, max_new_tokens=max_tokens)
         response = transformers_output[0]['generated_text']
-        prompt_tokens = len(self.tokenizer.encode(prompt_text))
-        completion_tokens = len(self.tokenizer.encode(response))
+        prompt_tokens = len(input_ids)
+        completion_tokens = len(self.tokenizer.encode(response, add_special_tokens=False))
         metadata = {
             "prompt_tokens": prompt_tokens,
             "completion_tokens": completion_tokens
@@ -68,28 +71,52 @@ class TransformersOffline:
             logger.info(f"Calling Transformers offline, # of messages {len(messages_list)}, using batchsize = 4")
 
         all_prompt_texts = [convert_text_chat_messages_to_input_string(messages, self.tokenizer) for messages in messages_list]
+        # The chat template already starts every prompt with its BOS token
+        all_prompt_ids = [self.tokenizer.encode(prompt, add_special_tokens=False) for prompt in all_prompt_texts]
 
         guided = None
         if json_template is not None:
             guided_json=get_pydantic_model(json_template)
             outlines_model = models.Transformers(self.model, self.tokenizer)
             generator = generate.json(outlines_model, guided_json)
-            transformers_outputs = []
+            all_responses = []
             for i in range(0, len(all_prompt_texts), 4):
                 transformers_output = generator(all_prompt_texts[i:i+4], max_tokens=max_tokens)
-                transformers_outputs.extend(transformers_output)
+                all_responses.extend(completion.model_dump_json() for completion in transformers_output)
         else:
-            transformers_outputs = []
-            for i in range(0, len(all_prompt_texts), 4):
-                transformers_output = self.model.generate(all_prompt_texts[i:i+4], max_tokens=max_tokens)
-                transformers_outputs.extend(transformers_output)
-        all_responses = [completion.model_dump_json() for completion in transformers_outputs]
-        all_prompt_tokens = [len(self.tokenizer.encode(prompt)) for prompt in all_prompt_texts]
-        all_completion_tokens = [len(self.tokenizer.encode(response)) for response in all_responses]
+            all_completion_ids, all_finish_reasons = generate_in_length_buckets(self.model, self.tokenizer, all_prompt_ids,
+                                                                                max_new_tokens=max_tokens, batch_size=4)
+            all_responses = [self.tokenizer.decode(completion_ids, skip_special_tokens=True)
+                             for completion_ids in all_completion_ids]
 
+        all_prompt_tokens = [len(prompt_ids) for prompt_ids in all_prompt_ids]
+        all_completion_tokens = [len(self.tokenizer.encode(response, add_special_tokens=False)) for response in all_responses]
+        if json_template is not None:
+            # Outlines does not report finish reasons, a generation that used up max_tokens was cut off
+            num_truncated = sum(num_tokens >= max_tokens for num_tokens in all_completion_tokens)
+        else:
+            num_truncated = sum(finish_reason == 'length' for finish_reason in all_finish_reasons)
+
+        total_prompt_tokens = sum(all_prompt_tokens)
         metadata = {
-            "prompt_tokens": sum(all_prompt_tokens),
+            "prompt_tokens": total_prompt_tokens,
             "completion_tokens": sum(all_completion_tokens),
-            "num_request": len(messages_list)
+            "num_request": len(messages_list),
+            "num_truncated": num_truncated,
+            # `generate` keeps no KV cache across prompts, so no prompt prefix is ever reused
+            "prefix_hit_tokens": 0,
+            "prefix_hit_ratio": 0.0,
         }
         return all_responses, metadata
+
+    def release(self):
+        """
+        Frees the model and the GPU memory it holds so other models (e.g. the embedding model) can be loaded
+        in the same process.
+        """
+        logger.info(f"Releasing Transformers offline model {self.model_name}")
+        del self.model
+        self.model = None
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
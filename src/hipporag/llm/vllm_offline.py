@@ -1,8 +1,9 @@
 from typing import Tuple, List
+import gc
 import torch.cuda
 
 from .base import BaseLLM, LLMConfig
-from ..utils.llm_utils import TextChatMessage, PROMPT_JSON_TEMPLATE
+from ..utils.llm_utils import TextChatMessage, PROMPT_JSON_TEMPLATE, order_by_shared_prefix
 from ..utils.logging_utils import get_logger
 
 logger = get_logger(__name__)
@@ -85,17 +86,47 @@ class VLLMOffline:
             guided = GuidedDecodingRequest(guided_json=PROMPT_JSON_TEMPLATE[json_template])
 
         all_prompt_ids = [convert_text_chat_messages_to_input_ids(messages, self.tokenizer) for messages in messages_list]
-        vllm_output = self.client.generate(prompt_token_ids=all_prompt_ids,
+
+        # Schedule prompts sharing a prefix back to back so enable_prefix_caching keeps the few-shot prefix hot
+        order, num_prefix_hit_tokens = order_by_shared_prefix(all_prompt_ids)
+        vllm_output = self.client.generate(prompt_token_ids=[all_prompt_ids[idx] for idx in order],
                                            sampling_params=SamplingParams(max_tokens=max_tokens, temperature=0),
                                            guided_options_request=guided)
+        restored_output = [None] * len(order)
+        for completion, idx in zip(vllm_output, order):
+            restored_output[idx] = completion
+        vllm_output = restored_output
 
         all_responses = [completion.outputs[0].text for completion in vllm_output]
         all_prompt_tokens = [len(completion.prompt_token_ids) for completion in vllm_output]
         all_completion_tokens = [len(completion.outputs[0].token_ids) for completion in vllm_output]
+        num_truncated = sum(completion.outputs[0].finish_reason == 'length' for completion in vllm_output)
 
+        total_prompt_tokens = sum(all_prompt_tokens)
         metadata = {
-            "prompt_tokens": sum(all_prompt_tokens),
+            "prompt_tokens": total_prompt_tokens,
             "completion_tokens": sum(all_completion_tokens),
-            "num_request": len(messages_list)
+            "num_request": len(messages_list),
+            "num_truncated": num_truncated,
+            "prefix_hit_tokens": num_prefix_hit_tokens,
+            "prefix_hit_ratio": num_prefix_hit_tokens / total_prompt_tokens if total_prompt_tokens > 0 else 0.0,
         }
         return all_responses, metadata
+
+    def release(self):
+        """
+        Frees the vLLM engine and the GPU memory it holds so other models (e.g. the embedding model) can be loaded
+        in the same process.
+        """
+        logger.info(f"Releasing VLLM offline model {self.model_name}")
+        try:
+            from vllm.distributed.parallel_state import destroy_model_parallel, destroy_distributed_environment
+            destroy_model_parallel()
+            destroy_distributed_environment()
+        except Exception as e:
+            logger.warning(f"Could not tear down vLLM distributed state: {e}")
+        del self.client
+        self.client = None
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
@@ -0,0 +1,14 @@
+from ..utils.logging_utils import get_logger
+from ..utils.config_utils import BaseConfig
+
+from .text_preprocessor import TextPreprocessor
+
+
+logger = get_logger(__name__)
+
+
+def _get_text_preprocessor_class(config: BaseConfig, save_dir: str = None):
+    if config.text_preprocessor_class_name == "TextPreprocessor":
+        return TextPreprocessor(config, save_dir=save_dir)
+
+    raise ValueError(f"Unknown text preprocessor class name: {config.text_preprocessor_class_name}")
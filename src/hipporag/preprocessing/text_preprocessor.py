@@ -0,0 +1,268 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from tqdm import tqdm
+
+from ..utils.config_utils import BaseConfig
+from ..utils.logging_utils import get_logger
+from ..utils.misc_utils import compute_mdhash_id
+from ..utils.typing import ChunkInfo
+
+logger = get_logger(__name__)
+
+# Per-process preprocessor of chunking workers, so each worker loads its encoder once
+_worker_preprocessor = None
+
+
+def _init_worker(preprocessor: "TextPreprocessor"):
+    global _worker_preprocessor
+    _worker_preprocessor = preprocessor
+
+
+def _chunk_batch_in_worker(docs: List[str]) -> List[List[Tuple[str, int]]]:
+    return _worker_preprocessor._chunk_batch(docs)
+
+
+def _token_windows(num_tokens: int, max_token_size: int, overlap_token_size: int) -> Iterator[Tuple[int, int]]:
+    """
+    Yields [start, end) windows of at most `max_token_size` tokens, neighbouring windows sharing `overlap_token_size` tokens.
+    """
+    step = max_token_size - overlap_token_size
+    start = 0
+    while True:
+        end = min(start + max_token_size, num_tokens)
+        yield start, end
+        if end >= num_tokens:
+            break
+        start += step
+
+
+class TextPreprocessor:
+    """
+    Splits documents into chunks following the `preprocess_*` fields of the global config.
+
+    `by_token` counts tokens with the `preprocess_encoder_name` encoder, a tiktoken model or encoding name
+    or else a Hugging Face tokenizer, and `by_word` counts whitespace separated words. Documents are tokenized
+    in batches of `preprocess_batch_size`, spread over `preprocess_num_workers` processes.
+
+    Chunks are keyed by the same `chunk-` hash ids as the chunk embedding store, and the source document ids
+    (`doc-` hashes of the full documents) of every chunk are persisted under `save_dir` so retrieved chunks
+    can be traced back to the documents they came from.
+    """
+
+    def __init__(self, global_config: BaseConfig, save_dir: Optional[str] = None):
+        self.global_config = global_config
+        self.encoder_name = global_config.preprocess_encoder_name
+        self.chunk_func = global_config.preprocess_chunk_func
+        self.max_token_size = global_config.preprocess_chunk_max_token_size
+        self.overlap_token_size = global_config.preprocess_chunk_overlap_token_size or 0
+        self.batch_size = global_config.preprocess_batch_size
+        self.num_workers = global_config.preprocess_num_workers
+
+        if self.max_token_size is not None:
+            if self.max_token_size <= 0:
+                raise ValueError(f"preprocess_chunk_max_token_size must be positive, got {self.max_token_size}")
+            if self.overlap_token_size >= self.max_token_size:
+                default_overlap = BaseConfig.__dataclass_fields__["preprocess_chunk_overlap_token_size"].default
+                if self.overlap_token_size != default_overlap:
+                    raise ValueError(f"preprocess_chunk_overlap_token_size ({self.overlap_token_size}) must be smaller "
+                                     f"than preprocess_chunk_max_token_size ({self.max_token_size})")
+                # The default overlap is meant for long chunks, small chunks overlap by a quarter instead
+                self.overlap_token_size = self.max_token_size // 4
+                logger.info(f"Using an overlap of {self.overlap_token_size} tokens for chunks of {self.max_token_size} tokens")
+
+        self._encoder = None
+        self._encoder_type = None
+
+        self.chunk_to_doc_ids_path = os.path.join(save_dir, "chunk_to_doc_ids.json") if save_dir is not None else None
+        self.chunk_to_doc_ids: Dict[str, List[str]] = {}
+        if self.chunk_to_doc_ids_path is not None and os.path.exists(self.chunk_to_doc_ids_path):
+            with open(self.chunk_to_doc_ids_path) as f:
+                self.chunk_to_doc_ids = json.load(f)
+
+    def __getstate__(self):
+        # Worker processes rebuild their own encoder, and do not need the chunk to document mapping
+        state = self.__dict__.copy()
+        state['_encoder'], state['_encoder_type'] = None, None
+        state['chunk_to_doc_ids'] = {}
+        return state
+
+    @property
+    def encoder(self):
+        if self._encoder is None:
+            self._encoder_type, self._encoder = self._load_encoder()
+        return self._encoder
+
+    def _load_encoder(self):
+        try:
+            import tiktoken
+            try:
+                return "tiktoken", tiktoken.encoding_for_model(self.encoder_name)
+            except KeyError:
+                return "tiktoken", tiktoken.get_encoding(self.encoder_name)
+        except (ImportError, KeyError, ValueError):
+            from transformers import AutoTokenizer
+            logger.info(f"Loading Hugging Face tokenizer {self.encoder_name} for chunking")
+            return "transformers", AutoTokenizer.from_pretrained(self.encoder_name)
+
+    def chunk_by_token(self, docs: List[str]) -> List[List[Tuple[str, int]]]:
+        """
+        Splits each document into (content, num_tokens) chunks of at most `preprocess_chunk_max_token_size` tokens.
+        """
+        encoder = self.encoder
+        if self._encoder_type == "tiktoken":
+            all_token_ids = encoder.encode_ordinary_batch(docs)
+            all_offsets = None
+        else:
+            encoded = encoder(docs, add_special_tokens=False, return_offsets_mapping=encoder.is_fast)
+            all_token_ids = encoded["input_ids"]
+            all_offsets = encoded.get("offset_mapping")
+
+        docs_chunks = []
+        for doc_idx, (doc, token_ids) in enumerate(zip(docs, all_token_ids)):
+            if self.max_token_size is None:
+                docs_chunks.append([(doc, len(token_ids))])
+                continue
+
+            doc_chunks = []
+            for start, end in _token_windows(len(token_ids), self.max_token_size, self.overlap_token_size):
+                if all_offsets is not None:
+                    # Slice the original text so whitespace and special characters survive chunking untouched
+                    offsets = all_offsets[doc_idx]
+                    content = doc[offsets[start][0]:offsets[end - 1][1]] if end > start else ""
+                else:
+                    content = encoder.decode(token_ids[start:end])
+                doc_chunks.append((content.strip(), end - start))
+            docs_chunks.append(doc_chunks)
+        return docs_chunks
+
+    def chunk_by_word(self, docs: List[str]) -> List[List[Tuple[str, int]]]:
+        """
+        Splits each document into (content, num_words) chunks of at most `preprocess_chunk_max_token_size` words.
+        """
+        docs_chunks = []
+        for doc in docs:
+            words = doc.split()
+            if self.max_token_size is None:
+                docs_chunks.append([(doc, len(words))])
+                continue
+            docs_chunks.append([
+                (" ".join(words[start:end]), end - start)
+                for start, end in _token_windows(len(words), self.max_token_size, self.overlap_token_size)
+            ])
+        return docs_chunks
+
+    def _chunk_batch(self, docs: List[str]) -> List[List[Tuple[str, int]]]:
+        if self.chunk_func == "by_token":
+            return self.chunk_by_token(docs)
+        elif self.chunk_func == "by_word":
+            return self.chunk_by_word(docs)
+        raise ValueError(f"Unknown preprocess_chunk_func: {self.chunk_func}")
+
+    def iter_chunks(self, docs: List[str]) -> Iterator[Tuple[int, List[Tuple[str, int]]]]:
+        """
+        Streams (doc index, chunks) pairs in document order, tokenizing `preprocess_batch_size` documents at a time
+        in up to `preprocess_num_workers` processes.
+        """
+        batches = [docs[i:i + self.batch_size] for i in range(0, len(docs), self.batch_size)]
+
+        if self.num_workers > 1 and len(batches) > 1:
+            with ProcessPoolExecutor(max_workers=self.num_workers, initializer=_init_worker, initargs=(self,)) as executor:
+                batch_results = executor.map(_chunk_batch_in_worker, batches)
+                doc_idx = 0
+                for batch_chunks in batch_results:
+                    for doc_chunks in batch_chunks:
+                        yield doc_idx, doc_chunks
+                        doc_idx += 1
+        else:
+            doc_idx = 0
+            for batch in batches:
+                for doc_chunks in self._chunk_batch(batch):
+                    yield doc_idx, doc_chunks
+                    doc_idx += 1
+
+    def chunk_docs(self, docs: List[str]) -> Dict[str, ChunkInfo]:
+        """
+        Chunks the given documents and records which documents every chunk comes from.
+
+        Parameters:
+            docs : List[str]
+                A list of full documents.
+
+        Returns:
+            Dict[str, ChunkInfo]: Chunk hash ids to chunk info, in document and chunk order. A chunk shared by
+            several documents appears once, with all of them in its `full_doc_ids`.
+        """
+        chunks: Dict[str, ChunkInfo] = {}
+        for doc_idx, doc_chunks in tqdm(self.iter_chunks(docs), total=len(docs), desc="Chunking documents"):
+            doc_id = compute_mdhash_id(docs[doc_idx], prefix="doc-")
+            for chunk_idx, (content, num_tokens) in enumerate(doc_chunks):
+                if not content:
+                    continue
+                chunk_key = compute_mdhash_id(content, prefix="chunk-")
+                if chunk_key not in chunks:
+                    chunks[chunk_key] = ChunkInfo(num_tokens=num_tokens, content=content, chunk_order=[], full_doc_ids=[])
+                chunks[chunk_key]['chunk_order'].append((doc_id, chunk_idx))
+                if doc_id not in chunks[chunk_key]['full_doc_ids']:
+                    chunks[chunk_key]['full_doc_ids'].append(doc_id)
+
+        logger.info(f"Split {len(docs)} documents into {len(chunks)} chunks")
+
+        for chunk_key, chunk in chunks.items():
+            doc_ids = self.chunk_to_doc_ids.setdefault(chunk_key, [])
+            doc_ids.extend(doc_id for doc_id in chunk['full_doc_ids'] if doc_id not in doc_ids)
+        self.save_chunk_to_doc_ids()
+
+        return chunks
+
+    def get_doc_ids(self, chunk_key: str, content: str) -> List[str]:
+        """
+        Returns the ids of the documents a chunk comes from. Chunks indexed without chunking are their own document.
+        """
+        if chunk_key in self.chunk_to_doc_ids:
+            return self.chunk_to_doc_ids[chunk_key]
+        return [compute_mdhash_id(content, prefix="doc-")]
+
+    def orphaned_chunk_keys(self, docs: List[str]) -> List[str]:
+        """
+        Returns the keys of the chunks that only come from the given documents, which are the ones to delete along
+        with them. Chunks also coming from other documents are kept. The mapping itself is left untouched.
+
+        Parameters:
+            docs : List[str]
+                A list of full documents.
+        """
+        doc_ids = {compute_mdhash_id(doc, prefix="doc-") for doc in docs}
+        return [chunk_key for chunk_key, chunk_doc_ids in self.chunk_to_doc_ids.items()
+                if not doc_ids.isdisjoint(chunk_doc_ids) and doc_ids.issuperset(chunk_doc_ids)]
+
+    def delete_docs(self, docs: List[str]):
+        """
+        Removes documents from the sources of their chunks, dropping chunks left without any, and saves the mapping.
+        Meant to be called once the chunks from `orphaned_chunk_keys` were deleted from the stores.
+
+        Parameters:
+            docs : List[str]
+                A list of full documents.
+        """
+        doc_ids = {compute_mdhash_id(doc, prefix="doc-") for doc in docs}
+        for chunk_key, chunk_doc_ids in list(self.chunk_to_doc_ids.items()):
+            if doc_ids.isdisjoint(chunk_doc_ids):
+                continue
+            remaining_doc_ids = [doc_id for doc_id in chunk_doc_ids if doc_id not in doc_ids]
+            if remaining_doc_ids:
+                self.chunk_to_doc_ids[chunk_key] = remaining_doc_ids
+            else:
+                del self.chunk_to_doc_ids[chunk_key]
+        self.save_chunk_to_doc_ids()
+
+    def save_chunk_to_doc_ids(self):
+        if self.chunk_to_doc_ids_path is None:
+            return
+        # Written to a temporary file first, so an interrupted save leaves the previous mapping intact
+        tmp_path = self.chunk_to_doc_ids_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.chunk_to_doc_ids, f)
+        os.replace(tmp_path, self.chunk_to_doc_ids_path)
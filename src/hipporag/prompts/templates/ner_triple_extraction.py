@@ -0,0 +1,38 @@
+from .ner import one_shot_ner_paragraph
+
+ner_triple_system = """Your task is to extract named entities from the given paragraph and construct an RDF (Resource Description Framework) graph from it.
+Respond with a JSON dict that has a list of named entities and a list of triples, with each triple representing a relationship in the RDF graph.
+
+Pay attention to the following requirements:
+- Each triple should contain at least one, but preferably two, of the named entities in the list.
+- Clearly resolve pronouns to their specific names to maintain clarity.
+
+"""
+
+
+one_shot_ner_triple_output = """{"named_entities":
+    ["Radio City", "India", "3 July 2001", "Hindi", "English", "May 2008", "PlanetRadiocity.com"],
+"triples": [
+            ["Radio City", "located in", "India"],
+            ["Radio City", "is", "private FM radio station"],
+            ["Radio City", "started on", "3 July 2001"],
+            ["Radio City", "plays songs in", "Hindi"],
+            ["Radio City", "plays songs in", "English"],
+            ["Radio City", "forayed into", "New Media"],
+            ["Radio City", "launched", "PlanetRadiocity.com"],
+            ["PlanetRadiocity.com", "launched in", "May 2008"],
+            ["PlanetRadiocity.com", "is", "music portal"],
+            ["PlanetRadiocity.com", "offers", "news"],
+            ["PlanetRadiocity.com", "offers", "videos"],
+            ["PlanetRadiocity.com", "offers", "songs"]
+    ]
+}
+"""
+
+
+prompt_template = [
+    {"role": "system", "content": ner_triple_system},
+    {"role": "user", "content": one_shot_ner_paragraph},
+    {"role": "assistant", "content": one_shot_ner_triple_output},
+    {"role": "user", "content": "${passage}"}
+]
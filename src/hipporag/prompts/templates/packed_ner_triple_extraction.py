@@ -0,0 +1,65 @@
+from .ner import one_shot_ner_paragraph
+
+packed_ner_triple_system = """Your task is to extract named entities from each of the given paragraphs and construct an RDF (Resource Description Framework) graph from each of them.
+Every paragraph is preceded by its id. Respond with a JSON dict holding one item per paragraph, each with the paragraph id, its list of named entities and its list of triples, with each triple representing a relationship in the RDF graph.
+
+Pay attention to the following requirements:
+- Treat every paragraph independently: only use entities and facts stated in that paragraph.
+- Each triple should contain at least one, but preferably two, of the named entities in the list of its paragraph.
+- Clearly resolve pronouns to their specific names to maintain clarity.
+
+"""
+
+
+packed_passage_frame = """Paragraph id: {passage_id}
+```
+{passage}
+```
+"""
+
+
+second_shot_paragraph = """Erik Hort
+Erik Hort's birthplace is Montebello, a village that is part of Rockland County."""
+
+
+one_shot_packed_input = "\n".join([
+    packed_passage_frame.format(passage_id="1", passage=one_shot_ner_paragraph),
+    packed_passage_frame.format(passage_id="2", passage=second_shot_paragraph),
+])
+
+
+one_shot_packed_output = """{"passages": [
+    {"id": "1",
+     "named_entities": ["Radio City", "India", "3 July 2001", "Hindi", "English", "May 2008", "PlanetRadiocity.com"],
+     "triples": [
+            ["Radio City", "located in", "India"],
+            ["Radio City", "is", "private FM radio station"],
+            ["Radio City", "started on", "3 July 2001"],
+            ["Radio City", "plays songs in", "Hindi"],
+            ["Radio City", "plays songs in", "English"],
+            ["Radio City", "forayed into", "New Media"],
+            ["Radio City", "launched", "PlanetRadiocity.com"],
+            ["PlanetRadiocity.com", "launched in", "May 2008"],
+            ["PlanetRadiocity.com", "is", "music portal"],
+            ["PlanetRadiocity.com", "offers", "news"],
+            ["PlanetRadiocity.com", "offers", "videos"],
+            ["PlanetRadiocity.com", "offers", "songs"]
+     ]},
+    {"id": "2",
+     "named_entities": ["Erik Hort", "Montebello", "Rockland County"],
+     "triples": [
+            ["Erik Hort", "birthplace", "Montebello"],
+            ["Montebello", "is", "village"],
+            ["Montebello", "part of", "Rockland County"]
+     ]}
+]
+}
+"""
+
+
+prompt_template = [
+    {"role": "system", "content": packed_ner_triple_system},
+    {"role": "user", "content": one_shot_packed_input},
+    {"role": "assistant", "content": one_shot_packed_output},
+    {"role": "user", "content": "${packed_passages}"}
+]
@@ -55,12 +55,40 @@ class BaseConfig:
         default_factory=lambda: { "type": "json_object" },
         metadata={"help": "Specifying the format that the model must output."}
     )
+    llm_structured_output: Optional[Literal["response_format", "guided_json"]] = field(
+        default=None,
+        metadata={"help": "How CacheOpenAI constrains JSON outputs (e.g. OpenIE) to their schema in utils.llm_utils.PROMPT_JSON_TEMPLATE: "
+                          "'response_format' sends an OpenAI json_schema response_format, 'guided_json' sends vLLM's guided_json extra body. "
+                          "None leaves decoding unconstrained."}
+    )
     
     ## LLM specific attributes -> Async hyperparameters
     max_retry_attempts: int = field(
         default=5,
         metadata={"help": "Max number of retry attempts for an asynchronous API calling."}
     )
+
+    ## LLM specific attributes -> Response cache
+    llm_cache_max_entries: Optional[int] = field(
+        default=None,
+        metadata={"help": "Max number of responses kept in the LLM cache, least recently hit ones are evicted first. None means unbounded."}
+    )
+    llm_cache_ttl: Optional[float] = field(
+        default=None,
+        metadata={"help": "Seconds after which a cached LLM response expires. None means cached responses never expire."}
+    )
+    llm_cache_compress_threshold: Optional[int] = field(
+        default=4096,
+        metadata={"help": "LLM responses of at least this many bytes are stored compressed. None disables compression."}
+    )
+    llm_cache_codec: Literal["zlib", "zstd"] = field(
+        default="zlib",
+        metadata={"help": "Codec for compressed LLM cache entries. zstd requires the optional `zstandard` package."}
+    )
+    llm_cache_max_size_mb: Optional[float] = field(
+        default=None,
+        metadata={"help": "Size budget of each LLM cache file in MB, least recently hit responses are evicted first. None means unbounded."}
+    )
     # Storage specific attributes
     force_openie_from_scratch: bool = field(
         default=False,
@@ -96,13 +124,24 @@ class BaseConfig:
     )
     preprocess_chunk_overlap_token_size: int = field(
         default=128,
-        metadata={"help": "Number of overlap tokens between neighbouring chunks."}
+        metadata={"help": "Number of overlap tokens between neighbouring chunks. Left at its default with a `preprocess_chunk_max_token_size` of at most 128, a quarter of the chunk size is used instead."}
     )
     preprocess_chunk_max_token_size: int = field(
         default=None,
         metadata={"help": "Max number of tokens each chunk can contain. If set to None, the whole doc will treated as a single chunk."}
     )
-    preprocess_chunk_func: Literal["by_token", "by_word"] = field(default='by_token')
+    preprocess_chunk_func: Literal["by_token", "by_word"] = field(
+        default='by_token',
+        metadata={"help": "Chunk by tokens of `preprocess_encoder_name` (a tiktoken model or encoding, else a Hugging Face tokenizer) or by whitespace separated words."}
+    )
+    preprocess_batch_size: int = field(
+        default=64,
+        metadata={"help": "Number of documents tokenized together when chunking."}
+    )
+    preprocess_num_workers: int = field(
+        default=1,
+        metadata={"help": "Number of processes used for chunking documents. 1 chunks in the calling process."}
+    )
     
     
     # Information extraction specific attributes
@@ -114,6 +153,48 @@ class BaseConfig:
         default="online",
         metadata={"help": "Mode of the OpenIE model to use."}
     )
+    openie_joint_extraction: bool = field(
+        default=False,
+        metadata={"help": "If set to True, OpenIE extracts named entities and triples with a single combined prompt per chunk instead of a NER call followed by a triple extraction call."}
+    )
+    openie_pack_token_budget: Optional[int] = field(
+        default=None,
+        metadata={"help": "If set, OpenIE packs several passages into one joint NER and triple extraction request, up to this many passage tokens "
+                          "(counted with tiktoken) per request, amortizing the few-shot prefix over short passages. None sends one passage per request."}
+    )
+    openie_dedup_threshold: Optional[float] = field(
+        default=None,
+        metadata={"help": "If set, chunks whose estimated Jaccard similarity of word shingles (MinHash with LSH) to an already extracted chunk "
+                          "reaches this threshold skip OpenIE and reuse that chunk's entities and triples. None disables near-duplicate detection."}
+    )
+    openie_dedup_num_perm: int = field(
+        default=128,
+        metadata={"help": "Number of MinHash permutations used for near-duplicate detection before OpenIE."}
+    )
+    openie_max_workers: Optional[int] = field(
+        default=None,
+        metadata={"help": "Max number of concurrent LLM requests in online OpenIE, shared by NER and triple extraction. None uses ThreadPoolExecutor's default."}
+    )
+    openie_stream_results: bool = field(
+        default=True,
+        metadata={"help": "If set to True, OpenIE results are appended to a JSONL file next to the OpenIE results file as each chunk completes, "
+                          "so an interrupted run resumes from the finished chunks. The file is removed once the full results are saved."}
+    )
+    openie_keep_raw_responses: bool = field(
+        default=True,
+        metadata={"help": "Whether raw LLM responses of OpenIE are kept in memory and streamed results. Set to False to keep only parsed entities and triples, "
+                          "which shrinks but does not bound the memory held by the results of an OpenIE batch."}
+    )
+    openie_metrics_path: Optional[str] = field(
+        default=None,
+        metadata={"help": "Path that per-stage OpenIE metrics (throughput, token rates, latency percentiles, cache hits, truncations, "
+                          "parse failures) are written to after every OpenIE batch. None only logs them."}
+    )
+    openie_metrics_format: Literal["jsonl", "prometheus"] = field(
+        default="jsonl",
+        metadata={"help": "Format of `openie_metrics_path`: 'jsonl' appends one JSON line per OpenIE batch, 'prometheus' overwrites "
+                          "a Prometheus text exposition file, e.g. for the node exporter textfile collector."}
+    )
     skip_graph: bool = field(
         default=False,
         metadata={"help": "Whether to skip graph construction or not. Set it to be true when running vllm offline indexing for the first time."}
@@ -137,10 +218,108 @@ class BaseConfig:
         default=2048,
         metadata={"help": "Max sequence length for the embedding model."}
     )
+    embedding_max_batch_tokens: Optional[int] = field(
+        default=None,
+        metadata={"help": "Token budget (batch size x longest text) of one batch of local embedding models that batch texts by length "
+                          "(NV-Embed-v2, Contriever). None uses embedding_batch_size times the longest text of the call."}
+    )
     embedding_model_dtype: Literal["float16", "float32", "bfloat16", "auto"] = field(
         default="auto",
         metadata={"help": "Data type for local embedding model."}
     )
+    embedding_onnx_quantize: bool = field(
+        default=False,
+        metadata={"help": "Whether 'ONNX/' embedding models run a dynamically int8-quantized export instead of the float32 one."}
+    )
+    embedding_onnx_num_threads: Optional[int] = field(
+        default=None,
+        metadata={"help": "ONNX Runtime intra-op threads of 'ONNX/' embedding models. None lets ONNX Runtime use one per physical core."}
+    )
+    embedding_onnx_pooling: Literal["mean", "cls"] = field(
+        default="mean",
+        metadata={"help": "How 'ONNX/' embedding models pool the last hidden state: 'mean' (Contriever, most sentence-transformers "
+                          "models) or 'cls'."}
+    )
+    embedding_num_workers: int = field(
+        default=1,
+        metadata={"help": "Number of processes local embedding models (Contriever, GritLM, 'Transformers/', 'ONNX/') encode "
+                          "embedding store inserts with on CPU, each with its own model copy. Workers are spawned, so scripts "
+                          "need an `if __name__ == '__main__':` guard. 1 encodes in this process."}
+    )
+    embedding_cores_per_worker: Optional[int] = field(
+        default=None,
+        metadata={"help": "Cores each data-parallel embedding worker is pinned to. None shares the available cores out evenly."}
+    )
+    embedding_shard_size: int = field(
+        default=2048,
+        metadata={"help": "Number of texts handed to a data-parallel embedding worker at a time."}
+    )
+    embedding_max_concurrency: int = field(
+        default=8,
+        metadata={"help": "Max number of concurrent batch requests of remote embedding models (OpenAI, Cohere, VLLM), "
+                          "which also sizes their pooled HTTP connections."}
+    )
+    embedding_max_retries: int = field(
+        default=5,
+        metadata={"help": "Retries, with exponential backoff, of a remote embedding batch request failing with a transient error (timeout, connection error, 429 or 5xx). "
+                          "Batches rejected for their inputs (400, 413, 422) are split right away to isolate failing inputs, other errors are raised."}
+    )
+    embedding_cache: bool = field(
+        default=False,
+        metadata={"help": "Whether to cache embeddings keyed on (model, instruction, text), so texts already encoded are not encoded again."}
+    )
+    embedding_cache_backend: Literal["lru", "shared", "disk"] = field(
+        default="disk",
+        metadata={"help": "Embedding cache backend: 'lru' in process memory, 'shared' in a manager process shared with worker processes, "
+                          "'disk' in a SQLite file under save_dir/embedding_cache that persists across runs."}
+    )
+    embedding_cache_max_entries: Optional[int] = field(
+        default=100000,
+        metadata={"help": "Max number of embeddings kept by the 'lru' and 'shared' embedding cache backends. None means unbounded."}
+    )
+    embedding_cache_dtype: Literal["float16", "float32"] = field(
+        default="float32",
+        metadata={"help": "Precision of embeddings stored in the embedding cache. float16 halves the cache size at a small precision cost."}
+    )
+    embedding_quantization: Optional[Literal["int8", "float16"]] = field(
+        default=None,
+        metadata={"help": "Keep the entity, passage and fact embeddings loaded for retrieval as per-row scaled int8 or as float16 "
+                          "instead of float32, using 4x or 2x less memory. The float32 embeddings of the embedding stores are then kept in "
+                          "memory-mapped .npy files next to their parquet files, read only for re-scoring. None keeps them as float32."}
+    )
+    embedding_quantization_rescore_top_k: Optional[int] = field(
+        default=200,
+        metadata={"help": "Number of best candidates of quantized embedding scoring re-scored exactly with the float32 embeddings "
+                          "of the embedding store. None or 0 disables re-scoring."}
+    )
+    embedding_projection: Optional[Literal["pca", "truncate"]] = field(
+        default=None,
+        metadata={"help": "Dimensionality reduction of the embeddings scored at retrieval time, applied alike to stored and query "
+                          "embeddings. 'pca' fits a projection on the stored vectors, 'truncate' keeps the first dimensions of "
+                          "Matryoshka-trained models. The projection is persisted next to each embedding store. None disables it."}
+    )
+    embedding_projection_dim: int = field(
+        default=512,
+        metadata={"help": "Number of dimensions kept by embedding_projection."}
+    )
+    embedding_projection_max_fit_rows: int = field(
+        default=100000,
+        metadata={"help": "Max number of stored vectors, sampled at random, a 'pca' embedding projection is fitted on."}
+    )
+    query_embedding_cache_max_entries: Optional[int] = field(
+        default=100000,
+        metadata={"help": "Max number of query embeddings kept in memory per query instruction, least recently used ones "
+                          "being evicted first. None means unbounded."}
+    )
+    query_embedding_cache_ttl_seconds: Optional[float] = field(
+        default=None,
+        metadata={"help": "Seconds after which an in-memory query embedding expires. None keeps them until evicted."}
+    )
+    query_embedding_cache_persist: bool = field(
+        default=False,
+        metadata={"help": "Whether to also keep query embeddings in a SQLite file under save_dir/embedding_cache, "
+                          "so they survive restarts of long-running retrieval services."}
+    )
     
     
     
@@ -161,6 +340,23 @@ class BaseConfig:
         default=0.8,
         metadata={"help": "Similarity threshold to include candidate synonymy nodes."}
     )
+    triple_processing_num_workers: int = field(
+        default=1,
+        metadata={"help": "Number of processes used to normalize extracted triples before graph construction. 1 normalizes in the calling process."}
+    )
+    entity_canonicalization: bool = field(
+        default=False,
+        metadata={"help": "If set to True, entities are mapped to canonical entities (alias dictionary, then embedding similarity) before "
+                          "they are embedded and added to the graph, and triples are rewritten accordingly."}
+    )
+    entity_alias_path: Optional[str] = field(
+        default=None,
+        metadata={"help": "Path to a JSON file mapping entity aliases to canonical names, used by entity canonicalization."}
+    )
+    entity_canonicalization_sim_threshold: Optional[float] = field(
+        default=0.95,
+        metadata={"help": "Cosine similarity at which a new entity is merged into an existing one during entity canonicalization. None only applies the alias dictionary."}
+    )
     is_directed_graph: bool = field(
         default=False,
         metadata={"help": "Whether the graph is directed or not."}
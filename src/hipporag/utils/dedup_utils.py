@@ -0,0 +1,215 @@
+import os
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def shingle_hashes(text: str, shingle_size: int = 3) -> np.ndarray:
+    """
+    Hashes the word n-grams of a lowercased, punctuation-stripped text into unique 32-bit values.
+    Texts shorter than `shingle_size` words are hashed as a single shingle.
+    """
+    words = re.sub(r'[^a-z0-9 ]', ' ', text.lower()).split()
+    if len(words) <= shingle_size:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)]
+    return np.unique(np.array([zlib.crc32(s.encode("utf-8")) for s in shingles], dtype=np.uint64))
+
+
+def optimal_lsh_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    Picks the (bands, rows) split of `num_perm` MinHash values whose LSH S-curve midpoint `(1 / bands) ** (1 / rows)`
+    is closest to `threshold`, so pairs around the threshold become candidates with probability about 1/2.
+    """
+    best, best_error = (num_perm, 1), float("inf")
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class MinHashDeduplicator:
+    """
+    Near-duplicate detector over word shingles using MinHash signatures and banded LSH.
+
+    Texts are added one at a time; `add` returns the key of an earlier text whose estimated Jaccard
+    similarity reaches `threshold`, or None, in which case the text becomes a representative itself.
+    Only representatives are indexed, so chains of near-duplicates all resolve to the same first text.
+
+    The signatures of all added texts can be saved and loaded again, so a growing corpus only has new texts
+    hashed; LSH buckets are rebuilt from the saved representative signatures.
+    """
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = 128, shingle_size: int = 3, seed: int = 1):
+        assert 0 < threshold <= 1, f"Near-duplicate threshold must be in (0, 1], got {threshold}"
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+        self.bands, self.rows = optimal_lsh_bands(threshold, num_perm)
+
+        rng = np.random.RandomState(seed)
+        # Universal hash family h(x) = (a * x + b) mod p; a, b, x < 2**32 keeps every step within uint64
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+        # Signatures of representatives, and of every added text in the order they were added
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._added_signatures: Dict[str, np.ndarray] = {}
+        self._buckets: List[Dict[bytes, List[str]]] = [defaultdict(list) for _ in range(self.bands)]
+
+    @property
+    def params(self) -> Tuple[float, int, int, int]:
+        return self.threshold, self.num_perm, self.shingle_size, self.seed
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._added_signatures
+
+    def keys(self) -> List[str]:
+        return list(self._added_signatures)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = shingle_hashes(text, self.shingle_size)
+        permuted = ((hashes[:, None] * self._a[None, :] % _MERSENNE_PRIME + self._b[None, :]) % _MERSENNE_PRIME) & _MAX_HASH
+        return permuted.min(axis=0)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def query(self, text: str, signature: Optional[np.ndarray] = None) -> Optional[str]:
+        """
+        Returns the key of the most similar indexed representative reaching `threshold`, or None.
+        """
+        if signature is None:
+            signature = self.signature(text)
+
+        candidates = set()
+        for band_idx, band_key in enumerate(self._band_keys(signature)):
+            candidates.update(self._buckets[band_idx].get(band_key, ()))
+
+        best_key, best_similarity = None, self.threshold
+        for candidate in candidates:
+            similarity = float(np.mean(self._signatures[candidate] == signature))
+            if similarity >= best_similarity:
+                best_key, best_similarity = candidate, similarity
+        return best_key
+
+    def add(self, key: str, text: Optional[str], signature: Optional[np.ndarray] = None) -> Optional[str]:
+        if signature is None:
+            signature = self.signature(text)
+        self._added_signatures[key] = signature
+        duplicate_of = self.query(text, signature)
+        if duplicate_of is not None:
+            return duplicate_of
+
+        self._index(key, signature)
+        return None
+
+    def _index(self, key: str, signature: np.ndarray):
+        self._signatures[key] = signature
+        for band_idx, band_key in enumerate(self._band_keys(signature)):
+            self._buckets[band_idx][band_key].append(key)
+
+    def remove(self, keys: Iterable[str]):
+        """
+        Forgets the given texts. If a representative is among them, the remaining texts are indexed again from their
+        stored signatures, so texts that only duplicated it can become representatives.
+        """
+        keys = set(keys).intersection(self._added_signatures)
+        if not keys:
+            return
+        for key in keys:
+            del self._added_signatures[key]
+        if keys.isdisjoint(self._signatures):
+            return
+
+        added_signatures = self._added_signatures
+        self._signatures, self._added_signatures = {}, {}
+        self._buckets = [defaultdict(list) for _ in range(self.bands)]
+        for key, signature in added_signatures.items():
+            self.add(key, None, signature)
+
+    def save(self, path: str):
+        """
+        Saves the signatures of all added texts to an .npz file, written to a temporary file first.
+        """
+        keys = list(self._added_signatures)
+        signatures = np.stack([self._added_signatures[key] for key in keys]) if keys else np.empty((0, self.num_perm), dtype=np.uint64)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, params=np.array(self.params, dtype=np.float64), keys=np.array(keys, dtype=str),
+                 signatures=signatures, representative=np.array([key in self._signatures for key in keys], dtype=bool))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, threshold: float = 0.9, num_perm: int = 128, shingle_size: int = 3,
+             seed: int = 1) -> "MinHashDeduplicator":
+        """
+        Loads the texts saved by `save` at `path`, or returns an empty deduplicator if there is no such file or it
+        was saved with other parameters.
+        """
+        deduplicator = cls(threshold=threshold, num_perm=num_perm, shingle_size=shingle_size, seed=seed)
+        if not os.path.exists(path):
+            return deduplicator
+        with np.load(path) as data:
+            if tuple(data["params"].tolist()) != tuple(float(param) for param in deduplicator.params):
+                logger.info(f"Ignoring MinHash signatures in {path}, they were computed with other parameters")
+                return deduplicator
+            for key, signature, representative in zip(data["keys"].tolist(), data["signatures"], data["representative"]):
+                deduplicator._added_signatures[key] = signature
+                if representative:
+                    deduplicator._index(key, signature)
+        logger.info(f"Loaded MinHash signatures of {len(deduplicator._added_signatures)} texts from {path}")
+        return deduplicator
+
+
+def find_near_duplicates(texts: Dict[str, str],
+                         reference_texts: Optional[Dict[str, str]] = None,
+                         threshold: float = 0.9,
+                         num_perm: int = 128,
+                         deduplicator: Optional[MinHashDeduplicator] = None) -> Dict[str, str]:
+    """
+    Maps each key of `texts` that near-duplicates a reference text, or an earlier text in `texts`, to that text's key.
+
+    Args:
+        texts (Dict[str, str]): Keys and contents to deduplicate, in order.
+        reference_texts (Optional[Dict[str, str]]): Keys and contents that are already processed; they are
+            indexed first and never reported as duplicates themselves.
+        threshold (float): Estimated Jaccard similarity of word shingles at which two texts count as near-duplicates.
+        num_perm (int): Number of MinHash permutations.
+        deduplicator (Optional[MinHashDeduplicator]): A deduplicator holding earlier texts, e.g. loaded with
+            `MinHashDeduplicator.load`. Reference texts it already holds are not hashed again, and `texts` are
+            added to it. Its own parameters take precedence over `threshold` and `num_perm`.
+
+    Returns:
+        Dict[str, str]: Duplicate key to representative key, for duplicates only.
+    """
+    if deduplicator is None:
+        deduplicator = MinHashDeduplicator(threshold=threshold, num_perm=num_perm)
+    for key, text in (reference_texts or {}).items():
+        if key not in deduplicator:
+            deduplicator.add(key, text)
+
+    duplicate_of = {}
+    for key, text in texts.items():
+        representative = deduplicator.add(key, text)
+        if representative is not None:
+            duplicate_of[key] = representative
+
+    logger.info(f"Found {len(duplicate_of)} near-duplicates among {len(texts)} texts (threshold {deduplicator.threshold}, "
+                f"{deduplicator.bands} bands x {deduplicator.rows} rows)")
+    return duplicate_of
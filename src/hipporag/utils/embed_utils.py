@@ -1,7 +1,193 @@
-from typing import List
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Optional
+import numpy as np
 import torch
 from tqdm import tqdm
 
+from .logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+
+def token_lengths(texts: List[str], tokenizer=None, max_length: Optional[int] = None) -> List[int]:
+    """
+    Counts the tokens of each text with `tokenizer`, capped at `max_length` as truncation would. Without a
+    tokenizer, lengths are estimated as one token per four characters.
+    """
+    if tokenizer is not None:
+        encoded = tokenizer(texts, truncation=max_length is not None, max_length=max_length)
+        return [len(ids) for ids in encoded["input_ids"]]
+    lengths = [len(text) // 4 + 1 for text in texts]
+    if max_length is not None:
+        lengths = [min(length, max_length) for length in lengths]
+    return lengths
+
+
+def length_bucketed_batches(lengths: List[int], max_batch_tokens: int, max_batch_size: Optional[int] = None) -> List[List[int]]:
+    """
+    Groups input indices into batches of similar length, longest first, so little padding is added.
+
+    A batch grows while its padded size (number of inputs times its longest input) stays within `max_batch_tokens`
+    and it has at most `max_batch_size` inputs, so short inputs are encoded many at a time and long ones few at
+    a time. An input longer than the budget forms a batch of its own.
+    """
+    order = sorted(range(len(lengths)), key=lambda idx: lengths[idx], reverse=True)
+    batches, current_batch, current_max_length = [], [], 0
+    for idx in order:
+        max_length = max(current_max_length, lengths[idx], 1)
+        if current_batch and ((len(current_batch) + 1) * max_length > max_batch_tokens
+                              or (max_batch_size is not None and len(current_batch) >= max_batch_size)):
+            batches.append(current_batch)
+            current_batch, max_length = [], max(lengths[idx], 1)
+        current_batch.append(idx)
+        current_max_length = max_length
+    if current_batch:
+        batches.append(current_batch)
+    return batches
+
+
+def encode_in_length_buckets(texts: List[str], encode_fn: Callable, lengths: List[int], max_batch_tokens: int,
+                             max_batch_size: Optional[int] = None, desc: str = "Batch Encoding") -> np.ndarray:
+    """
+    Encodes `texts` with `encode_fn` in `length_bucketed_batches` and returns the embeddings in the input order.
+
+    Args:
+        texts (List[str]): Texts to encode.
+        encode_fn (Callable): Encodes a list of texts into a 2D numpy array or torch tensor.
+        lengths (List[int]): Token length of each text, e.g. from `token_lengths`.
+        max_batch_tokens (int): Max padded tokens (batch size x longest text) per batch.
+        max_batch_size (Optional[int]): Max number of texts per batch. None means only the token budget applies.
+        desc (str): Progress bar description, shown when there is more than one batch.
+
+    Returns:
+        np.ndarray: One embedding row per text, in the order of `texts`.
+    """
+    batches = length_bucketed_batches(lengths, max_batch_tokens, max_batch_size)
+    results = None
+    pbar = tqdm(total=len(texts), desc=desc, disable=len(batches) <= 1)
+    for batch in batches:
+        embeddings = encode_fn([texts[idx] for idx in batch])
+        if isinstance(embeddings, torch.Tensor):
+            embeddings = embeddings.float().cpu().numpy()
+        embeddings = np.asarray(embeddings)
+        if results is None:
+            results = np.empty((len(texts),) + embeddings.shape[1:], dtype=embeddings.dtype)
+        results[batch] = embeddings
+        pbar.update(len(batch))
+    pbar.close()
+    return results if results is not None else np.empty((0,))
+
+
+# HTTP statuses worth retrying: request timeouts, conflicts, rate limits, and server errors (>= 500)
+TRANSIENT_STATUS_CODES = {408, 409, 425, 429}
+# HTTP statuses caused by the inputs of a request (e.g. a text over the context length), which splitting the batch isolates
+INPUT_ERROR_STATUS_CODES = {400, 413, 422}
+
+
+# HTTP statuses of AWS error codes, for botocore ClientErrors whose response lacks its status
+AWS_ERROR_STATUS_CODES = {
+    "ThrottlingException": 429,
+    "TooManyRequestsException": 429,
+    "ModelTimeoutException": 408,
+    "ModelNotReadyException": 503,
+    "ServiceUnavailableException": 503,
+    "InternalServerException": 500,
+    "ValidationException": 400,
+}
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    # openai and cohere errors carry `status_code`, requests' HTTPError carries its `response`
+    response = getattr(error, "response", None)
+    for source in (error, response):
+        status_code = getattr(source, "status_code", None)
+        if isinstance(status_code, int):
+            return status_code
+    # botocore's ClientError carries the parsed error response as a dict
+    if isinstance(response, dict):
+        error_code = response.get("Error", {}).get("Code")
+        if error_code in AWS_ERROR_STATUS_CODES:
+            return AWS_ERROR_STATUS_CODES[error_code]
+        status_code = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        if isinstance(status_code, int):
+            return status_code
+    return None
+
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    Whether a failed embedding request may succeed when sent again: timeouts, connection errors, rate limits and
+    server errors. Other client errors (bad request, auth, context length) fail the same way every time.
+    """
+    status_code = _status_code(error)
+    if status_code is not None:
+        return status_code in TRANSIENT_STATUS_CODES or status_code >= 500
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    # Client library errors without a status, e.g. openai's APITimeoutError and APIConnectionError or requests' ConnectionError
+    return any(marker in cls.__name__ for cls in type(error).__mro__ for marker in ("Timeout", "Connect"))
+
+
+def _encode_with_retries(batch: List[str], encode_fn: Callable, max_retries: int, backoff: float) -> np.ndarray:
+    """
+    Encodes one batch, retrying transient failures with exponential backoff and jitter. A batch rejected because of
+    its inputs is split in halves right away, which are sent on their own, so one bad input only fails itself and
+    the rest of the batch is kept. Any other error, or a transient one that outlasts the retries, is raised.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return np.asarray(encode_fn(batch))
+        except Exception as e:
+            if is_transient_error(e) and attempt < max_retries:
+                delay = backoff * (2 ** attempt) * (1 + random.random())
+                logger.debug(f"Encoding a batch of {len(batch)} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            if _status_code(e) not in INPUT_ERROR_STATUS_CODES:
+                raise
+            if len(batch) == 1:
+                raise RuntimeError(f"Encoding failed for input: {batch[0][:100]!r}") from e
+            logger.warning(f"Encoding a batch of {len(batch)} was rejected ({e}), splitting it")
+            middle = len(batch) // 2
+            return np.concatenate([_encode_with_retries(batch[:middle], encode_fn, max_retries, backoff),
+                                   _encode_with_retries(batch[middle:], encode_fn, max_retries, backoff)])
+
+
+def encode_batches_concurrently(texts: List[str], encode_fn: Callable, batch_size: int, max_concurrency: int = 8,
+                                max_retries: int = 5, backoff: float = 1.0, desc: str = "Batch Encoding") -> np.ndarray:
+    """
+    Sends `texts` to a remote embedding backend in batches of `batch_size`, with up to `max_concurrency` batches
+    in flight, and reassembles the embeddings in the input order.
+
+    Args:
+        texts (List[str]): Texts to encode.
+        encode_fn (Callable): Encodes a list of texts into a 2D array with one request. Must be thread-safe.
+        batch_size (int): Number of texts per request.
+        max_concurrency (int): Max number of concurrent requests.
+        max_retries (int): Retries of a request failing with a transient error, see `_encode_with_retries`.
+        backoff (float): Base delay in seconds of the exponential backoff between retries.
+        desc (str): Progress bar description, shown when there is more than one batch.
+
+    Returns:
+        np.ndarray: One embedding row per text, in the order of `texts`.
+    """
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    if len(batches) <= 1:
+        return _encode_with_retries(texts, encode_fn, max_retries, backoff)
+
+    results = [None] * len(batches)
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = {executor.submit(_encode_with_retries, batch, encode_fn, max_retries, backoff): idx
+                   for idx, batch in enumerate(batches)}
+        with tqdm(total=len(texts), desc=desc) as pbar:
+            for future in as_completed(futures):
+                idx = futures[future]
+                results[idx] = future.result()
+                pbar.update(len(batches[idx]))
+    return np.concatenate(results)
+
 
 def retrieve_knn(query_ids: List[str], key_ids: List[str], query_vecs, key_vecs, k=2047, query_batch_size=1000,
                  key_batch_size=10000):
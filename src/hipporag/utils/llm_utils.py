@@ -286,6 +286,69 @@ PROMPT_JSON_TEMPLATE = {
         },
         "required": ["triples"]
     },
+    "ner_triples": {
+        "type": "object",
+        "properties": {
+            "named_entities": {
+                "type": "array",
+                "items": {
+                    "type": "string"
+                },
+                "minItems": 0
+            },
+            "triples": {
+                "type": "array",
+                "items": {
+                    "type": "array",
+                    "items": {
+                        "type": "string"
+                    },
+                    "maxItems": 3,
+                    "minItems": 3,
+                },
+                "minItems": 0
+            }
+        },
+        "required": ["named_entities", "triples"]
+    },
+    "packed_ner_triples": {
+        "type": "object",
+        "properties": {
+            "passages": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "id": {
+                            "type": "string"
+                        },
+                        "named_entities": {
+                            "type": "array",
+                            "items": {
+                                "type": "string"
+                            },
+                            "minItems": 0
+                        },
+                        "triples": {
+                            "type": "array",
+                            "items": {
+                                "type": "array",
+                                "items": {
+                                    "type": "string"
+                                },
+                                "maxItems": 3,
+                                "minItems": 3,
+                            },
+                            "minItems": 0
+                        }
+                    },
+                    "required": ["id", "named_entities", "triples"]
+                },
+                "minItems": 0
+            }
+        },
+        "required": ["passages"]
+    },
     "fact": {
         "type": "object",
         "properties": {
@@ -326,6 +389,38 @@ PROMPT_JSON_TEMPLATE = {
 }
 
 
+def order_by_shared_prefix(all_prompt_ids: List[List[int]]) -> Tuple[List[int], int]:
+    """
+    Orders tokenized prompts so that prompts sharing a prefix are adjacent, which keeps the shared prefix
+    hot in a prefix (KV) cache when the requests are scheduled in this order.
+
+    Prompts rendered from the same template share its few-shot prefix token-for-token, so a lexicographic
+    sort over token ids groups them by template and, within a template, by their longest common prefix.
+
+    Args:
+        all_prompt_ids (List[List[int]]): The token ids of every prompt in the batch.
+
+    Returns:
+        Tuple[List[int], int]:
+            - The permutation of prompt indices to schedule them in.
+            - The number of prompt tokens that can be served from the prefix cache under this order, i.e.
+              the sum over consecutive prompts of their common prefix length.
+    """
+    order = sorted(range(len(all_prompt_ids)), key=lambda idx: all_prompt_ids[idx])
+
+    num_prefix_hit_tokens = 0
+    for prev_idx, idx in zip(order, order[1:]):
+        prev_ids, ids = all_prompt_ids[prev_idx], all_prompt_ids[idx]
+        shared = 0
+        for a, b in zip(prev_ids, ids):
+            if a != b:
+                break
+            shared += 1
+        num_prefix_hit_tokens += shared
+
+    return order, num_prefix_hit_tokens
+
+
 def num_tokens_by_tiktoken(text: str):
     import tiktoken
     enc = tiktoken.encoding_for_model("gpt-3.5-turbo")
@@ -357,6 +452,48 @@ class TriplesModel(pydantic.BaseModel):
     """
     triples: List[Tuple[str, str, str]]
 
+class NerTriplesModel(pydantic.BaseModel):
+    """
+    For joint NER and triples extraction, the structure is:
+    schema:
+    {
+        "type": "object",
+        "properties": {
+            "named_entities": { "type": "array", "items": { "type": "string" } },
+            "triples": { "type": "array", "items": { "type": "array", "items": { "type": "string" }, "maxItems": 3, "minItems": 3 } }
+        },
+        "required": ["named_entities", "triples"]
+    }
+    """
+    named_entities: List[str]
+    triples: List[Tuple[str, str, str]]
+
+class PackedPassageModel(pydantic.BaseModel):
+    """
+    One passage of a packed NER and triples extraction response.
+    """
+    id: str
+    named_entities: List[str]
+    triples: List[Tuple[str, str, str]]
+
+class PackedNerTriplesModel(pydantic.BaseModel):
+    """
+    For NER and triples extraction over several packed passages, the structure is:
+    schema:
+    {
+        "type": "object",
+        "properties": {
+            "passages": { "type": "array", "items": { "type": "object", "properties": {
+                "id": { "type": "string" },
+                "named_entities": { "type": "array", "items": { "type": "string" } },
+                "triples": { "type": "array", "items": { "type": "array", "items": { "type": "string" }, "maxItems": 3, "minItems": 3 } }
+            }, "required": ["id", "named_entities", "triples"] } }
+        },
+        "required": ["passages"]
+    }
+    """
+    passages: List[PackedPassageModel]
+
 class FactModel(pydantic.BaseModel):
     """
     For fact extraction, the structure is:
@@ -410,6 +547,8 @@ class QaCotModel(pydantic.BaseModel):
 MODEL_TEMPLATES: Dict[str, Type[pydantic.BaseModel]] = {
     "ner": NerModel,
     "triples": TriplesModel,
+    "ner_triples": NerTriplesModel,
+    "packed_ner_triples": PackedNerTriplesModel,
     "fact": FactModel,
     "json": ArbitraryJsonModel,
     "qa_cot": QaCotModel,
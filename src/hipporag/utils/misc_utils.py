@@ -1,6 +1,9 @@
 from argparse import ArgumentTypeError
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from hashlib import md5
+from itertools import islice
+import sys
 from typing import Dict, Any, List, Tuple, Literal, Union, Optional
 import numpy as np
 import re
@@ -39,6 +42,7 @@ class QuerySolution:
     answer: str = None
     gold_answers: List[str] = None
     gold_docs: Optional[List[str]] = None
+    source_doc_ids: Optional[List[List[str]]] = None
 
 
     def to_dict(self):
@@ -49,6 +53,7 @@ class QuerySolution:
             "docs": self.docs[:5],
             "doc_scores": [round(v, 4) for v in self.doc_scores.tolist()[:5]]  if self.doc_scores is not None else None,
             "gold_docs": self.gold_docs,
+            "source_doc_ids": self.source_doc_ids[:5] if self.source_doc_ids is not None else None,
         }
 
 def text_processing(text):
@@ -58,6 +63,96 @@ def text_processing(text):
         text = str(text)
     return re.sub('[^A-Za-z0-9 ]', ' ', text.lower()).strip()
 
+_NON_ALNUM_PATTERN = re.compile('[^a-z0-9 \x00]')
+_BUFFER_SEPARATOR = '\x00'
+
+
+def batch_text_processing(texts: List[str]) -> List[str]:
+    """
+    Applies `text_processing` to a flat list of strings with a single `lower` and a single compiled regex pass
+    over one separator-joined buffer instead of one regex call per string.
+    """
+    if len(texts) == 0:
+        return []
+    texts = [t if isinstance(t, str) else str(t) for t in texts]
+    buffer = _BUFFER_SEPARATOR.join(texts)
+    if buffer.count(_BUFFER_SEPARATOR) != len(texts) - 1:
+        # Some strings contain the separator, which text_processing turns into a space anyway
+        buffer = _BUFFER_SEPARATOR.join(t.replace(_BUFFER_SEPARATOR, ' ') for t in texts)
+    parts = _NON_ALNUM_PATTERN.sub(' ', buffer.lower()).split(_BUFFER_SEPARATOR)
+    return [part.strip() for part in parts]
+
+
+def _flatten_chunk_triples(chunk_triples: List[List[List[str]]]) -> List[str]:
+    return [element for triples in chunk_triples for triple in triples for element in triple]
+
+
+def _batch_text_processing_shard(chunk_triples: List[List[List[str]]]) -> List[str]:
+    return batch_text_processing(_flatten_chunk_triples(chunk_triples))
+
+
+def normalize_chunk_triples(chunk_triples: List[List[List[str]]], num_workers: int = 1, shard_size: int = 100000) -> List[List[List[str]]]:
+    """
+    Applies `text_processing` to every element of every triple of every chunk, keeping the nesting.
+
+    Chunks are normalized in shards of about `shard_size` triples, spread over `num_workers` processes when
+    there is more than one shard, and the resulting strings are interned so entities repeated across triples
+    and chunks share one object.
+    """
+    if num_workers > 1:
+        shards, shard, shard_num_triples = [], [], 0
+        for triples in chunk_triples:
+            shard.append(triples)
+            shard_num_triples += len(triples)
+            if shard_num_triples >= shard_size:
+                shards.append(shard)
+                shard, shard_num_triples = [], 0
+        if shard:
+            shards.append(shard)
+    else:
+        shards = [chunk_triples]
+
+    if len(shards) > 1:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            flat = [element for normalized_shard in executor.map(_batch_text_processing_shard, shards) for element in normalized_shard]
+    else:
+        flat = _batch_text_processing_shard(chunk_triples)
+
+    # Rebuild the nesting from one iterator over the interned elements, triples of three taken three at a time
+    elements = iter(list(map(sys.intern, flat)))
+    normalized = []
+    for triples in chunk_triples:
+        if all(len(triple) == 3 for triple in triples):
+            normalized.append([list(triple) for triple in zip(*[islice(elements, 3 * len(triples))] * 3)])
+        else:
+            normalized.append([list(islice(elements, len(triple))) for triple in triples])
+    return normalized
+
+
+def build_triple_tables(chunk_triples: List[List[List[str]]]) -> Tuple[List[str], List[List[str]], List[Tuple]]:
+    """
+    Builds the entity and fact tables of normalized chunk triples in one pass, returning what
+    `extract_entity_nodes` and `flatten_facts` return for the same input.
+
+    Returns:
+        Tuple[List[str], List[List[str]], List[Tuple]]: Sorted unique entities, the unique entities of each chunk,
+        and the unique facts as tuples.
+    """
+    all_entities, all_facts = set(), set()
+    chunk_triple_entities = []
+    for triples in chunk_triples:
+        triple_entities = set()
+        for t in triples:
+            if len(t) == 3:
+                triple_entities.add(t[0])
+                triple_entities.add(t[2])
+            else:
+                logger.warning(f"During graph construction, invalid triple is found: {t}")
+            all_facts.add(tuple(t))
+        all_entities.update(triple_entities)
+        chunk_triple_entities.append(list(triple_entities))
+    return sorted(all_entities), chunk_triple_entities, list(all_facts)
+
 def reformat_openie_results(corpus_openie_results) -> (Dict[str, NerRawOutput], Dict[str, TripleRawOutput]):
 
     ner_output_dict = {
@@ -65,7 +160,7 @@ def reformat_openie_results(corpus_openie_results) -> (Dict[str, NerRawOutput],
             chunk_id=chunk_item['idx'],
             response=None,
             metadata={},
-            unique_entities=list(np.unique(chunk_item['extracted_entities']))
+            unique_entities=sorted(set(str(e) for e in chunk_item['extracted_entities']))
         )
         for chunk_item in corpus_openie_results
     }
@@ -91,7 +186,7 @@ def extract_entity_nodes(chunk_triples: List[List[Triple]]) -> (List[str], List[
             else:
                 logger.warning(f"During graph construction, invalid triple is found: {t}")
         chunk_triple_entities.append(list(triple_entities))
-    graph_nodes = list(np.unique([ent for ents in chunk_triple_entities for ent in ents]))
+    graph_nodes = sorted(set(ent for ents in chunk_triple_entities for ent in ents))
     return graph_nodes, chunk_triple_entities
 
 def flatten_facts(chunk_triples: List[Triple]) -> List[Triple]:
@@ -0,0 +1,89 @@
+import hashlib
+import os
+from typing import Literal, Optional
+
+import numpy as np
+
+from .logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+
+def _normalize_rows(vecs: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vecs, axis=-1, keepdims=True)
+    return vecs / np.maximum(norms, 1e-12)
+
+
+class EmbeddingProjector:
+    """
+    Reduces embeddings to `dim` dimensions before scoring, rows being re-normalized so dot products stay cosine similarities.
+
+    `truncate` keeps the first `dim` dimensions, which is how Matryoshka-trained models are meant to be shortened.
+    `pca` projects onto the `dim` leading principal directions of the stored vectors. The second moment matrix is
+    decomposed without centering, so the projection preserves dot products (rather than variance around the mean)
+    as well as `dim` dimensions can.
+    """
+
+    def __init__(self, kind: Literal["pca", "truncate"], dim: int, components: Optional[np.ndarray] = None,
+                 num_fit_rows: int = 0):
+        assert kind in ("pca", "truncate"), f"Unknown embedding projection: {kind}"
+        assert kind == "truncate" or components is not None, "A pca projector needs its fitted components"
+        self.kind = kind
+        self.dim = dim
+        self.components = components
+        self.num_fit_rows = num_fit_rows
+
+    @classmethod
+    def fit(cls, kind: Literal["pca", "truncate"], dim: int, embeddings: np.ndarray, block_size: int = 4096) -> "EmbeddingProjector":
+        """
+        Fits a projector on a (n, input dim) matrix of stored embeddings, accumulating its second moment block by block.
+        """
+        if kind == "truncate":
+            return cls(kind, dim, num_fit_rows=len(embeddings))
+
+        input_dim = embeddings.shape[1]
+        dim = min(dim, input_dim)
+        second_moment = np.zeros((input_dim, input_dim), dtype=np.float64)
+        for start in range(0, len(embeddings), block_size):
+            block = np.asarray(embeddings[start:start + block_size], dtype=np.float64)
+            second_moment += block.T @ block
+        eigenvalues, eigenvectors = np.linalg.eigh(second_moment)
+        # eigh sorts eigenvalues in ascending order
+        components = eigenvectors[:, ::-1][:, :dim].astype(np.float32)
+        explained = eigenvalues[::-1][:dim].sum() / max(eigenvalues.sum(), 1e-12)
+        logger.info(f"Fitted a {input_dim} -> {dim} PCA embedding projection on {len(embeddings)} vectors, "
+                    f"keeping {explained:.2%} of their energy")
+        return cls(kind, dim, components.T, num_fit_rows=len(embeddings))
+
+    @property
+    def fingerprint(self) -> str:
+        """Identifies the projection, so anything computed with it (e.g. cached query embeddings) can be invalidated on a refit."""
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(f"{self.kind}|{self.dim}|{self.num_fit_rows}".encode("utf-8"))
+        if self.components is not None:
+            digest.update(np.ascontiguousarray(self.components).tobytes())
+        return digest.hexdigest()
+
+    def transform(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        Projects a (dim,) vector or (n, dim) matrix, returning float32 rows of unit norm.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if self.kind == "truncate":
+            projected = embeddings[..., :self.dim]
+        else:
+            projected = embeddings @ self.components.T
+        return _normalize_rows(projected).astype(np.float32)
+
+    def save(self, path: str):
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, kind=self.kind, dim=self.dim, num_fit_rows=self.num_fit_rows,
+                 components=self.components if self.components is not None else np.zeros((0, 0), dtype=np.float32))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "EmbeddingProjector":
+        with np.load(path) as data:
+            kind = str(data["kind"])
+            components = data["components"] if kind == "pca" else None
+            return cls(kind, int(data["dim"]), components, num_fit_rows=int(data["num_fit_rows"]))
@@ -0,0 +1,123 @@
+from typing import Callable, List, Literal, Optional, Union
+
+import numpy as np
+
+from .logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+# Rows upcast to float32 at a time while scoring, sized so a block stays around 32 MB
+BLOCK_FLOATS = 1 << 23
+
+
+def quantize_rows(embeddings: np.ndarray, dtype: Literal["int8", "float16"]):
+    """
+    Quantizes a (n, dim) float matrix row by row.
+
+    Returns:
+        Tuple[np.ndarray, Optional[np.ndarray]]: The quantized rows, and for `int8` the float32 scale of every row
+        (its largest absolute value over 127), so `values * scales[:, None]` approximates the original rows.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if dtype == "float16":
+        return embeddings.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(embeddings).max(axis=1) / 127.0 if len(embeddings) > 0 else np.zeros(0, dtype=np.float32)
+        scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+        values = np.clip(np.rint(embeddings / scales[:, None]), -127, 127).astype(np.int8)
+        return values, scales
+    raise ValueError(f"Unknown embedding quantization: {dtype}")
+
+
+class QuantizedEmbeddings:
+    """
+    A read-only embedding matrix kept as per-row scaled int8 or as float16, a quarter or a half of float32.
+
+    Scores against a query are computed a block of rows at a time, each block upcast to float32, so only the
+    quantized matrix has to fit in memory. If an `exact_fn` returning the float32 rows of given indices is set,
+    the `rescore_top_k` best candidates of `dot` are re-scored exactly, which restores their exact ranking.
+    """
+
+    def __init__(self, values: np.ndarray, scales: Optional[np.ndarray] = None,
+                 exact_fn: Optional[Callable[[List[int]], np.ndarray]] = None):
+        self.values = values
+        self.scales = scales
+        self.exact_fn = exact_fn
+
+    @classmethod
+    def from_store(cls, embedding_store, hash_ids: List[str], dtype: Literal["int8", "float16"]) -> "QuantizedEmbeddings":
+        """
+        Quantizes the retrieval embeddings of `hash_ids` in an `EmbeddingStore` block by block, without a full float32
+        copy, and re-scores top candidates with the float32 retrieval embeddings of the store. Memory only shrinks if
+        the store keeps those in a memory map (its `memory_map` option), so rescoring pages in just the rows it reads.
+        """
+        num_rows = len(hash_ids)
+        dim = len(embedding_store.get_retrieval_embeddings(hash_ids[:1])[0]) if num_rows > 0 else 0
+        block_size = max(1, BLOCK_FLOATS // max(dim, 1))
+        values = np.empty((num_rows, dim), dtype=np.int8 if dtype == "int8" else np.float16)
+        scales = np.empty(num_rows, dtype=np.float32) if dtype == "int8" else None
+        for start in range(0, num_rows, block_size):
+            block_values, block_scales = quantize_rows(embedding_store.get_retrieval_embeddings(hash_ids[start:start + block_size]), dtype)
+            values[start:start + len(block_values)] = block_values
+            if scales is not None:
+                scales[start:start + len(block_values)] = block_scales
+
+        def exact_fn(idxs: List[int]) -> np.ndarray:
+            return embedding_store.get_retrieval_embeddings([hash_ids[idx] for idx in idxs])
+
+        quantized = cls(values, scales, exact_fn)
+        logger.info(f"Quantized {num_rows} {embedding_store.namespace} embeddings to {dtype}: "
+                    f"{quantized.nbytes / 2 ** 20:.1f} MB instead of {num_rows * dim * 4 / 2 ** 20:.1f} MB")
+        return quantized
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def dequantize(self, idxs: Optional[List[int]] = None) -> np.ndarray:
+        values = self.values if idxs is None else self.values[idxs]
+        embeddings = values.astype(np.float32)
+        if self.scales is not None:
+            embeddings *= (self.scales if idxs is None else self.scales[idxs])[:, None]
+        return embeddings
+
+    def dot(self, query_embedding: np.ndarray, rescore_top_k: Optional[int] = None) -> np.ndarray:
+        """
+        Approximates `np.dot(embeddings, query_embedding)` for a (dim,) query or a (dim, num_queries) query matrix,
+        re-scoring the `rescore_top_k` best rows of every query exactly when possible.
+        """
+        query_embedding = np.asarray(query_embedding, dtype=np.float32)
+        scores = np.empty((len(self.values),) + query_embedding.shape[1:], dtype=np.float32)
+        block_size = max(1, BLOCK_FLOATS // max(self.values.shape[1] if self.values.ndim == 2 else 1, 1))
+        for start in range(0, len(self.values), block_size):
+            block_scores = self.values[start:start + block_size].astype(np.float32) @ query_embedding
+            if self.scales is not None:
+                block_scores *= self.scales[start:start + block_size].reshape((-1,) + (1,) * (block_scores.ndim - 1))
+            scores[start:start + block_size] = block_scores
+
+        if rescore_top_k and self.exact_fn is not None and len(scores) > 0:
+            rescore_top_k = min(rescore_top_k, len(scores))
+            query_scores = scores if scores.ndim == 2 else scores[:, None]
+            query_matrix = query_embedding if query_embedding.ndim == 2 else query_embedding[:, None]
+            for query_idx in range(query_scores.shape[1]):
+                top_idxs = np.argpartition(-query_scores[:, query_idx], rescore_top_k - 1)[:rescore_top_k]
+                exact_embeddings = np.asarray(self.exact_fn(top_idxs.tolist()), dtype=np.float32)
+                query_scores[top_idxs, query_idx] = exact_embeddings @ query_matrix[:, query_idx]
+        return scores
+
+
+def embedding_scores(embeddings: Union[np.ndarray, QuantizedEmbeddings], query_embedding: np.ndarray,
+                     rescore_top_k: Optional[int] = None) -> np.ndarray:
+    """
+    Dot product scores of every embedding row against a query, for float and quantized embedding matrices alike.
+    """
+    if isinstance(embeddings, QuantizedEmbeddings):
+        return embeddings.dot(query_embedding, rescore_top_k=rescore_top_k)
+    return np.dot(embeddings, query_embedding)
@@ -1,3 +1,10 @@
 from typing import Dict, Any, List, TypedDict, Tuple
 
-Triple = Tuple[str, str, str]
\ No newline at end of file
+Triple = Tuple[str, str, str]
+
+
+class ChunkInfo(TypedDict):
+    num_tokens: int
+    content: str
+    chunk_order: List[Tuple]
+    full_doc_ids: List[str]